@@ -1,7 +1,11 @@
 """Server entry point. Also responsible for config."""
 
 import logging
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 import boto3
 from dotenv import load_dotenv
@@ -9,21 +13,148 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from openai import AsyncOpenAI, OpenAI
 
-from app.modules import AgentHandler, AgentService, SessionService
-from app.utils import AGENT_INSTRUCTIONS, AGENT_MODEL, AGENT_TOOLS
+from app.modules import (
+    AdmissionController,
+    AgentHandler,
+    AgentService,
+    ChatLogWriter,
+    ContextWindowService,
+    FinancialConnectionsService,
+    Hedger,
+    HistoryStore,
+    LookupCache,
+    MetricsHandler,
+    ModelRouter,
+    OpenAIPool,
+    ResponseCache,
+    SessionService,
+    SessionWorker,
+    SingleFlight,
+    ToolSelector,
+    TurnLimits,
+)
+from app.utils import AGENT_INSTRUCTIONS, AGENT_MODEL, AGENT_TOOLS, TRACER, SSECoalescing
 
 load_dotenv()
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
+# Uvicorn only sets up its own loggers, so without this the app's INFO logs, including trace spans
+# and model routing decisions, would be dropped. It goes on the app's loggers rather than the root,
+# so libraries such as httpx keep logging only warnings.
+app_logger = logging.getLogger("app")
+if not app_logger.hasHandlers():
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    app_logger.addHandler(log_handler)
+
+# Tracing: spans are logged at INFO and per-chunk events at DEBUG, for a sample of requests
+TRACE_LEVEL = os.getenv("TRACE_LEVEL", "INFO").upper()
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACER.configure(level=TRACE_LEVEL, sample_rate=TRACE_SAMPLE_RATE)
 
 # Keys
 DYNAMODB_ENDPOINT = os.getenv("DYNAMODB_ENDPOINT")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Comma separated keys, with optional organizations in the same order, that agent calls are spread across.
+# Without either variable the key is None, so the OpenAI client reports the missing key as before.
+OPENAI_API_KEYS: List[Optional[str]] = [key for key in os.getenv("OPENAI_API_KEYS", "").split(",") if key] or [
+    OPENAI_API_KEY
+]
+OPENAI_ORGANIZATIONS = os.getenv("OPENAI_ORGANIZATIONS", "").split(",")
+API_URL = os.getenv("API_URL")
+
+# Persistence
+CHAT_LOG_DURABLE_WRITES = os.getenv("CHAT_LOG_DURABLE_WRITES", "false").lower() == "true"
+CHAT_LOG_FLUSH_INTERVAL = float(os.getenv("CHAT_LOG_FLUSH_INTERVAL", "0.05"))
+CHAT_LOGS_SESSION_INDEX = os.getenv("CHAT_LOGS_SESSION_INDEX", "session_id-timestamp-index")
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "1000"))
+
+# Agent
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "15"))
+SIMULATION_WORKERS = int(os.getenv("SIMULATION_WORKERS", "2"))
+SIMULATION_CPU_LIMIT = float(os.getenv("SIMULATION_CPU_LIMIT", "2"))
+CONTEXT_MAX_INPUT_TOKENS = int(os.getenv("CONTEXT_MAX_INPUT_TOKENS", "12000"))
+# Chain tool-call follow-ups with previous_response_id instead of resending the prompt
+RESPONSE_CHAINING = os.getenv("RESPONSE_CHAINING", "false").lower() == "true"
+# Once a turn runs out of any of these, the model is made to answer without more tools
+AGENT_TURN_DEADLINE = float(os.getenv("AGENT_TURN_DEADLINE", "60"))
+AGENT_MAX_HOPS = int(os.getenv("AGENT_MAX_HOPS", "6"))
+AGENT_MAX_TOOL_CALLS = int(os.getenv("AGENT_MAX_TOOL_CALLS", "16"))
+AGENT_TURN_TOKEN_BUDGET = int(os.getenv("AGENT_TURN_TOKEN_BUDGET", "60000"))
+# The forced final answer gets at least this long, even once the deadline has passed
+AGENT_FINAL_ANSWER_TIMEOUT = float(os.getenv("AGENT_FINAL_ANSWER_TIMEOUT", "15"))
+# Stream frames are batched until this much text or this many seconds have built up; 0 bytes sends every delta
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "512"))
+SSE_COALESCE_WINDOW = float(os.getenv("SSE_COALESCE_WINDOW", "0.05"))
+# Answers to tool-free turns with short histories are reused; the DynamoDB tier is off unless a table is named
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TABLE = os.getenv("RESPONSE_CACHE_TABLE", "")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_HISTORY_WINDOW = int(os.getenv("RESPONSE_CACHE_HISTORY_WINDOW", "4"))
+# Duplicate submissions share one generation; finished streams are replayed to duplicates for a short window
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+SINGLE_FLIGHT_REPLAY_WINDOW = float(os.getenv("SINGLE_FLIGHT_REPLAY_WINDOW", "10"))
+# How long a generation outlives its last disconnected client, waiting for a retry to reattach
+SINGLE_FLIGHT_ABANDON_GRACE = float(os.getenv("SINGLE_FLIGHT_ABANDON_GRACE", "2"))
+# Concurrent turns are capped, adapting between the min and max to upstream 429s and first-token latency
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+ADMISSION_MIN_CONCURRENCY = int(os.getenv("ADMISSION_MIN_CONCURRENCY", "4"))
+ADMISSION_PER_USER_LIMIT = int(os.getenv("ADMISSION_PER_USER_LIMIT", "4"))
+# Requests beyond the cap wait in a bounded queue; when it's full or the wait runs out they get a 429
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+ADMISSION_LATENCY_TARGET = float(os.getenv("ADMISSION_LATENCY_TARGET", "5"))
+# A first hop with no event after the recent p95 (at least HEDGE_MIN_DELAY) is raced against a second stream
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "false").lower() == "true"
+# Hedges earned per first hop, which caps the extra upstream calls at that share
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.25"))
+# Each turn's model is picked from a light, standard or heavy tier by local rules; off sends every turn to AGENT_MODEL
+MODEL_ROUTER_ENABLED = os.getenv("MODEL_ROUTER_ENABLED", "false").lower() == "true"
+MODEL_ROUTER_LIGHT_MODEL = os.getenv("MODEL_ROUTER_LIGHT_MODEL", "gpt-4.1-nano")
+MODEL_ROUTER_STANDARD_MODEL = os.getenv("MODEL_ROUTER_STANDARD_MODEL", AGENT_MODEL)
+MODEL_ROUTER_HEAVY_MODEL = os.getenv("MODEL_ROUTER_HEAVY_MODEL", AGENT_MODEL)
+# Each model hop is only sent the tools its turn can use, instead of every tool definition
+TOOL_SELECTION_ENABLED = os.getenv("TOOL_SELECTION_ENABLED", "false").lower() == "true"
+
+# Financial Connections
+FC_MAX_CONNECTIONS = int(os.getenv("FC_MAX_CONNECTIONS", "100"))
+FC_MAX_PER_HOST = int(os.getenv("FC_MAX_PER_HOST", "20"))
+FC_MAX_FAN_OUT = int(os.getenv("FC_MAX_FAN_OUT", "10"))
+FC_USE_BATCH_ENDPOINTS = os.getenv("FC_USE_BATCH_ENDPOINTS", "false").lower() == "true"
+# Transactions are immutable once posted, balances are not
+FC_ACCOUNT_TTL = float(os.getenv("FC_ACCOUNT_TTL", "60"))
+FC_ACCOUNT_STALE_TTL = float(os.getenv("FC_ACCOUNT_STALE_TTL", "600"))
+FC_TRANSACTION_TTL = float(os.getenv("FC_TRANSACTION_TTL", "86400"))
+FC_CACHE_MAX_BYTES = int(os.getenv("FC_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# OpenAI pool: budgets per key until the first response's rate-limit headers replace them
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "200000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+# Longest a call waits for a key with headroom before it is sent anyway
+OPENAI_MAX_WAIT = float(os.getenv("OPENAI_MAX_WAIT", "10"))
 
 # Clients
-openai = OpenAI(api_key=OPENAI_API_KEY)
-async_openai = AsyncOpenAI(api_key=OPENAI_API_KEY)
+organizations = [organization or None for organization in OPENAI_ORGANIZATIONS] + [None] * len(OPENAI_API_KEYS)
+# Session titles are occasional background calls, so they stay on the first key
+openai = OpenAI(api_key=OPENAI_API_KEYS[0], organization=organizations[0])
+openai_pool = OpenAIPool(
+    clients=[
+        AsyncOpenAI(api_key=key, organization=organization, max_retries=0)
+        for key, organization in zip(OPENAI_API_KEYS, organizations)
+    ],
+    requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+    max_retries=OPENAI_MAX_RETRIES,
+    max_wait=OPENAI_MAX_WAIT,
+)
+
+# Simulations are CPU bound, so they run in their own processes rather than on the event loop
+process_pool = ProcessPoolExecutor(max_workers=SIMULATION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
 
 
 # Database
@@ -42,25 +173,130 @@ else:
 CHAT_LOGS_TABLE_NAME = "chat_logs"
 SESSION_INFO_TABLE_NAME = "session_info"
 
-chat_logs_db = dynamodb.Table(CHAT_LOGS_TABLE_NAME)
+chat_log_writer = ChatLogWriter(
+    dynamodb=dynamodb,
+    table_name=CHAT_LOGS_TABLE_NAME,
+    durable=CHAT_LOG_DURABLE_WRITES,
+    flush_interval=CHAT_LOG_FLUSH_INTERVAL,
+)
+history_store = HistoryStore(
+    table=dynamodb.Table(CHAT_LOGS_TABLE_NAME),
+    index_name=CHAT_LOGS_SESSION_INDEX,
+    max_sessions=HISTORY_CACHE_SESSIONS,
+)
 session_info_db = dynamodb.Table(SESSION_INFO_TABLE_NAME)
 
 # Services
+lookup_cache = LookupCache(
+    ttls={"accounts": FC_ACCOUNT_TTL, "transactions": FC_TRANSACTION_TTL},
+    stale_ttls={"accounts": FC_ACCOUNT_STALE_TTL, "transactions": 0},
+    max_bytes=FC_CACHE_MAX_BYTES,
+)
+financial_connections_service = FinancialConnectionsService(
+    api_url=API_URL,
+    max_connections=FC_MAX_CONNECTIONS,
+    max_per_host=FC_MAX_PER_HOST,
+    max_fan_out=FC_MAX_FAN_OUT,
+    use_batch_endpoints=FC_USE_BATCH_ENDPOINTS,
+    cache=lookup_cache,
+)
 session_service = SessionService(openai=openai, db=session_info_db)
+session_worker = SessionWorker(session_service=session_service)
+context_window_service = ContextWindowService(
+    openai=openai_pool,
+    instructions=AGENT_INSTRUCTIONS,
+    tools=AGENT_TOOLS,
+    max_input_tokens=CONTEXT_MAX_INPUT_TOKENS,
+)
+response_cache = None
+if RESPONSE_CACHE_ENABLED:
+    response_cache = ResponseCache(
+        model=AGENT_MODEL,
+        instructions=AGENT_INSTRUCTIONS,
+        tools=AGENT_TOOLS,
+        table=dynamodb.Table(RESPONSE_CACHE_TABLE) if RESPONSE_CACHE_TABLE else None,
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+        ttl=RESPONSE_CACHE_TTL,
+        history_window=RESPONSE_CACHE_HISTORY_WINDOW,
+    )
+single_flight = None
+if SINGLE_FLIGHT_ENABLED:
+    single_flight = SingleFlight(replay_window=SINGLE_FLIGHT_REPLAY_WINDOW, abandon_grace=SINGLE_FLIGHT_ABANDON_GRACE)
+admission = None
+if ADMISSION_ENABLED:
+    admission = AdmissionController(
+        max_concurrency=ADMISSION_MAX_CONCURRENCY,
+        min_concurrency=ADMISSION_MIN_CONCURRENCY,
+        per_user_limit=ADMISSION_PER_USER_LIMIT,
+        max_queue=ADMISSION_MAX_QUEUE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+        latency_target=ADMISSION_LATENCY_TARGET,
+    )
+hedger = None
+if HEDGING_ENABLED:
+    hedger = Hedger(budget=HEDGE_BUDGET, min_delay=HEDGE_MIN_DELAY)
+model_router = None
+if MODEL_ROUTER_ENABLED:
+    model_router = ModelRouter(
+        light_model=MODEL_ROUTER_LIGHT_MODEL,
+        standard_model=MODEL_ROUTER_STANDARD_MODEL,
+        heavy_model=MODEL_ROUTER_HEAVY_MODEL,
+    )
+tool_selector = None
+if TOOL_SELECTION_ENABLED:
+    tool_selector = ToolSelector(AGENT_TOOLS)
+sse_coalescing = None
+if SSE_COALESCE_BYTES > 0:
+    sse_coalescing = SSECoalescing(max_bytes=SSE_COALESCE_BYTES, max_delay=SSE_COALESCE_WINDOW)
 agent_service = AgentService(
-    openai=async_openai,
+    openai=openai_pool,
     instructions=AGENT_INSTRUCTIONS,
     model=AGENT_MODEL,
     tools=AGENT_TOOLS,
-    db=chat_logs_db,
-    session_service=session_service,
+    chat_log_writer=chat_log_writer,
+    session_worker=session_worker,
+    history_store=history_store,
+    context_window_service=context_window_service,
+    financial_connections_service=financial_connections_service,
+    process_pool=process_pool,
+    tool_timeout=TOOL_TIMEOUT,
+    simulation_cpu_limit=SIMULATION_CPU_LIMIT,
+    chain_responses=RESPONSE_CHAINING,
+    turn_limits=TurnLimits(
+        deadline=AGENT_TURN_DEADLINE,
+        final_answer_timeout=AGENT_FINAL_ANSWER_TIMEOUT,
+        max_hops=AGENT_MAX_HOPS,
+        max_tool_calls=AGENT_MAX_TOOL_CALLS,
+        token_budget=AGENT_TURN_TOKEN_BUDGET,
+    ),
+    sse_coalescing=sse_coalescing,
+    response_cache=response_cache,
+    single_flight=single_flight,
+    admission=admission,
+    hedger=hedger,
+    model_router=model_router,
+    tool_selector=tool_selector,
 )
 
 # Handlers
 agent_handler = AgentHandler(agent_service=agent_service)
+metrics_handler = MetricsHandler()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Drains background work before the worker exits"""
+    yield
+    await session_worker.close()
+    await chat_log_writer.close()
+    await financial_connections_service.close()
+    if response_cache is not None:
+        await response_cache.close()
+    process_pool.shutdown(cancel_futures=True)
+
 
 # App Setup
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -71,6 +307,7 @@ app.add_middleware(
 )
 
 app.include_router(agent_handler.router)
+app.include_router(metrics_handler.router)
 
 
 # Test Route
@@ -1,4 +1,15 @@
 """All Modules"""
 
+from app.modules.admission import *
 from app.modules.agent import *
+from app.modules.chat_log import *
+from app.modules.context_window import *
+from app.modules.financial_connections import *
+from app.modules.history import *
+from app.modules.metrics import *
+from app.modules.model_router import *
+from app.modules.openai_pool import *
+from app.modules.response_cache import *
 from app.modules.session import *
+from app.modules.single_flight import *
+from app.modules.tool_selection import *
@@ -0,0 +1,3 @@
+"""All admission control functionality"""
+
+from app.modules.admission.admission_controller import AdmissionController, AdmissionRejected
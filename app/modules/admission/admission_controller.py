@@ -0,0 +1,202 @@
+"""This module contains the admission controller that bounds concurrent agent turns"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Deque, Dict
+
+from app.utils import METRICS
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT = METRICS.histogram(
+    "admission_queue_wait_seconds",
+    "Time requests waited for a turn slot, by outcome",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+REJECTIONS = METRICS.counter("admission_rejections_total", "Requests turned away with a 429, by reason")
+LIMIT_DECREASES = METRICS.counter("admission_limit_decreases_total", "Concurrency limit cuts, by signal")
+CONCURRENCY_LIMIT = METRICS.gauge("admission_concurrency_limit", "Current adaptive limit on concurrent turns")
+ACTIVE_TURNS = METRICS.gauge("admission_active_turns", "Turns currently holding a slot")
+QUEUE_DEPTH = METRICS.gauge("admission_queue_depth", "Requests waiting for a slot")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted, with the seconds after which a retry may succeed"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limits how many agent turns stream from the model at once.
+
+    Each turn takes a slot for its whole duration. When none is free the request waits in a
+    bounded queue for at most `queue_timeout` seconds. Waiting users are served round-robin, and
+    no user holds more than `per_user_limit` slots or queue places, so one busy client can't
+    crowd out the rest. A full queue is rejected immediately rather than left to time out.
+
+    The limit adapts AIMD style: it grows by one slot per limit's worth of turns whose first
+    token arrived within `latency_target`, and is cut by `decrease_factor` when the upstream
+    returns 429 or first tokens get slower than the target, at most once per `cooldown`.
+    """
+
+    # pylint: disable=R0902,R0913
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        min_concurrency: int = 4,
+        per_user_limit: int = 4,
+        max_queue: int = 128,
+        queue_timeout: float = 10.0,
+        latency_target: float = 5.0,
+        decrease_factor: float = 0.7,
+        cooldown: float = 5.0,
+    ):
+        self.__max_concurrency = max_concurrency
+        self.__min_concurrency = min(min_concurrency, max_concurrency)
+        self.__per_user_limit = per_user_limit
+        self.__max_queue = max_queue
+        self.__queue_timeout = queue_timeout
+        self.__latency_target = latency_target
+        self.__decrease_factor = decrease_factor
+        self.__cooldown = cooldown
+        self.__limit = float(max_concurrency)
+        self.__last_decrease = -math.inf
+        self.__active = 0
+        self.__active_by_user: Dict[str, int] = defaultdict(int)
+        # user -> waiters, in the order users are served
+        self.__waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.__queued = 0
+        # Moving average of how long a turn holds its slot, for Retry-After
+        self.__hold_seconds = 5.0
+        CONCURRENCY_LIMIT.set(self.__limit)
+
+    @property
+    def limit(self) -> int:
+        """Number of turns currently allowed to run at once"""
+        return int(self.__limit)
+
+    async def acquire(self, user_id: str) -> float:
+        """Waits for a slot, returning how long that took, or raises AdmissionRejected"""
+        # Free slots are always handed to eligible waiters first, so any left over are ours to take
+        if self.__can_run(user_id):
+            self.__grant(user_id)
+            QUEUE_WAIT.observe(0.0, outcome="admitted")
+            return 0.0
+
+        waiters = self.__waiting.get(user_id)
+        if waiters is not None and len(waiters) >= self.__per_user_limit:
+            self.__reject("user_limit")
+        if self.__queued >= self.__max_queue:
+            self.__reject("queue_full")
+
+        waiter: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.__waiting.setdefault(user_id, deque()).append(waiter)
+        self.__queued += 1
+        QUEUE_DEPTH.set(self.__queued)
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=self.__queue_timeout)
+        except asyncio.CancelledError:
+            # The client went away while waiting, possibly just as it was handed a slot
+            if waiter.done():
+                self.__free(user_id)
+            else:
+                waiter.cancel()
+                self.__remove(user_id, waiter)
+            raise
+
+        waited = time.monotonic() - started
+        if not waiter.done():
+            waiter.cancel()
+            self.__remove(user_id, waiter)
+            QUEUE_WAIT.observe(waited, outcome="timeout")
+            self.__reject("queue_timeout")
+        QUEUE_WAIT.observe(waited, outcome="admitted")
+        return waited
+
+    def release(self, user_id: str, held_seconds: float):
+        """Frees a slot taken by acquire, letting the next waiter in"""
+        self.__hold_seconds = 0.9 * self.__hold_seconds + 0.1 * held_seconds
+        self.__free(user_id)
+
+    def record_first_token(self, seconds: float):
+        """Feeds one model hop's first-token latency into the adaptive limit"""
+        if seconds > self.__latency_target:
+            self.__decrease("latency")
+            return
+        previous = self.limit
+        self.__limit = min(float(self.__max_concurrency), self.__limit + 1 / self.__limit)
+        if self.limit != previous:
+            CONCURRENCY_LIMIT.set(self.__limit)
+            self.__dispatch()
+
+    def record_rate_limited(self):
+        """Cuts the limit after the upstream rejected a request with 429"""
+        self.__decrease("rate_limit")
+
+    def __decrease(self, signal: str):
+        now = time.monotonic()
+        if now - self.__last_decrease < self.__cooldown:
+            return
+        self.__last_decrease = now
+        self.__limit = max(float(self.__min_concurrency), self.__limit * self.__decrease_factor)
+        CONCURRENCY_LIMIT.set(self.__limit)
+        LIMIT_DECREASES.inc(signal=signal)
+        logger.warning(f"Concurrency limit cut to {self.limit} after {signal}")
+
+    def __can_run(self, user_id: str) -> bool:
+        return self.__active < self.limit and self.__active_by_user.get(user_id, 0) < self.__per_user_limit
+
+    def __grant(self, user_id: str):
+        self.__active += 1
+        self.__active_by_user[user_id] += 1
+        ACTIVE_TURNS.set(self.__active)
+
+    def __free(self, user_id: str):
+        self.__active -= 1
+        self.__active_by_user[user_id] -= 1
+        if not self.__active_by_user[user_id]:
+            del self.__active_by_user[user_id]
+        ACTIVE_TURNS.set(self.__active)
+        self.__dispatch()
+
+    def __dispatch(self):
+        """Hands free slots to waiting users in round-robin order"""
+        while self.__active < self.limit and self.__waiting:
+            for user_id in list(self.__waiting):
+                if self.__can_run(user_id):
+                    break
+            else:
+                return
+            waiters = self.__waiting.pop(user_id)
+            waiter = waiters.popleft()
+            if waiters:
+                # Back of the line, so other users get the next slots
+                self.__waiting[user_id] = waiters
+            self.__queued -= 1
+            QUEUE_DEPTH.set(self.__queued)
+            self.__grant(user_id)
+            waiter.set_result(None)
+
+    def __remove(self, user_id: str, waiter: asyncio.Future):
+        waiters = self.__waiting.get(user_id)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        if not waiters:
+            del self.__waiting[user_id]
+        self.__queued -= 1
+        QUEUE_DEPTH.set(self.__queued)
+
+    def __reject(self, reason: str):
+        REJECTIONS.inc(reason=reason)
+        # Roughly when the queue ahead will have drained through the current limit
+        retry_after = self.__hold_seconds * (self.__queued + 1) / max(1, self.limit)
+        raise AdmissionRejected(reason, retry_after=min(60, max(1, math.ceil(retry_after))))
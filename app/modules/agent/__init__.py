@@ -2,3 +2,5 @@
 
 from app.modules.agent.agent_handler import AgentHandler
 from app.modules.agent.agent_service import AgentService
+from app.modules.agent.agent_turn import AgentTurn, TurnLimits
+from app.modules.agent.hedger import HedgedStream, Hedger
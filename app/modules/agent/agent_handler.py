@@ -1,6 +1,8 @@
 """Handles all incoming requests to agent"""
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request
+
+from app.modules.admission import AdmissionRejected
 
 
 class AgentHandler:
@@ -15,18 +17,35 @@ class AgentHandler:
         """Initializes all routes"""
         self.router.post("/execute")(self.execute_agent)
 
-    async def execute_agent(self, payload: dict):
+    async def execute_agent(self, payload: dict, request: Request):
         """Handles agent execution"""
         message = payload.get("message_content", "")
-        history = payload.get("history", [])
+        history = payload.get("history")
+        history_version = payload.get("history_version")
         session_id = payload.get("session_id", "")
         user_id = payload.get("user_id", "")
         context = payload.get("context", [])
+        stream_format = payload.get("stream_format", "raw")
+        # Clients that render token by token can opt out of frame coalescing
+        coalesce = payload.get("coalesce", True)
+        # Retries of one submission carry the same key, so a repeated message with a new key is a new turn
+        idempotency_key = payload.get("idempotency_key") or request.headers.get("Idempotency-Key")
 
-        return await self.__agent_service.handle_message(
-            message=message,
-            history=history,
-            session_id=session_id,
-            user_id=user_id,
-            context=context,
-        )
+        try:
+            return await self.__agent_service.handle_message(
+                message=message,
+                history=history,
+                session_id=session_id,
+                user_id=user_id,
+                context=context,
+                history_version=history_version,
+                stream_format=stream_format,
+                is_disconnected=request.is_disconnected,
+                coalesce=coalesce,
+                idempotency_key=idempotency_key,
+            )
+        except AdmissionRejected as e:
+            # Shed before anything is saved, so the client can simply resend after Retry-After
+            raise HTTPException(
+                status_code=429, detail=f"Too many requests ({e.reason})", headers={"Retry-After": str(e.retry_after)}
+            ) from e
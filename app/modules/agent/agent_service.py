@@ -1,44 +1,281 @@
 """Contains all agent functionality"""
 
+import asyncio
 import json
+import logging
+import time
 import uuid
+from concurrent.futures import Executor
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from functools import partial
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
 from fastapi.responses import StreamingResponse
 
+from app.modules.admission import AdmissionController
+from app.modules.agent.agent_turn import AgentTurn, TurnLimits
+from app.modules.agent.hedger import Hedger
+from app.modules.model_router import ModelRouter
+from app.modules.response_cache import ResponseCache
+from app.modules.single_flight import SingleFlight
+from app.modules.tool_selection import ToolSelector
 from app.utils import (
+    CHART_KEY,
+    FORCED_ANSWER_PROMPT,
+    METRICS,
+    SSE_DONE,
+    TRACER,
     ChatMessage,
+    FormattedChatMessage,
     FormattedMessageOwner,
     GraphResponse,
     MessageOwner,
+    ResponseStreamParser,
+    Span,
+    SSECoalescing,
+    SSEDelta,
+    Trace,
+    as_graph,
     calculate_compound_interest,
-    format_history,
-    get_acct_details,
-    get_transaction_details,
+    compare_compound_interest,
+    count_json_tokens,
+    count_tokens,
+    format_sse,
+    simulate_portfolio,
+    stream_until_disconnect,
+)
+
+logger = logging.getLogger(__name__)
+
+CHARTS_DELIVERED = METRICS.counter("tool_charts_delivered_total", "Tool charts sent straight to the client, by tool")
+CHART_TOKENS_SAVED = METRICS.counter(
+    "tool_chart_output_tokens_saved_total",
+    "Output tokens the model didn't write because a tool chart was sent directly",
+)
+CHART_SECONDS_SAVED = METRICS.histogram(
+    "tool_chart_stream_seconds_saved",
+    "Estimated stream time saved per tool chart, at the observed output token rate",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16),
+)
+GENERATIONS_ABORTED = METRICS.counter(
+    "agent_generations_aborted_total", "Turns abandoned because the client disconnected, by stage"
+)
+ABORT_TOKENS_SAVED = METRICS.counter(
+    "agent_aborted_output_tokens_saved_total",
+    "Estimated output tokens not generated because the client disconnected mid-turn",
+)
+HOP_SECONDS = METRICS.histogram("agent_hop_seconds", "Time spent on each model hop or tool batch, by phase")
+HOP_FIRST_TOKEN = METRICS.histogram(
+    "agent_hop_first_token_seconds", "Time from starting a model hop to its first output delta, by phase"
+)
+REQUEST_FIRST_FRAME = METRICS.histogram(
+    "agent_request_first_frame_seconds", "Time from receiving a message to sending its first stream frame"
+)
+CHUNK_GAP = METRICS.histogram(
+    "agent_stream_chunk_gap_seconds",
+    "Time between consecutive text deltas from the model, by phase",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+TOOL_SECONDS = METRICS.histogram("agent_tool_seconds", "Tool call latency, by tool and status")
+TURN_HOPS = METRICS.histogram("agent_turn_hops", "Model hops per turn", buckets=(1, 2, 3, 4, 5, 6, 8, 10))
+TURN_LIMITS = METRICS.counter("agent_turn_limits_reached_total", "Turns forced to answer early, by limit")
+HOP_TIMEOUTS = METRICS.counter("agent_hop_timeouts_total", "Model hops cut off at the turn deadline, by phase")
+
+# Cached answers are replayed in chunks about the size of a few model deltas
+REPLAY_CHUNK_CHARS = 16
+# Sent when even the forced final answer doesn't arrive in time
+DEADLINE_ANSWER = json.dumps(
+    {"message": "Sorry, this is taking longer than expected and I couldn't finish an answer. Please try again."}
 )
 
 
 class AgentService:
     """This class contains the functionality for the OpenAI chat completions"""
 
-    def __init__(self, openai, instructions, model, tools, db, session_service):
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        openai,
+        instructions,
+        model,
+        tools,
+        chat_log_writer,
+        session_worker,
+        history_store,
+        context_window_service,
+        financial_connections_service,
+        process_pool: Executor,
+        tool_timeout: float = 15.0,
+        simulation_cpu_limit: float = 2.0,
+        chain_responses: bool = False,
+        turn_limits: Optional[TurnLimits] = None,
+        sse_coalescing: Optional[SSECoalescing] = None,
+        response_cache: Optional[ResponseCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        admission: Optional[AdmissionController] = None,
+        hedger: Optional[Hedger] = None,
+        model_router: Optional[ModelRouter] = None,
+        tool_selector: Optional[ToolSelector] = None,
+    ):
         self.__openai = openai
         self.__system_prompt = instructions
         self.__model = model
         self.__tools = tools
-        self.__db = db
-        self.__session_service = session_service
+        self.__chat_log_writer = chat_log_writer
+        self.__session_worker = session_worker
+        self.__history_store = history_store
+        self.__context_window_service = context_window_service
+        self.__financial_connections_service = financial_connections_service
+        self.__process_pool = process_pool
+        self.__tool_timeout = tool_timeout
+        self.__simulation_cpu_limit = simulation_cpu_limit
+        self.__chain_responses = chain_responses
+        self.__turn_limits = turn_limits or TurnLimits()
+        self.__sse_coalescing = sse_coalescing
+        self.__response_cache = response_cache
+        self.__single_flight = single_flight
+        self.__admission = admission
+        self.__hedger = hedger
+        self.__model_router = model_router
+        self.__tool_selector = tool_selector
+        self.__fixed_tokens = count_tokens(instructions) + count_json_tokens(tools)
+        # Moving averages of streamed text deltas, roughly one output token each
+        self.__output_token_rate = 50.0
+        self.__turn_output_tokens = 300.0
 
     async def handle_message(
         self,
         message: str,
-        history: List[ChatMessage],
+        history: Optional[List[ChatMessage]],
         user_id: str,
         session_id: str,
         context: Optional[List[str]] = None,
+        history_version: Optional[int] = None,
+        stream_format: str = "raw",
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+        coalesce: bool = True,
+        idempotency_key: Optional[str] = None,
+    ):
+        """
+        Saves user message and returns generator as StreamingResponse.
+        History comes from the server-side store when the client's history_version is current,
+        so clients only need to send the full history when they have no version.
+        With stream_format "events" the stream carries parsed message.delta and graph events
+        instead of raw JSON fragments, and charts computed by tools are sent as graph events
+        without the model writing them out.
+        If the client disconnects, the model stream is closed and running tools are cancelled.
+        Each turn is bounded by the configured TurnLimits.
+        Deltas are batched into fewer writes when SSE coalescing is configured, unless the client
+        asks for one frame per delta with coalesce=False.
+        Turns without tool context are looked up in the response cache, and a cached answer is
+        replayed as a stream instead of calling the model.
+        With single-flight enabled, a duplicate of a message at the same point in the conversation
+        that is still streaming, or finished moments ago, gets that stream instead of starting its
+        own turn.
+        With admission control, a turn waits for a free slot before it starts and raises
+        AdmissionRejected when it can't get one in time.
+        With a model router, each turn's model and output budget are picked from its message,
+        context and history depth.
+        With a tool selector, each model hop is only sent the tools its turn can use.
+        """
+        coalescing = self.__sse_coalescing if coalesce else None
+        single_flight = self.__single_flight
+        flight_key = None
+        if single_flight is not None:
+            # Both are the conversation's length, so a repeat later in the conversation gets its own turn
+            position = history_version if history_version is not None else len(history) if history is not None else None
+            flight_key = SingleFlight.key(session_id, message, position, idempotency_key)
+        if single_flight is None or flight_key is None:
+            frames, headers = await self.__start_turn(
+                message, history, user_id, session_id, context, history_version, stream_format
+            )
+        else:
+            flight, leader = single_flight.join(flight_key)
+            if leader:
+                try:
+                    frames, headers = await self.__start_turn(
+                        message, history, user_id, session_id, context, history_version, stream_format
+                    )
+                except Exception as e:
+                    flight.fail(e)
+                    raise
+                flight.start(frames, headers)
+            else:
+                headers = await flight.headers()
+            frames = flight.subscribe()
+
+        return StreamingResponse(
+            stream_until_disconnect(frames, is_disconnected=is_disconnected, coalescing=coalescing),
+            media_type="text/event-stream",
+            headers=headers,
+        )
+
+    # pylint: disable=R0913
+    async def __start_turn(
+        self,
+        message: str,
+        history: Optional[List[ChatMessage]],
+        user_id: str,
+        session_id: str,
+        context: Optional[List[str]],
+        history_version: Optional[int],
+        stream_format: str,
+    ) -> Tuple[AsyncGenerator[Union[str, SSEDelta], None], Dict[str, str]]:
+        """Admits and prepares the turn, which then holds its admission slot until the stream ends"""
+        args = (message, history, user_id, session_id, context, history_version, stream_format)
+        admission = self.__admission
+        if admission is None:
+            return await self.__prepare_turn(*args)
+
+        await admission.acquire(user_id)
+        admitted_at = time.monotonic()
+        try:
+            frames, headers = await self.__prepare_turn(*args)
+        except BaseException:
+            admission.release(user_id, time.monotonic() - admitted_at)
+            raise
+        return self.__hold_slot(frames, admission, user_id, admitted_at), headers
+
+    @staticmethod
+    async def __hold_slot(
+        frames: AsyncGenerator[Union[str, SSEDelta], None],
+        admission: AdmissionController,
+        user_id: str,
+        admitted_at: float,
     ):
-        """Saves user message and returns generator as StreamingResponse"""
+        """Yields the turn's frames, releasing its admission slot once they end"""
+        try:
+            async for frame in frames:
+                yield frame
+        finally:
+            await frames.aclose()
+            admission.release(user_id, time.monotonic() - admitted_at)
+
+    # pylint: disable=R0913
+    async def __prepare_turn(
+        self,
+        message: str,
+        history: Optional[List[ChatMessage]],
+        user_id: str,
+        session_id: str,
+        context: Optional[List[str]],
+        history_version: Optional[int],
+        stream_format: str,
+    ) -> Tuple[AsyncGenerator[Union[str, SSEDelta], None], Dict[str, str]]:
+        """Saves the user message and prepares the turn, returning its frames and response headers"""
+        trace = TRACER.start_trace(session_id=session_id)
+        request_span = trace.start_span("request", stream_format=stream_format, message_chars=len(message))
+        try:
+            _, formatted_history = await self.__history_store.load(
+                user_id=user_id,
+                session_id=session_id,
+                history=history,
+                version=history_version,
+            )
+        except Exception as e:
+            request_span.end(status="error", error=type(e).__name__)
+            raise
+
         await self.__save_message(
             user_id=user_id,
             session_id=session_id,
@@ -46,165 +283,462 @@ class AgentService:
             message_content=message,
         )
 
-        is_first_message = len(history) == 0
-        updated_history = format_history(history)
-        updated_history.append({"role": FormattedMessageOwner.USER, "content": message})
+        is_first_message = len(formatted_history) == 0
+        updated_history = [
+            *formatted_history,
+            {"role": FormattedMessageOwner.USER, "content": message},
+        ]
 
-        self.__session_service.update_session(
+        # Older turns are folded into a cached summary once history exceeds the token budget
+        model_history, tokens_saved = await self.__context_window_service.fit(
+            session_id=session_id,
+            history=formatted_history,
+            message=message,
+        )
+
+        # Session bookkeeping (including title generation) runs in the background
+        self.__session_worker.submit(
             session_id=session_id,
             history=updated_history,
             is_first_message=is_first_message,
         )
 
-        return StreamingResponse(
-            self.__generate_response(
-                message=message,
-                history=history,
+        turn = AgentTurn(
+            message=message,
+            history=model_history,
+            context=context,
+            stream_events=stream_format == "events",
+            limits=self.__turn_limits,
+            trace=trace,
+        )
+        if self.__model_router is not None:
+            turn.route = self.__model_router.route(message, formatted_history, context)
+            request_span.set(tier=turn.route.tier, route=turn.route.reason)
+        if self.__tool_selector is not None:
+            turn.tool_groups = self.__tool_selector.select(message, formatted_history, context)
+            request_span.set(tool_groups=",".join(sorted(turn.tool_groups)))
+        if self.__response_cache is not None and not context:
+            turn.cache_key = self.__response_cache.key(
+                model_history,
+                message,
+                route=turn.route,
+                tool_groups=turn.tool_groups,
+            )
+            if turn.cache_key is not None:
+                turn.cached_response = await self.__response_cache.get(turn.cache_key)
+                request_span.set(cache="hit" if turn.cached_response is not None else "miss")
+
+        frames = self.__stream_turn(turn=turn, user_id=user_id, session_id=session_id, request_span=request_span)
+        headers = {
+            # The version the session will have once the reply is saved, which is what the client then holds
+            "X-History-Version": str(len(updated_history) + 1),
+            "X-Context-Tokens-Saved": str(tokens_saved),
+        }
+        return frames, headers
+
+    async def __stream_turn(self, turn: AgentTurn, user_id: str, session_id: str, request_span: Span):
+        """Streams one turn, recording what was generated if the client abandons it"""
+        if turn.cached_response is not None:
+            frames = self.__replay_cached(turn=turn, user_id=user_id, session_id=session_id)
+        else:
+            frames = self.__generate_response(turn=turn, user_id=user_id, session_id=session_id)
+        status = "error"
+        try:
+            async for frame in frames:
+                if not turn.frames_sent:
+                    REQUEST_FIRST_FRAME.observe(time.monotonic() - turn.trace.started_at)
+                turn.frames_sent += 1
+                yield frame
+            status = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            if not turn.completed:
+                status = "aborted"
+                await frames.aclose()
+                await self.__record_abort(user_id, session_id, turn)
+            raise
+        finally:
+            await frames.aclose()
+            request_span.end(
+                status=status,
+                hops=turn.hops,
+                tool_calls=turn.tool_calls,
+                tokens=turn.tokens_used,
+                limit_reached=turn.limit_reached,
+                timings=turn.timings,
+                tool_tokens_saved=sum(turn.tool_tokens_saved),
+            )
+            if turn.tool_groups is not None and turn.cached_response is None:
+                ToolSelector.record_turn(sum(turn.tool_tokens_saved))
+
+            model_router = self.__model_router
+            if model_router is not None and turn.route is not None and turn.cached_response is None:
+                model_router.record(
+                    turn.route,
+                    status=status,
+                    hops=turn.hops,
+                    tool_calls=turn.tool_calls,
+                    output_tokens=turn.output_deltas,
+                    limit_reached=turn.limit_reached,
+                    seconds=round(time.monotonic() - turn.started_at, 3),
+                )
+
+        if turn.cached_response is None:
+            self.__turn_output_tokens = 0.8 * self.__turn_output_tokens + 0.2 * turn.output_deltas
+        TURN_HOPS.observe(turn.hops)
+
+    async def __record_abort(self, user_id: str, session_id: str, turn: AgentTurn):
+        """Counts an abandoned turn and keeps whatever part of the answer the user already saw"""
+        tokens_saved = max(0, int(self.__turn_output_tokens) - turn.output_deltas)
+        GENERATIONS_ABORTED.inc(stage=turn.stage)
+        ABORT_TOKENS_SAVED.inc(tokens_saved)
+        logger.info(
+            f"Client disconnected from session {session_id} during {turn.stage}, "
+            f"after {turn.output_deltas} output tokens"
+        )
+
+        partial_message = turn.parser.partial_message() if turn.parser else ""
+        if partial_message:
+            await self.__save_message(
                 user_id=user_id,
                 session_id=session_id,
-                context=context,
-            ),
-            media_type="text/event-stream",
-        )
+                message_type=MessageOwner.AI,
+                message_content=partial_message,
+                aborted=True,
+            )
 
-    # pylint: disable=R0912
-    async def __generate_response(
-        self,
-        message: str,
-        history: List[ChatMessage],
-        user_id: str,
-        session_id: str,
-        context: Optional[List[str]] = None,
-    ):
+    # pylint: disable=R0912,R0914,R0915
+    async def __generate_response(self, turn: AgentTurn, user_id: str, session_id: str):
         """
-        Acts as async generator to yield chunks from openai completion and handles tool calls.
-        Context is only maintained within a single chain of tool calls, not between separate messages.
+        Runs the agent loop for a turn as an async generator of SSE frames.
+
+        Each iteration makes one model hop and, if the model asked for tools, runs them all
+        concurrently before the next hop. Context is only maintained within a single turn, not
+        between separate messages. With response chaining enabled, follow-up hops reference the
+        previous response and only send the tool outputs instead of rebuilding the prompt.
+
+        Once the turn runs out of time, hops, tool calls or tokens, the next hop is made with
+        tool_choice "none" so the model answers with what it already has.
+
+        A model hop that is still running at the deadline is cut off. If it hadn't streamed any
+        text yet, the turn moves on to the forced final answer, which gets the limits'
+        final_answer_timeout; if that times out too, the user gets DEADLINE_ANSWER.
+
+        With a hedger, the first hop is raced against a second identical stream when its first
+        event is slow to arrive.
 
         Args:
-            message (str): The user's message or tool context message
-            history (List[ChatMessage]): Chat history
+            turn (AgentTurn): The turn's message, history and limits, updated as the loop runs
             user_id (str): User identifier
             session_id (str): Session identifier
-            context (List[str]): List of context strings from tool calls or user supplied info in the current chain
         """
-        print(f"\nRunning with message: {message}")
-        if context:
-            print(f"Current tool chain context: {context}\n")
-
-        full_response = ""
-        final_tool_calls = {}
-
-        # Only combine tool context with the message if we're in a tool chain
-        context_str = ""
-        enhanced_message = message
-        if context:
-            context_str = " ".join(context)
-
-        if len(context_str) > 0:
-            enhanced_message = (
-                f"Based on this context: {context_str}\n\n"
-                f"Please provide a response to the original question: {message}"
+        while True:
+            limit = turn.check_limits()
+            if limit is not None:
+                TURN_LIMITS.inc(limit=limit)
+
+            parser = ResponseStreamParser()
+            turn.parser = parser
+            turn.stage = "model"
+            final_tool_calls: Dict[int, Dict[str, Any]] = {}
+            params = self.__get_hop_params(turn, final=limit is not None)
+            response_id = None
+            usage = None
+            hop_deltas = 0
+            text_deltas = 0
+            first_token_at = first_delta_at = last_delta_at = 0.0
+            phase = "final" if limit is not None else "model"
+            # Checked once per hop, so per-chunk tracing costs nothing unless it's enabled
+            trace_chunks = turn.trace.chunks
+
+            hop_span = turn.trace.start_span(
+                "model_hop", hop=turn.hops + 1, phase=phase, chained=bool(turn.previous_response_id)
             )
-
-        response_stream = await self.__openai.responses.create(
-            **self.__get_params(
-                message=enhanced_message,
-                history=history,
-            )
-        )
-
-        async for chunk in response_stream:
-            print(f"\nChunk Type: {chunk.type}\n")
-
-            if chunk.type == "response.output_item.added":
-                print(f"Test Chunk: {chunk}")
-                item = chunk.item
-                index = chunk.output_index
-                if item and item.type == "function_call":
-                    function_name = item.name
-                    final_tool_calls[index] = {
-                        "function": {"name": function_name, "arguments": ""}
+            hop_started = time.perf_counter()
+            hop_timeout = turn.hop_timeout(final=limit is not None)
+            hop_deadline = asyncio.get_running_loop().time() + hop_timeout
+            timed_out = False
+            try:
+                create = partial(self.__openai.responses.create, **params)
+                if turn.hops == 0 and self.__hedger is not None:
+                    response_stream = await asyncio.wait_for(self.__hedger.create(create), hop_timeout)
+                else:
+                    response_stream = await asyncio.wait_for(create(), hop_timeout)
+            except asyncio.TimeoutError:
+                response_stream = None
+                timed_out = True
+            except Exception as e:
+                hop_span.end(status="error", error=type(e).__name__)
+                if self.__admission is not None and getattr(e, "status_code", None) == 429:
+                    self.__admission.record_rate_limited()
+                raise
+            chunks = self.__until(response_stream, hop_deadline)
+            try:
+                async for chunk in chunks:
+                    if trace_chunks:
+                        size = len(getattr(chunk, "delta", None) or "")
+                        turn.trace.event("chunk", hop=turn.hops + 1, type=chunk.type, size=size)
+
+                    if chunk.type == "response.created":
+                        response_id = chunk.response.id
+
+                    if chunk.type == "response.completed":
+                        usage = getattr(chunk.response, "usage", None)
+
+                    if chunk.type == "response.output_item.added":
+                        item = chunk.item
+                        index = chunk.output_index
+                        if item and item.type == "web_search_call":
+                            turn.web_searches += 1
+                            turn.tools_used.add("web_search_preview")
+                        if item and item.type == "function_call":
+                            function_name = item.name
+                            final_tool_calls[index] = {
+                                "call_id": item.call_id,
+                                "function": {"name": function_name, "arguments": ""},
+                            }
+
+                    if chunk.type == "response.function_call_arguments.delta":
+                        # Handles custom tool call chunks
+                        index = chunk.output_index
+                        content = chunk.delta
+                        # Correctly append to the arguments string
+                        if index in final_tool_calls:
+                            final_tool_calls[index]["function"]["arguments"] += content
+                        hop_deltas += 1
+                        first_token_at = first_token_at or time.perf_counter()
+
+                    if chunk.type == "response.output_text.delta":
+                        # Handles text response
+                        content = chunk.delta
+                        now = time.perf_counter()
+                        if text_deltas:
+                            CHUNK_GAP.observe(now - last_delta_at, phase=phase)
+                        else:
+                            first_delta_at = now
+                        last_delta_at = now
+                        text_deltas += 1
+                        hop_deltas += 1
+                        turn.output_deltas += 1
+                        first_token_at = first_token_at or last_delta_at
+                        for frame in self.__text_frames(turn, parser, content):
+                            yield frame
+            except asyncio.TimeoutError:
+                timed_out = True
+            finally:
+                # Stops generation upstream when the turn is abandoned mid-stream or times out
+                await chunks.aclose()
+                if response_stream is not None:
+                    await response_stream.close()
+                hop_span.end(
+                    deltas=hop_deltas,
+                    tool_calls=len(final_tool_calls),
+                    completed=usage is not None,
+                    timed_out=timed_out,
+                )
+
+            turn.hops += 1
+            if usage is not None:
+                turn.tokens_used += usage.total_tokens
+            else:
+                fixed_tokens = self.__fixed_tokens - (turn.tool_tokens_saved[-1] if turn.tool_tokens_saved else 0)
+                turn.tokens_used += fixed_tokens + count_json_tokens(params["input"]) + hop_deltas
+
+            hop_seconds = time.perf_counter() - hop_started
+            first_token = round(first_token_at - hop_started, 4) if first_token_at else None
+            turn.record(phase, hop_seconds, hop=turn.hops, first_token=first_token, tool_calls=len(final_tool_calls))
+            HOP_SECONDS.observe(hop_seconds, phase=phase)
+            if first_token is not None:
+                HOP_FIRST_TOKEN.observe(first_token, phase=phase)
+                if self.__admission is not None:
+                    self.__admission.record_first_token(first_token)
+
+            if text_deltas > 1 and last_delta_at > first_delta_at:
+                rate = (text_deltas - 1) / (last_delta_at - first_delta_at)
+                self.__output_token_rate = 0.8 * self.__output_token_rate + 0.2 * rate
+
+            if timed_out:
+                HOP_TIMEOUTS.inc(phase=phase)
+                turn.limit_reached = turn.limit_reached or "deadline"
+                # Raw clients can't take a second JSON object once part of one was sent
+                if parser.partial_message() if turn.stream_events else text_deltas:
+                    # The user already has part of an answer, so keep it rather than start another
+                    break
+                if limit is None:
+                    continue
+                turn.parser = parser = ResponseStreamParser()
+                for frame in self.__text_frames(turn, parser, DEADLINE_ANSWER):
+                    yield frame
+                break
+
+            # Tool calls on the forced final hop are ignored, it already had tools disabled
+            if not final_tool_calls or limit is not None:
+                break
+
+            turn.stage = "tools"
+            turn.tools_used.update(tool_call["function"]["name"] for tool_call in final_tool_calls.values())
+            tools_started = time.perf_counter()
+            tool_results = await self.__run_tools(turn, list(final_tool_calls.values()), user_id)
+            tools_seconds = time.perf_counter() - tools_started
+            turn.record("tools", tools_seconds, hop=turn.hops, tool_calls=len(tool_results))
+            HOP_SECONDS.observe(tools_seconds, phase="tools")
+
+            for position, (function_name, tool_result) in enumerate(tool_results):
+                if not isinstance(tool_result, dict) or CHART_KEY not in tool_result:
+                    continue
+                # Charts never go back to the model. Event clients get them straight away and the
+                # model is told they were shown; raw clients still get the graph from the model.
+                tool_result = dict(tool_result)
+                chart = tool_result.pop(CHART_KEY)
+                if turn.stream_events:
+                    chart_id = f"chart_{len(turn.charts) + 1}"
+                    turn.charts[chart_id] = chart
+                    tool_result[CHART_KEY] = {"id": chart_id, "shown_to_user": True}
+                    self.__record_chart_savings(function_name, chart)
+                    yield format_sse(chart, event="graph")
+                tool_results[position] = (function_name, tool_result)
+
+            if self.__chain_responses and response_id:
+                # Send results as function_call_output items against the response that asked for them
+                turn.previous_response_id = response_id
+                turn.tool_outputs = [
+                    {
+                        "type": "function_call_output",
+                        "call_id": tool_call["call_id"],
+                        "output": json.dumps(tool_result, default=str),
                     }
-
-            if chunk.type == "response.function_call_arguments.delta":
-                # Handles custom tool call chunks
-                print(f"Tool Chunk: {chunk}\n\n")
-                index = chunk.output_index
-                content = chunk.delta
-                # Correctly append to the arguments string
-                if index in final_tool_calls:
-                    final_tool_calls[index]["function"]["arguments"] += content
-
-            if chunk.type == "response.output_text.delta":
-                # Handles text response
-                print(f"\nText Chunk: {chunk} \n")
-                content = chunk.delta
-                full_response += content
-                yield f"data: {json.dumps({'content': content})}\n\n"
-
-        if final_tool_calls:
-            print(f"\nProcessing tools in current chain: {final_tool_calls}")
-            current_chain_context = (
-                context.copy() if context is not None else []
-            )  # Keep context only within this chain
-
-            for index, tool_call in final_tool_calls.items():
-                function_name = tool_call["function"]["name"]
-                try:
-                    arguments = json.loads(tool_call["function"]["arguments"])
-                    tool_result = await self.__execute_tool(function_name, arguments)
-                    print(f"\nTool results: {tool_result}\n")
-
+                    for tool_call, (_, tool_result) in zip(final_tool_calls.values(), tool_results)
+                ]
+            else:
+                for function_name, tool_result in tool_results:
                     if tool_result:
                         # Add new tool result to the current chain's context
-                        current_chain_context.append(
-                            f"Result from {function_name}: {str(tool_result)}"
-                        )
-
-                        # Recursive call with current chain's context
-                        async for response_chunk in self.__generate_response(
-                            message=message,  # Keep original message
-                            history=history,
-                            user_id=user_id,
-                            session_id=session_id,
-                            context=current_chain_context,
-                        ):
-                            yield response_chunk
-
-                except json.JSONDecodeError:
-                    print(
-                        f"Failed to parse tool arguments: {tool_call['function']['arguments']}"
-                    )
-                    continue
-
-        # Only save and finish when we have no more tool calls
-        if not final_tool_calls:
+                        turn.context.append(f"Result from {function_name}: {str(tool_result)}")
+
+        await self.__save_answer(turn, parser, user_id, session_id)
+        # Only a complete answer straight from the model, with no tools involved, can be reused
+        tool_free = turn.hops == 1 and turn.limit_reached is None and not turn.web_searches
+        response_cache = self.__response_cache
+        if response_cache is not None and turn.cache_key is not None and tool_free and parser.result() is not None:
+            response_cache.put(turn.cache_key, parser.raw_text())
+
+        turn.completed = True
+        yield SSE_DONE
+
+    async def __replay_cached(self, turn: AgentTurn, user_id: str, session_id: str):
+        """Streams a cached answer in model-sized deltas, then saves it like a live answer"""
+        text = turn.cached_response or ""
+        turn.parser = parser = ResponseStreamParser()
+        turn.trace.event("cache_hit", level=logging.INFO, chars=len(text))
+        for i in range(0, len(text), REPLAY_CHUNK_CHARS):
+            for frame in self.__text_frames(turn, parser, text[i:i + REPLAY_CHUNK_CHARS]):
+                yield frame
+
+        await self.__save_answer(turn, parser, user_id, session_id)
+        turn.completed = True
+        yield SSE_DONE
+
+    @staticmethod
+    async def __until(stream, deadline: float) -> AsyncGenerator[Any, None]:
+        """Iterates a stream, raising asyncio.TimeoutError once the loop clock passes the deadline"""
+        if stream is None:
+            raise asyncio.TimeoutError
+        loop = asyncio.get_running_loop()
+        iterator = stream.__aiter__()
+        while True:
             try:
-                # First try to parse as JSON in case the response is structured
-                dict_response = json.loads(full_response)
-                final_message = dict_response.get("message", "")
-                print(f"\nFinal message with no more tool calls: {final_message}\n")
-                if final_message:
-                    await self.__save_message(
-                        user_id=user_id,
-                        session_id=session_id,
-                        message_type=MessageOwner.AI,
-                        message_content=final_message,
-                        graph_data=dict_response.get("graph", None),
-                    )
-            except json.JSONDecodeError:
-                # If it's not valid JSON, just use the raw response as the message
-                print(f"\nFinal message (not JSON): {full_response}\n")
-                if full_response:
-                    await self.__save_message(
-                        user_id=user_id,
-                        session_id=session_id,
-                        message_type=MessageOwner.AI,
-                        message_content=full_response,
-                        graph_data=None,
-                    )
+                chunk = await asyncio.wait_for(iterator.__anext__(), max(0.0, deadline - loop.time()))
+            except StopAsyncIteration:
+                return
+            yield chunk
+
+    @staticmethod
+    def __text_frames(turn: AgentTurn, parser: ResponseStreamParser, content: str) -> List[Union[str, SSEDelta]]:
+        """Feeds a text delta to the turn's parser and returns the frames to send for it"""
+        events = parser.feed(content)
+        if not turn.stream_events:
+            return [SSEDelta(content, field="content")]
+        frames: List[Union[str, SSEDelta]] = []
+        for event, data in events:
+            if event == "graph" and "series_ref" in data:
+                # The referenced chart was already sent when the tool returned it
+                continue
+            if event == "message.delta":
+                frames.append(SSEDelta(data, event=event))
+            else:
+                frames.append(format_sse(data, event=event))
+        return frames
+
+    async def __save_answer(self, turn: AgentTurn, parser: ResponseStreamParser, user_id: str, session_id: str):
+        """Saves the turn's final answer from its parser"""
+        # The parser has already built the structured response, so there is nothing to re-parse
+        dict_response = parser.result()
+        if dict_response is not None:
+            final_message = dict_response.get("message", "")
+            turn.trace.event("answer", chars=len(final_message), graph="graph" in dict_response)
+            if final_message:
+                await self.__save_message(
+                    user_id=user_id,
+                    session_id=session_id,
+                    message_type=MessageOwner.AI,
+                    message_content=final_message,
+                    graph_data=self.__resolve_graph(dict_response.get("graph", None), turn.charts),
+                )
+        else:
+            # If it's not valid JSON, just use the raw response as the message; a JSON answer cut
+            # off at the deadline keeps the message text streamed so far
+            full_response = parser.partial_message()
+            turn.trace.event("answer", level=logging.WARNING, chars=len(full_response), json=False)
+            if full_response:
+                await self.__save_message(
+                    user_id=user_id,
+                    session_id=session_id,
+                    message_type=MessageOwner.AI,
+                    message_content=full_response,
+                    graph_data=self.__resolve_graph(None, turn.charts),
+                )
+
+    async def __run_tools(
+        self, turn: AgentTurn, tool_calls: List[Dict[str, Any]], user_id: str
+    ) -> List[Tuple[str, Any]]:
+        """
+        Runs a hop's tool calls concurrently, within the tool calls and time the turn has left.
+        Calls past either limit aren't run, and the model gets an error result for them instead.
+        Cancelling the turn cancels the gather, which cancels every tool still running.
+        """
+        timeout = min(self.__tool_timeout, turn.remaining())
+        runnable = tool_calls[:turn.tool_allowance()] if timeout > 0 else []
+        turn.tool_calls += len(runnable)
 
-            yield "data: [DONE]\n\n"
+        results = list(
+            await asyncio.gather(
+                *(self.__run_tool_call(tool_call, user_id, timeout, turn.trace) for tool_call in runnable)
+            )
+        )
+        reason = "its tool call limit" if timeout > 0 else "its time limit"
+        results.extend(
+            (tool_call["function"]["name"], f"Error: not run, this turn reached {reason}")
+            for tool_call in tool_calls[len(runnable):]
+        )
+        return results
+
+    def __record_chart_savings(self, function_name: str, chart: GraphResponse):
+        """Records the output tokens and stream time a directly delivered chart saved"""
+        tokens = count_json_tokens(chart)
+        CHARTS_DELIVERED.inc(tool=function_name)
+        CHART_TOKENS_SAVED.inc(tokens)
+        CHART_SECONDS_SAVED.observe(tokens / self.__output_token_rate)
+
+    @staticmethod
+    def __resolve_graph(graph: Optional[Dict[str, Any]], charts: Dict[str, GraphResponse]) -> Optional[GraphResponse]:
+        """
+        Returns the graph to persist for the final message. A series_ref resolves to the tool chart
+        it names, and when the model sent no graph the last chart shown to the user is kept.
+        """
+        if isinstance(graph, dict) and "series_ref" in graph:
+            return charts.get(graph["series_ref"]) or (list(charts.values())[-1] if charts else None)
+        if graph is None and charts:
+            return list(charts.values())[-1]
+        return as_graph(graph)
 
     async def __save_message(
         self,
@@ -213,10 +747,11 @@ class AgentService:
         message_type: MessageOwner,
         message_content: str,
         graph_data: Optional[GraphResponse] = None,
+        aborted: bool = False,
     ):
         """This method is responsible for saving chats to the database"""
         timestamp = datetime.now(timezone.utc).isoformat()
-        item = {
+        item: Dict[str, Any] = {
             "message_id": str(uuid.uuid4()),
             "user_id": str(user_id),
             "session_id": str(session_id),
@@ -227,18 +762,24 @@ class AgentService:
 
         if graph_data:
             item["graph_data"] = json.dumps(graph_data)
+        if aborted:
+            # The client disconnected before the answer finished
+            item["aborted"] = True
+
+        await self.__chat_log_writer.save(item)
 
-        self.__db.put_item(Item=item)
+        role = FormattedMessageOwner.USER if message_type == MessageOwner.USER else FormattedMessageOwner.ASSISTANT
+        self.__history_store.append(user_id, session_id, {"role": role.value, "content": item["message_content"]})
         return item
 
-    def __get_params(self, history: List[ChatMessage], message: str):
+    def __get_params(self, history: List[FormattedChatMessage], message: str):
         """Returns params for Completion API call"""
         params: Dict[str, Any] = {
             "model": self.__model,
             "instructions": self.__system_prompt,
             "input": [
                 # {"role": "developer", "content": self.__system_prompt},
-                *format_history(history),
+                *history,
                 {"role": "user", "content": message},
             ],
             # "text": {
@@ -253,15 +794,106 @@ class AgentService:
 
         return params
 
-    async def __execute_tool(self, function_name, args):
+    def __get_hop_params(self, turn: AgentTurn, final: bool):
+        """
+        Returns params for the turn's next model hop, with tools disabled on a forced final hop
+        and narrowed to the turn's tool groups when tool selection is on
+        """
+        if turn.previous_response_id and turn.tool_outputs:
+            params = self.__get_chained_params(turn.previous_response_id, turn.tool_outputs)
+        else:
+            # Only combine tool context with the message if we're in a tool chain
+            message = turn.message
+            if turn.context:
+                message = (
+                    f"Based on this context: {' '.join(turn.context)}\n\n"
+                    f"Please provide a response to the original question: {turn.message}"
+                )
+            params = self.__get_params(message=message, history=turn.history)
+
+        if turn.route is not None:
+            params["model"] = turn.route.model
+            params["max_output_tokens"] = turn.route.max_output_tokens
+        if final:
+            params["tool_choice"] = "none"
+            params["input"] = [*params["input"], {"role": "developer", "content": FORCED_ANSWER_PROMPT}]
+        tool_selector = self.__tool_selector
+        if tool_selector is not None and turn.tool_groups is not None:
+            tool_set = tool_selector.for_hop(turn.tool_groups, turn.tools_used)
+            turn.tool_tokens_saved.append(tool_selector.full_tokens - tool_set.tokens)
+            params["tools"] = tool_set.tools
+            if not tool_set.tools:
+                del params["tools"]
+                del params["tool_choice"]
+        return params
+
+    def __get_chained_params(self, previous_response_id: str, tool_outputs: List[Dict[str, Any]]):
+        """
+        Returns params for a follow-up call that continues a stored response.
+        Instructions and tools are not carried over by previous_response_id, so they are resent.
+        """
+        params: Dict[str, Any] = {
+            "model": self.__model,
+            "instructions": self.__system_prompt,
+            "previous_response_id": previous_response_id,
+            "input": tool_outputs,
+            "tools": self.__tools,
+            "tool_choice": "auto",
+            "stream": True,
+            "max_output_tokens": 4096,
+        }
+
+        return params
+
+    async def __run_tool_call(
+        self, tool_call: Dict[str, Any], user_id: str, timeout: float, trace: Trace
+    ) -> Tuple[str, Any]:
+        """Parses and executes a single tool call, returning errors as the tool result"""
+        function_name = tool_call["function"]["name"]
+        try:
+            arguments = json.loads(tool_call["function"]["arguments"])
+        except json.JSONDecodeError:
+            logger.warning(f"Failed to parse arguments for {function_name}: {tool_call['function']['arguments']}")
+            TOOL_SECONDS.observe(0, tool=function_name, status="bad_arguments")
+            return function_name, f"Error: could not parse arguments for {function_name}"
+
+        start = time.perf_counter()
+        with trace.span("tool_call", tool=function_name) as span:
+            try:
+                result = await asyncio.wait_for(
+                    self.__execute_tool(function_name, arguments, user_id),
+                    timeout=timeout,
+                )
+                status = "ok"
+            except asyncio.TimeoutError:
+                result = f"Error: {function_name} timed out after {timeout:.1f} seconds"
+                status = "timeout"
+            except Exception as e:  # pylint: disable=W0718
+                result = f"Error: {function_name} failed: {e}"
+                status = "error"
+            span.set(status=status)
+
+        TOOL_SECONDS.observe(time.perf_counter() - start, tool=function_name, status=status)
+        return function_name, result
+
+    async def __execute_tool(self, function_name, args, user_id):
         """
         Execute the tool function based on its name and arguments.
+        Blocking tools run in a worker thread so parallel calls don't stall the event loop,
+        and CPU-heavy simulations run in the process pool.
         """
         if function_name == "calculate_compound_interest":
-            return calculate_compound_interest(**args)
+            return await asyncio.to_thread(calculate_compound_interest, **args)
+        if function_name == "compare_compound_interest":
+            return await asyncio.to_thread(compare_compound_interest, **args)
+        if function_name == "simulate_portfolio":
+            return await asyncio.get_running_loop().run_in_executor(
+                self.__process_pool,
+                partial(simulate_portfolio, **args, cpu_time_limit=self.__simulation_cpu_limit),
+            )
         if function_name == "get_acct_details":
-            return get_acct_details(**args)
+            return await self.__financial_connections_service.get_acct_details(**args, user_id=user_id)
         if function_name == "get_transaction_details":
-            return get_transaction_details(**args)
+            return await self.__financial_connections_service.get_transaction_details(**args, user_id=user_id)
 
         return f"Unknown function: {function_name}"
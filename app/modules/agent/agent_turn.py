@@ -0,0 +1,118 @@
+"""This module contains the state of a single agent turn"""
+
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+from app.modules.model_router import RouteDecision
+from app.utils import TRACER, FormattedChatMessage, GraphResponse, ResponseStreamParser, Trace
+
+
+class TurnLimits:
+    """
+    Limits on how much work a single turn may do before it has to answer.
+
+    Model hops are cut off at the deadline too. The forced final answer gets at least
+    `final_answer_timeout` seconds, so a turn never runs past deadline + final_answer_timeout.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        deadline: float = 60.0,
+        max_hops: int = 6,
+        max_tool_calls: int = 16,
+        token_budget: int = 60000,
+        final_answer_timeout: float = 15.0,
+    ):
+        self.deadline = deadline
+        self.max_hops = max(1, max_hops)
+        self.max_tool_calls = max_tool_calls
+        self.token_budget = token_budget
+        self.final_answer_timeout = final_answer_timeout
+
+
+class AgentTurn:
+    """
+    State of one user message as it moves through model hops and tool calls.
+
+    The agent loop alternates between a model hop and running the tools it asked for, until the
+    model answers or a limit runs out. Once a limit runs out the next hop is the last, and is
+    made with tools disabled so the model answers with what it already has.
+    """
+
+    # pylint: disable=R0902,R0913
+    def __init__(
+        self,
+        message: str,
+        history: List[FormattedChatMessage],
+        context: Optional[List[str]],
+        stream_events: bool,
+        limits: TurnLimits,
+        trace: Optional[Trace] = None,
+    ):
+        self.message = message
+        self.history = history
+        # Tool results for the rebuilt prompt, when responses aren't chained
+        self.context = list(context) if context else []
+        self.stream_events = stream_events
+        self.limits = limits
+        self.trace = trace or TRACER.start_trace()
+
+        # Chained follow-ups answer the previous response with function_call_output items
+        self.previous_response_id: Optional[str] = None
+        self.tool_outputs: List[Dict[str, Any]] = []
+        self.charts: Dict[str, GraphResponse] = {}
+        # Set when the turn may be answered from, or stored in, the response cache
+        self.cache_key: Optional[str] = None
+        self.cached_response: Optional[str] = None
+        self.web_searches = 0
+        # The model tier and output budget chosen by the router, when routing is on
+        self.route: Optional[RouteDecision] = None
+        # The tool groups chosen for the turn, the tools its hops called and the tool tokens each hop left out
+        self.tool_groups: Optional[FrozenSet[str]] = None
+        self.tools_used: Set[str] = set()
+        self.tool_tokens_saved: List[int] = []
+
+        self.stage = "model"
+        self.parser: Optional[ResponseStreamParser] = None
+        self.hops = 0
+        self.tool_calls = 0
+        self.tokens_used = 0
+        self.output_deltas = 0
+        self.limit_reached: Optional[str] = None
+        self.completed = False
+        self.frames_sent = 0
+        self.started_at = time.monotonic()
+        # One entry per model hop or tool batch, in order
+        self.timings: List[Dict[str, Any]] = []
+
+    def remaining(self) -> float:
+        """Seconds left before the turn's deadline"""
+        return self.limits.deadline - (time.monotonic() - self.started_at)
+
+    def check_limits(self) -> Optional[str]:
+        """Returns the first limit the turn has run out of, keeping the last hop for the answer"""
+        if self.limit_reached is None:
+            if self.remaining() <= 0:
+                self.limit_reached = "deadline"
+            elif self.hops >= self.limits.max_hops - 1:
+                self.limit_reached = "hops"
+            elif self.tool_calls >= self.limits.max_tool_calls:
+                self.limit_reached = "tool_calls"
+            elif self.tokens_used >= self.limits.token_budget:
+                self.limit_reached = "tokens"
+        return self.limit_reached
+
+    def hop_timeout(self, final: bool) -> float:
+        """Seconds the next model hop may take, with the final answer's grace period"""
+        if final:
+            return max(self.remaining(), self.limits.final_answer_timeout)
+        return max(0.0, self.remaining())
+
+    def tool_allowance(self) -> int:
+        """How many more tool calls the turn may run"""
+        return max(0, self.limits.max_tool_calls - self.tool_calls)
+
+    def record(self, phase: str, seconds: float, **details: Any):
+        """Records how long one hop or tool batch took"""
+        self.timings.append({"phase": phase, "seconds": round(seconds, 4), **details})
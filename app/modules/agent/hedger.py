@@ -0,0 +1,149 @@
+"""Hedged stream creation for the first model hop"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Optional, Set, Tuple
+
+from app.utils import METRICS
+
+HEDGES = METRICS.counter(
+    "agent_hedges_total",
+    "First hops by hedging outcome: fast, warming_up, over_budget, primary_won or hedge_won",
+)
+FIRST_EVENT = METRICS.histogram(
+    "agent_first_event_seconds",
+    "Time from starting the first hop to its first stream event, by whether a hedge was sent",
+    buckets=(0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10),
+)
+HEDGE_THRESHOLD = METRICS.gauge("agent_hedge_threshold_seconds", "Wait before a first hop is hedged")
+
+# (stream, its iterator, the first event or None if the stream was empty)
+FirstEvent = Tuple[Any, AsyncIterator[Any], Optional[Any]]
+
+
+class HedgedStream:
+    """The stream that won the race, replaying the event that decided it before the rest"""
+
+    def __init__(self, stream, iterator: AsyncIterator[Any], first_event: Optional[Any]):
+        self.__stream = stream
+        self.__iterator = iterator
+        self.__first_event = first_event
+
+    def __aiter__(self):
+        return self.__iterate()
+
+    async def __iterate(self):
+        if self.__first_event is None:
+            return
+        yield self.__first_event
+        async for event in self.__iterator:
+            yield event
+
+    async def close(self):
+        """Closes the underlying stream"""
+        await self.__stream.close()
+
+
+class Hedger:
+    """
+    Races a second, identical stream against a first hop whose first event is late.
+
+    The hedge goes out once the first hop has waited longer than the p95 of recent first-event
+    times, or `min_delay` if that is longer. Whichever stream produces an event first is kept and
+    the other is closed. Each first hop earns `budget` hedges, banked up to `max_burst`, which caps
+    the extra upstream load at that share of calls. No hedges are sent until `min_samples` first
+    events have been seen.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        budget: float = 0.05,
+        min_delay: float = 0.25,
+        max_burst: float = 5.0,
+        window: int = 256,
+        min_samples: int = 20,
+    ):
+        self.__budget = budget
+        self.__min_delay = min_delay
+        self.__max_burst = max_burst
+        self.__min_samples = min_samples
+        self.__credit = 0.0
+        self.__samples: Deque[float] = deque(maxlen=window)
+        self.__threshold: Optional[float] = None
+        self.__stale = 0
+        self.__closing: Set["asyncio.Task[None]"] = set()
+
+    @property
+    def threshold(self) -> Optional[float]:
+        """Seconds a first hop may wait before it is hedged, None while warming up"""
+        if len(self.__samples) < self.__min_samples:
+            return None
+        if self.__threshold is None or self.__stale >= 16:
+            ordered = sorted(self.__samples)
+            self.__threshold = max(self.__min_delay, ordered[int(len(ordered) * 0.95) - 1])
+            self.__stale = 0
+            HEDGE_THRESHOLD.set(self.__threshold)
+        return self.__threshold
+
+    async def create(self, create: Callable[[], Awaitable[Any]]) -> HedgedStream:
+        """Creates the stream with `create`, hedging with a second call if its first event is late"""
+        self.__credit = min(self.__max_burst, self.__credit + self.__budget)
+        started = time.monotonic()
+        threshold = self.threshold
+        primary = asyncio.create_task(self.__first_event(create))
+        tasks = [primary]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if done or threshold is None or self.__credit < 1:
+                HEDGES.inc(outcome="fast" if done else "warming_up" if threshold is None else "over_budget")
+                winner = primary
+                return self.__finish(await primary, started, hedged=False)
+
+            self.__credit -= 1
+            hedge = asyncio.create_task(self.__first_event(create))
+            tasks.append(hedge)
+            pending = set(tasks)
+            while winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in tasks if task in done and not task.exception()), None)
+                if winner is None and not pending:
+                    # Both failed, so raise what the unhedged call would have
+                    return self.__finish(primary.result(), started, hedged=True)
+            HEDGES.inc(outcome="hedge_won" if winner is hedge else "primary_won")
+            return self.__finish(winner.result(), started, hedged=True)
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    self.__discard(task)
+
+    def __finish(self, first: FirstEvent, started: float, hedged: bool) -> HedgedStream:
+        seconds = time.monotonic() - started
+        self.__samples.append(seconds)
+        self.__stale += 1
+        FIRST_EVENT.observe(seconds, hedged=str(hedged).lower())
+        return HedgedStream(*first)
+
+    @staticmethod
+    async def __first_event(create: Callable[[], Awaitable[Any]]) -> FirstEvent:
+        stream = await create()
+        iterator = stream.__aiter__()
+        try:
+            return stream, iterator, await iterator.__anext__()
+        except StopAsyncIteration:
+            return stream, iterator, None
+        except BaseException:
+            await stream.close()
+            raise
+
+    def __discard(self, task: "asyncio.Task[FirstEvent]"):
+        """Cancels a losing attempt, closing its stream if it already has one"""
+        if not task.done():
+            task.cancel()
+            return
+        if not task.cancelled() and task.exception() is None:
+            closing = asyncio.create_task(task.result()[0].close())
+            self.__closing.add(closing)
+            closing.add_done_callback(self.__closing.discard)
@@ -0,0 +1,3 @@
+"""All chat log persistence functionality"""
+
+from app.modules.chat_log.chat_log_writer import ChatLogWriter
@@ -0,0 +1,137 @@
+"""This module contains the write-behind queue used to persist chat logs"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from app.utils import METRICS, TRACER
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 25  # DynamoDB batch_write_item limit
+
+QUEUE_DEPTH = METRICS.gauge("chat_log_queue_depth", "Chat log items waiting to be written")
+FLUSH_LATENCY = METRICS.histogram("chat_log_flush_seconds", "Time taken to flush one chat log batch")
+ITEMS_WRITTEN = METRICS.counter("chat_log_items_written_total", "Chat log items written to DynamoDB")
+ITEMS_DROPPED = METRICS.counter("chat_log_items_dropped_total", "Chat log items dropped after exhausting retries")
+
+
+class ChatLogWriter:
+    """
+    Persists chat log items without blocking the event loop.
+
+    Items are queued and flushed in batch_write_item groups once either the batch is full or the
+    flush window has elapsed. In durable mode every save is written before it returns instead.
+    """
+
+    def __init__(
+        self,
+        dynamodb,
+        table_name: str,
+        durable: bool = False,
+        batch_size: int = MAX_BATCH_SIZE,
+        flush_interval: float = 0.05,
+        max_retries: int = 5,
+    ):
+        self.__dynamodb = dynamodb
+        self.__table_name = table_name
+        self.__table = dynamodb.Table(table_name)
+        self.__durable = durable
+        self.__batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.__flush_interval = flush_interval
+        self.__max_retries = max_retries
+        self.__queue: Optional[asyncio.Queue] = None
+        self.__worker: Optional[asyncio.Task] = None
+        self.__closed = False
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of items waiting to be flushed"""
+        return self.__queue.qsize() if self.__queue else 0
+
+    async def save(self, item: Dict[str, Any]):
+        """Queues an item for writing, or writes it immediately in durable mode"""
+        if self.__durable or self.__closed:
+            with TRACER.span("dynamodb_write", table=self.__table_name, items=1, mode="put"):
+                await asyncio.to_thread(self.__table.put_item, Item=item)
+            ITEMS_WRITTEN.inc()
+            return item
+
+        if self.__worker is None:
+            self.__queue = asyncio.Queue()
+            self.__worker = asyncio.create_task(self.__run())
+
+        assert self.__queue is not None
+        self.__queue.put_nowait(item)
+        QUEUE_DEPTH.set(self.queue_depth)
+        return item
+
+    async def close(self):
+        """Flushes everything still queued and stops the worker"""
+        self.__closed = True
+        if self.__worker is None or self.__queue is None:
+            return
+        self.__queue.put_nowait(None)
+        await self.__worker
+        self.__worker = None
+
+    async def __run(self):
+        """Collects queued items into batches until a shutdown sentinel is seen"""
+        assert self.__queue is not None
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            item = await self.__queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.__flush_interval
+            while len(batch) < self.__batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    if timeout > 0:
+                        next_item = await asyncio.wait_for(self.__queue.get(), timeout)
+                    else:
+                        next_item = self.__queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if next_item is None:
+                    stopping = True
+                    break
+                batch.append(next_item)
+
+            QUEUE_DEPTH.set(self.queue_depth)
+            with TRACER.span("dynamodb_write", table=self.__table_name, items=len(batch), mode="batch") as span:
+                span.set(dropped=await self.__flush(batch))
+
+    async def __flush(self, batch: List[Dict[str, Any]]) -> int:
+        """Writes one batch, retrying any unprocessed items with backoff, and returns how many were dropped"""
+        start = time.perf_counter()
+        requests = [{"PutRequest": {"Item": item}} for item in batch]
+
+        for attempt in range(self.__max_retries + 1):
+            try:
+                response = await asyncio.to_thread(
+                    self.__dynamodb.batch_write_item,
+                    RequestItems={self.__table_name: requests},
+                )
+                unprocessed = response.get("UnprocessedItems", {}).get(self.__table_name, [])
+            except Exception as e:  # pylint: disable=W0718
+                logger.warning(f"Chat log batch write failed on attempt {attempt + 1}: {e}")
+                unprocessed = requests
+
+            ITEMS_WRITTEN.inc(len(requests) - len(unprocessed))
+            requests = unprocessed
+            if not requests:
+                break
+            await asyncio.sleep(min(0.05 * 2**attempt, 2.0))
+
+        if requests:
+            logger.error(f"Dropping {len(requests)} chat log items after {self.__max_retries} retries")
+            ITEMS_DROPPED.inc(len(requests))
+
+        FLUSH_LATENCY.observe(time.perf_counter() - start)
+        return len(requests)
@@ -0,0 +1,3 @@
+"""All context window functionality"""
+
+from app.modules.context_window.context_window_service import ContextWindowService
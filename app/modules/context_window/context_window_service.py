@@ -0,0 +1,210 @@
+"""This module keeps the prompt sent to the model inside a token budget"""
+
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.utils import (
+    CONTEXT_SUMMARY_PROMPT,
+    METRICS,
+    FormattedChatMessage,
+    FormattedMessageOwner,
+    count_json_tokens,
+    count_message_tokens,
+    count_tokens,
+)
+
+logger = logging.getLogger(__name__)
+
+TOKENS_SAVED = METRICS.histogram(
+    "context_tokens_saved",
+    "Input tokens removed from a request by folding history into a summary",
+    buckets=(0, 100, 500, 1000, 2500, 5000, 10000, 25000, 50000),
+)
+SUMMARY_UPDATES = METRICS.counter(
+    "context_summary_updates_total", "Rolling summary updates by kind: initial, incremental, cached or pending"
+)
+
+
+class ContextWindowService:
+    """
+    Fits session history into an input token budget.
+
+    When the instructions, tools, message and history don't fit, the oldest turns are folded into
+    a rolling summary. Summaries are cached per session along with how many messages they cover,
+    so each turn only summarizes the messages that newly fell out of the window.
+
+    Summaries are never waited on: when the cached one is missing or behind, the turn is sent the
+    truncated history, with the older summary if there is one, while the summary is refreshed in
+    the background for the next turn.
+
+    Token counts are cached per message, so each turn only tokenizes the messages it hasn't seen.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        openai,
+        instructions: str,
+        tools: List[Dict[str, Any]],
+        max_input_tokens: int,
+        summary_model: str = "gpt-4o-mini",
+        min_recent_messages: int = 2,
+        max_sessions: int = 1000,
+        max_cached_messages: int = 20000,
+    ):
+        self.__openai = openai
+        self.__summary_model = summary_model
+        self.__max_input_tokens = max_input_tokens
+        self.__min_recent_messages = min_recent_messages
+        self.__max_sessions = max_sessions
+        self.__max_cached_messages = max_cached_messages
+        self.__fixed_tokens = count_tokens(instructions) + count_json_tokens(tools)
+        # session_id -> (messages covered, fingerprint of the last covered message, summary)
+        self.__summaries: "OrderedDict[str, Tuple[int, str, str]]" = OrderedDict()
+        # Background summary refreshes, at most one per session
+        self.__refreshing: Dict[str, "asyncio.Task[None]"] = {}
+        # (role, content) -> tokens, including the per-message overhead
+        self.__message_tokens: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+
+    async def fit(
+        self,
+        session_id: str,
+        history: List[FormattedChatMessage],
+        message: str,
+    ) -> Tuple[List[FormattedChatMessage], int]:
+        """Returns the history to send for this turn and the number of tokens it saved"""
+        budget = self.__max_input_tokens - self.__fixed_tokens - count_tokens(message)
+        message_tokens = [self.__count(item) for item in history]
+        full_tokens = sum(message_tokens)
+        if full_tokens <= budget:
+            TOKENS_SAVED.observe(0)
+            return list(history), 0
+
+        # Keep as many recent messages as fit, leaving room for the summary itself. When the
+        # summary has to be updated, fold down to half that so the next few turns reuse it.
+        keep_budget = budget - budget // 4
+        split = self.__split(message_tokens, keep_budget)
+        fold_split = max(split, self.__split(message_tokens, keep_budget // 2))
+
+        if split == 0:
+            TOKENS_SAVED.observe(0)
+            return list(history), 0
+
+        summary, covered = self.__get_summary(session_id, history)
+        if covered >= split and summary:
+            SUMMARY_UPDATES.inc(kind="cached")
+        else:
+            self.__schedule_refresh(session_id, history, covered, summary, fold_split)
+            # Messages past the summary that don't fit are dropped until the refresh lands
+            covered = split
+        if not summary:
+            TOKENS_SAVED.observe(sum(message_tokens[:covered]))
+            return list(history[covered:]), sum(message_tokens[:covered])
+
+        summary_message: FormattedChatMessage = {
+            "role": FormattedMessageOwner.DEVELOPER,
+            "content": f"Summary of the earlier conversation: {summary}",
+        }
+        fitted = [summary_message, *history[covered:]]
+        saved = max(0, full_tokens - count_message_tokens([summary_message]) - sum(message_tokens[covered:]))
+        TOKENS_SAVED.observe(saved)
+        return fitted, saved
+
+    def __count(self, message: FormattedChatMessage) -> int:
+        """Returns a message's tokens, tokenizing it only the first time it's seen"""
+        key = (message["role"], message["content"])
+        tokens = self.__message_tokens.get(key)
+        if tokens is None:
+            tokens = count_message_tokens([message])
+            self.__message_tokens[key] = tokens
+            while len(self.__message_tokens) > self.__max_cached_messages:
+                self.__message_tokens.popitem(last=False)
+        else:
+            self.__message_tokens.move_to_end(key)
+        return tokens
+
+    def __split(self, message_tokens: List[int], keep_budget: int) -> int:
+        """Returns the index of the oldest message kept when keeping at most `keep_budget` tokens"""
+        kept_tokens = 0
+        split = len(message_tokens)
+        while split > 0:
+            required = len(message_tokens) - split < self.__min_recent_messages
+            if not required and kept_tokens + message_tokens[split - 1] > keep_budget:
+                break
+            split -= 1
+            kept_tokens += message_tokens[split]
+        return split
+
+    def __get_summary(self, session_id: str, history: List[FormattedChatMessage]) -> Tuple[Optional[str], int]:
+        """Returns the session's cached summary, if it still matches the history, and how many messages it covers"""
+        covered, fingerprint, summary = self.__summaries.get(session_id, (0, "", ""))
+        if covered and (covered > len(history) or self.__fingerprint(history[covered - 1]) != fingerprint):
+            # History was rewritten since the summary was made
+            return None, 0
+        if summary:
+            self.__summaries.move_to_end(session_id)
+        return summary or None, covered
+
+    def __schedule_refresh(
+        self,
+        session_id: str,
+        history: List[FormattedChatMessage],
+        covered: int,
+        summary: Optional[str],
+        fold_split: int,
+    ):
+        """Starts folding messages up to `fold_split` into the summary, unless a refresh is already running"""
+        if session_id in self.__refreshing:
+            SUMMARY_UPDATES.inc(kind="pending")
+            return
+        task = asyncio.create_task(
+            self.__refresh(
+                session_id,
+                summary or "",
+                list(history[covered:fold_split]),
+                fold_split,
+                self.__fingerprint(history[fold_split - 1]),
+                incremental=bool(summary),
+            )
+        )
+        self.__refreshing[session_id] = task
+        task.add_done_callback(lambda _: self.__refreshing.pop(session_id, None))
+
+    # pylint: disable=R0913
+    async def __refresh(
+        self,
+        session_id: str,
+        summary: str,
+        messages: List[FormattedChatMessage],
+        covered: int,
+        fingerprint: str,
+        incremental: bool,
+    ):
+        try:
+            summary = await self.__summarize(summary, messages)
+        except Exception as e:  # pylint: disable=W0718
+            logger.warning(f"Failed to update summary for session {session_id}, dropping old turns: {e}")
+            return
+
+        SUMMARY_UPDATES.inc(kind="incremental" if incremental else "initial")
+        self.__summaries[session_id] = (covered, fingerprint, summary)
+        self.__summaries.move_to_end(session_id)
+        while len(self.__summaries) > self.__max_sessions:
+            self.__summaries.popitem(last=False)
+
+    async def __summarize(self, summary: str, messages: List[FormattedChatMessage]) -> str:
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        response = await self.__openai.responses.create(
+            model=self.__summary_model,
+            instructions=CONTEXT_SUMMARY_PROMPT,
+            input=f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}",
+            max_output_tokens=400,
+        )
+        return response.output_text.strip()
+
+    @staticmethod
+    def __fingerprint(message: FormattedChatMessage) -> str:
+        return hashlib.sha1(f"{message['role']}:{message['content']}".encode()).hexdigest()
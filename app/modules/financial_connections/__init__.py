@@ -0,0 +1,6 @@
+"""All financial connections functionality"""
+
+from app.modules.financial_connections.financial_connections_service import (
+    FinancialConnectionsService,
+)
+from app.modules.financial_connections.lookup_cache import CircuitOpenError, LookupCache
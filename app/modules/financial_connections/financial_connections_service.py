@@ -0,0 +1,153 @@
+"""This module contains the client used by the agent tools to reach the financial connections API"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class FinancialConnectionsService:
+    """
+    Looks up accounts and transactions over a shared, keep-alive HTTP connection pool.
+
+    Lookups for many IDs fan out concurrently, bounded both per call and per upstream host. When
+    batch endpoints are enabled, IDs are instead sent in groups to `/{resource}/batch`. An optional
+    LookupCache serves repeat lookups without going upstream.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        api_url: Optional[str],
+        max_connections: int = 100,
+        max_per_host: int = 20,
+        max_fan_out: int = 10,
+        timeout: float = 10.0,
+        use_batch_endpoints: bool = False,
+        batch_size: int = 50,
+        cache=None,
+    ):
+        self.__api_url = api_url.rstrip("/") if api_url else None
+        self.__max_per_host = max_per_host
+        self.__max_fan_out = max_fan_out
+        self.__use_batch_endpoints = use_batch_endpoints
+        self.__batch_size = batch_size
+        self.__cache = cache
+        self.__host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.__client = httpx.AsyncClient(
+            headers={"Content-Type": "application/json"},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+
+    async def get_acct_details(self, acct_ids: List[str], user_id: str = "") -> List[Dict[str, Any]]:
+        """
+        Retrieves detailed account information for multiple accounts.
+
+        Args:
+            acct_ids (List[str]): A list of unique account IDs to retrieve details for.
+            user_id (str): The user the lookup is made for, used to scope cached entries.
+
+        Returns:
+            List[dict]: Account details, with balances converted from cents to dollars.
+
+        Raises:
+            httpx.HTTPStatusError: If any API request fails.
+            httpx.RequestError: For other request-related errors.
+            OSError: If API_URL is not configured.
+        """
+        return await self.__lookup("accounts", acct_ids, user_id, self.__load_accounts)
+
+    async def get_transaction_details(self, transaction_ids: List[str], user_id: str = "") -> List[Dict[str, Any]]:
+        """
+        Retrieves detailed transaction information for multiple transactions.
+
+        Args:
+            transaction_ids (List[str]): A list of unique transaction IDs to retrieve details for.
+            user_id (str): The user the lookup is made for, used to scope cached entries.
+
+        Returns:
+            List[dict]: Transaction details, with amounts converted from cents to dollars.
+
+        Raises:
+            httpx.HTTPStatusError: If any API request fails.
+            httpx.RequestError: For other request-related errors.
+            OSError: If API_URL is not configured.
+        """
+        return await self.__lookup("transactions", transaction_ids, user_id, self.__load_transactions)
+
+    async def close(self):
+        """Closes every pooled connection"""
+        await self.__client.aclose()
+
+    async def __lookup(self, resource: str, ids: List[str], user_id: str, loader) -> List[Dict[str, Any]]:
+        """Goes through the cache when one is configured"""
+        if self.__cache is None:
+            return await loader(ids)
+        return await self.__cache.get_many(user_id, resource, ids, loader)
+
+    async def __load_accounts(self, acct_ids: List[str]) -> List[Dict[str, Any]]:
+        accounts = await self.__fetch_all("accounts", acct_ids)
+        for data in accounts:
+            # Convert balance values from cents to dollars
+            if "balance" in data:
+                balance = data["balance"]
+                if "cash" in balance and "available" in balance["cash"]:
+                    balance["cash"]["available"]["usd"] /= 100
+                if "current" in balance:
+                    balance["current"]["usd"] /= 100
+        return accounts
+
+    async def __load_transactions(self, transaction_ids: List[str]) -> List[Dict[str, Any]]:
+        transactions = await self.__fetch_all("transactions", transaction_ids)
+        for data in transactions:
+            # Convert amount from cents to dollars
+            if "amount" in data:
+                data["amount"] /= 100
+        return transactions
+
+    async def __fetch_all(self, resource: str, ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetches every ID for a resource, preserving the order of `ids`"""
+        if not self.__api_url:
+            logger.error("API_URL environment variable is not set")
+            raise OSError("API_URL environment variable is not set.")
+
+        logger.info(f"Fetching {len(ids)} {resource}")
+        fan_out = asyncio.Semaphore(self.__max_fan_out)
+
+        if self.__use_batch_endpoints:
+            batches = [ids[i:i + self.__batch_size] for i in range(0, len(ids), self.__batch_size)]
+            results = await asyncio.gather(*(self.__fetch_batch(resource, batch, fan_out) for batch in batches))
+            return [data for batch in results for data in batch]
+
+        return list(await asyncio.gather(*(self.__fetch_one(resource, item_id, fan_out) for item_id in ids)))
+
+    async def __fetch_one(self, resource: str, item_id: str, fan_out: asyncio.Semaphore) -> Dict[str, Any]:
+        url = f"{self.__api_url}/financial-connections/{resource}/{item_id}"
+        async with fan_out, self.__host_limit(url):
+            response = await self.__client.get(url)
+        return self.__parse(response, resource, item_id)
+
+    async def __fetch_batch(self, resource: str, ids: List[str], fan_out: asyncio.Semaphore) -> List[Dict[str, Any]]:
+        url = f"{self.__api_url}/financial-connections/{resource}/batch"
+        async with fan_out, self.__host_limit(url):
+            response = await self.__client.post(url, json={"ids": ids})
+        return self.__parse(response, resource, ",".join(ids))
+
+    def __parse(self, response: httpx.Response, resource: str, item_id: str):
+        if response.status_code != 200:
+            logger.error(f"Request for {resource} {item_id} failed with status code: {response.status_code}")
+            logger.error(f"Response content: {response.text}")
+            response.raise_for_status()
+        return response.json()
+
+    def __host_limit(self, url: str) -> asyncio.Semaphore:
+        """Returns the semaphore capping concurrent requests to the url's host"""
+        host = urlsplit(url).netloc
+        if host not in self.__host_limits:
+            self.__host_limits[host] = asyncio.Semaphore(self.__max_per_host)
+        return self.__host_limits[host]
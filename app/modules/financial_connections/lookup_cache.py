@@ -0,0 +1,194 @@
+"""This module contains the cache that sits in front of financial connections lookups"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.utils import METRICS
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str]
+Loader = Callable[[List[str]], Awaitable[List[Dict[str, Any]]]]
+
+CACHE_HITS = METRICS.counter("lookup_cache_hits_total", "Lookups served fresh from the cache")
+CACHE_STALE_HITS = METRICS.counter("lookup_cache_stale_hits_total", "Lookups served stale from the cache")
+CACHE_MISSES = METRICS.counter("lookup_cache_misses_total", "Lookups that had to go upstream")
+CACHE_EVICTIONS = METRICS.counter("lookup_cache_evictions_total", "Entries evicted to stay under the memory bound")
+CACHE_REFRESHES = METRICS.counter("lookup_cache_refreshes_total", "Background stale-while-revalidate refreshes")
+CACHE_BYTES = METRICS.gauge("lookup_cache_bytes", "Approximate size of all cached entries")
+CIRCUIT_OPEN = METRICS.gauge("lookup_circuit_open", "1 while the upstream circuit breaker is open")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the upstream is failing and there is nothing cached to fall back on"""
+
+
+def _match_ids(ids: List[str], values: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Matches loaded values to their IDs by their "id" field, or by position when they have none"""
+    if all(isinstance(value, dict) and "id" in value for value in values):
+        by_id = {value["id"]: value for value in values}
+        return {item_id: by_id[item_id] for item_id in ids if item_id in by_id}
+    if len(values) != len(ids):
+        raise ValueError(f"Loader returned {len(values)} values for {len(ids)} IDs")
+    return dict(zip(ids, values))
+
+
+class LookupCache:
+    """
+    User-scoped LRU cache for account and transaction lookups.
+
+    Each resource has its own TTL and stale window. Entries past their TTL but inside the stale
+    window are returned immediately while a background refresh runs. While the circuit breaker is
+    open, or when an upstream call fails, any cached entry is served regardless of age. IDs the
+    upstream returns nothing for are not cached; they fall back to an expired entry if there is
+    one, and otherwise the lookup fails with a LookupError.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        ttls: Dict[str, float],
+        stale_ttls: Dict[str, float],
+        max_bytes: int = 16 * 1024 * 1024,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.__ttls = ttls
+        self.__stale_ttls = stale_ttls
+        self.__max_bytes = max_bytes
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__entries: "OrderedDict[CacheKey, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self.__size = 0
+        self.__refreshing: Set[CacheKey] = set()
+        self.__refresh_tasks: Set["asyncio.Task[None]"] = set()
+        self.__failures = 0
+        self.__opened_at: Optional[float] = None
+
+    async def get_many(self, user_id: str, resource: str, ids: List[str], loader: Loader) -> List[Dict[str, Any]]:
+        """Returns the value for every ID, loading misses through `loader` in one call"""
+        now = time.monotonic()
+        ttl = self.__ttls.get(resource, 0)
+        stale_ttl = self.__stale_ttls.get(resource, 0)
+        found: Dict[str, Dict[str, Any]] = {}
+        expired: Dict[str, Dict[str, Any]] = {}
+        stale: List[str] = []
+        misses: List[str] = []
+
+        for item_id in dict.fromkeys(ids):
+            key = (user_id, resource, item_id)
+            entry = self.__entries.get(key)
+            if entry is None:
+                misses.append(item_id)
+                continue
+
+            self.__entries.move_to_end(key)
+            age = now - entry[0]
+            if age <= ttl:
+                CACHE_HITS.inc(resource=resource)
+                found[item_id] = entry[2]
+            elif age <= ttl + stale_ttl:
+                CACHE_STALE_HITS.inc(resource=resource)
+                found[item_id] = entry[2]
+                stale.append(item_id)
+            else:
+                expired[item_id] = entry[2]
+                misses.append(item_id)
+
+        if misses:
+            CACHE_MISSES.inc(len(misses), resource=resource)
+            found.update(await self.__load(user_id, resource, misses, loader, expired))
+
+        if stale and not self.__is_open():
+            self.__schedule_refresh(user_id, resource, stale, loader)
+
+        return [found[item_id] for item_id in ids]
+
+    async def __load(self, user_id, resource, ids, loader, expired) -> Dict[str, Dict[str, Any]]:
+        """Loads misses upstream, falling back to expired entries when the upstream is failing"""
+        if self.__is_open():
+            return self.__fallback(resource, ids, expired, CircuitOpenError(f"Upstream for {resource} is unavailable"))
+
+        try:
+            loaded = _match_ids(ids, await loader(ids))
+        except Exception as e:  # pylint: disable=W0718
+            self.__record_failure()
+            return self.__fallback(resource, ids, expired, e)
+
+        self.__record_success()
+        for item_id, value in loaded.items():
+            self.__put((user_id, resource, item_id), value)
+        missing = [item_id for item_id in ids if item_id not in loaded]
+        if missing:
+            error = LookupError(f"Upstream returned no {resource} for {', '.join(missing)}")
+            loaded.update(self.__fallback(resource, missing, expired, error))
+        return loaded
+
+    def __fallback(self, resource, ids, expired, error: Exception) -> Dict[str, Dict[str, Any]]:
+        if any(item_id not in expired for item_id in ids):
+            raise error
+        logger.warning(f"Serving {len(ids)} expired {resource} entries: {error}")
+        CACHE_STALE_HITS.inc(len(ids), resource=resource)
+        return {item_id: expired[item_id] for item_id in ids}
+
+    def __schedule_refresh(self, user_id: str, resource: str, ids: List[str], loader: Loader):
+        keys = [(user_id, resource, item_id) for item_id in ids]
+        pending = [key[2] for key in keys if key not in self.__refreshing]
+        if not pending:
+            return
+        self.__refreshing.update((user_id, resource, item_id) for item_id in pending)
+        task = asyncio.create_task(self.__refresh(user_id, resource, pending, loader))
+        # The loop only keeps a weak reference, so hold one until the refresh is done
+        self.__refresh_tasks.add(task)
+        task.add_done_callback(self.__refresh_tasks.discard)
+
+    async def __refresh(self, user_id: str, resource: str, ids: List[str], loader: Loader):
+        CACHE_REFRESHES.inc(resource=resource)
+        try:
+            loaded = _match_ids(ids, await loader(ids))
+            self.__record_success()
+            for item_id, value in loaded.items():
+                self.__put((user_id, resource, item_id), value)
+        except Exception as e:  # pylint: disable=W0718
+            self.__record_failure()
+            logger.warning(f"Background refresh of {len(ids)} {resource} failed: {e}")
+        finally:
+            self.__refreshing.difference_update((user_id, resource, item_id) for item_id in ids)
+
+    def __put(self, key: CacheKey, value: Dict[str, Any]):
+        size = len(json.dumps(value, default=str))
+        if key in self.__entries:
+            self.__size -= self.__entries.pop(key)[1]
+        self.__entries[key] = (time.monotonic(), size, value)
+        self.__size += size
+
+        while self.__size > self.__max_bytes and len(self.__entries) > 1:
+            _, (_, evicted_size, _) = self.__entries.popitem(last=False)
+            self.__size -= evicted_size
+            CACHE_EVICTIONS.inc()
+        CACHE_BYTES.set(self.__size)
+
+    def __is_open(self) -> bool:
+        if self.__opened_at is None:
+            return False
+        if time.monotonic() - self.__opened_at >= self.__reset_timeout:
+            # Half-open: let the next call through to probe the upstream
+            self.__opened_at = None
+            self.__failures = self.__failure_threshold - 1
+            CIRCUIT_OPEN.set(0)
+            return False
+        return True
+
+    def __record_success(self):
+        self.__failures = 0
+
+    def __record_failure(self):
+        self.__failures += 1
+        if self.__failures >= self.__failure_threshold and self.__opened_at is None:
+            logger.error(f"Opening circuit breaker after {self.__failures} upstream failures")
+            self.__opened_at = time.monotonic()
+            CIRCUIT_OPEN.set(1)
@@ -0,0 +1,3 @@
+"""All session history functionality"""
+
+from app.modules.history.history_store import HistoryStore
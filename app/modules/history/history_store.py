@@ -0,0 +1,112 @@
+"""This module contains the server-side store of formatted session history"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from app.utils import METRICS, ChatMessage, FormattedChatMessage, format_history
+
+logger = logging.getLogger(__name__)
+
+HISTORY_HITS = METRICS.counter("history_store_hits_total", "History served from the in-process cache")
+HISTORY_LOADS = METRICS.counter("history_store_loads_total", "History rebuilt, labelled by source")
+
+
+class HistoryStore:
+    """
+    Keeps preformatted message lists per session so clients don't have to resend history.
+
+    The version of a session's history is the number of messages in it. A client that sends the
+    version it already holds gets the cached list; otherwise the list is rebuilt from the history
+    the client sent or, failing that, from a DynamoDB Query on chat_logs. New messages are appended
+    to the cached list as they are saved. Sessions are keyed by user as well as session ID.
+
+    The Query can trail the cache, since saves are written behind and the index is eventually
+    consistent, so a Query result never replaces a longer cached list and one shorter than the
+    client's version isn't cached at all.
+    """
+
+    def __init__(self, table, index_name: Optional[str], max_sessions: int = 1000):
+        self.__table = table
+        self.__index_name = index_name
+        self.__max_sessions = max_sessions
+        self.__sessions: "OrderedDict[Tuple[str, str], List[FormattedChatMessage]]" = OrderedDict()
+
+    async def load(
+        self,
+        user_id: str,
+        session_id: str,
+        history: Optional[List[ChatMessage]] = None,
+        version: Optional[int] = None,
+    ) -> Tuple[int, List[FormattedChatMessage]]:
+        """Returns (version, formatted history) for a session"""
+        if version is None and history is not None:
+            # Clients that still post the full history implicitly hold every message in it
+            version = len(history)
+
+        key = (user_id, session_id)
+        cached = self.__sessions.get(key)
+        if cached is not None and (version is None or version == len(cached)):
+            HISTORY_HITS.inc()
+            self.__sessions.move_to_end(key)
+            return len(cached), list(cached)
+
+        if history is not None and len(history) == version:
+            HISTORY_LOADS.inc(source="client")
+            formatted = format_history(history)
+        else:
+            HISTORY_LOADS.inc(source="dynamodb")
+            formatted = await asyncio.to_thread(self.__query, user_id, session_id)
+            # Messages may have been appended to the cached list while the Query ran
+            cached = self.__sessions.get(key)
+            if cached is not None and len(cached) >= len(formatted):
+                self.__sessions.move_to_end(key)
+                return len(cached), list(cached)
+            if version is not None and len(formatted) < version:
+                # Some of the client's messages haven't reached the index yet
+                return len(formatted), formatted
+
+        self.__put(key, formatted)
+        return len(formatted), list(formatted)
+
+    def append(self, user_id: str, session_id: str, message: FormattedChatMessage) -> Optional[int]:
+        """Appends a message to a cached session, returning its new version"""
+        cached = self.__sessions.get((user_id, session_id))
+        if cached is None:
+            return None
+        cached.append(message)
+        return len(cached)
+
+    def __put(self, key: Tuple[str, str], formatted: List[FormattedChatMessage]):
+        cached = self.__sessions.get(key)
+        if cached is not None and len(cached) > len(formatted):
+            # Never replace a newer list with an older one
+            return
+        self.__sessions[key] = formatted
+        self.__sessions.move_to_end(key)
+        while len(self.__sessions) > self.__max_sessions:
+            self.__sessions.popitem(last=False)
+
+    def __query(self, user_id: str, session_id: str) -> List[FormattedChatMessage]:
+        """Reads every chat log the user has in a session, in timestamp order"""
+        if not self.__index_name:
+            return []
+
+        query_args = {
+            "IndexName": self.__index_name,
+            "KeyConditionExpression": Key("session_id").eq(session_id),
+            "FilterExpression": Attr("user_id").eq(user_id),
+            "ScanIndexForward": True,
+        }
+        items: List[ChatMessage] = []
+        while True:
+            response = self.__table.query(**query_args)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                break
+            query_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        return format_history(items)
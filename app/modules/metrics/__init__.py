@@ -0,0 +1,3 @@
+"""All metrics functionality"""
+
+from app.modules.metrics.metrics_handler import MetricsHandler
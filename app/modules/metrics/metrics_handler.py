@@ -0,0 +1,22 @@
+"""Handles all incoming requests for metrics"""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.utils import METRICS
+
+
+class MetricsHandler:
+    """Exposes the in-process metrics registry for scraping"""
+
+    def __init__(self):
+        self.router = APIRouter(tags=["metrics"])
+        self.__setup_routes()
+
+    def __setup_routes(self):
+        """Initializes all routes"""
+        self.router.get("/metrics", response_class=PlainTextResponse)(self.get_metrics)
+
+    async def get_metrics(self):
+        """Returns all metrics in the Prometheus text format"""
+        return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
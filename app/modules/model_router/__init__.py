@@ -0,0 +1,3 @@
+"""All model routing functionality"""
+
+from app.modules.model_router.model_router import ROUTE_LOG_PREFIX, ModelRouter, RouteDecision, RouteFeatures
@@ -0,0 +1,154 @@
+"""This module contains the model router that picks a model tier for each turn from cheap local features"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.utils import ACCOUNT_ID, METRICS, SMALLTALK, TRANSACTION_ID, FormattedChatMessage
+
+logger = logging.getLogger(__name__)
+
+ROUTES = METRICS.counter("model_router_decisions_total", "Turns routed, by tier and the rule that chose it")
+MISROUTE_SIGNALS = METRICS.counter(
+    "model_router_misroute_signals_total", "Outcomes suggesting a turn needed a bigger tier, by tier and signal"
+)
+
+# Decision log lines start with this, followed by JSON, so they can be pulled out of the logs for evaluation
+ROUTE_LOG_PREFIX = "model_route "
+TIERS = ("light", "standard", "heavy")
+
+KEYWORD_CLASSES = {
+    "smalltalk": SMALLTALK,
+    "planning": re.compile(
+        r"\b(?:calculat\w*|comput\w*|compound\w*|interest|invest\w*|retire\w*|simulat\w*|project\w*|monte carlo"
+        r"|grow\w*|returns?|scenario\w*|how much will|afford|mortgage|loan)\b",
+        re.IGNORECASE,
+    ),
+    "analysis": re.compile(
+        r"\b(?:spend\w*|spent|transactions?|balances?|budget\w*|categor\w*|breakdown|compar\w*"
+        r"|trends?|analy[sz]\w*|subscriptions?|where did|cash ?flow)\b",
+        re.IGNORECASE,
+    ),
+    "chart": re.compile(r"\b(?:chart|graph|plot|visuali[sz]e|show me)\b", re.IGNORECASE),
+    "web": re.compile(r"\b(?:latest|today|current(?:ly)?|news|right now|this week)\b", re.IGNORECASE),
+}
+
+
+class RouteFeatures(NamedTuple):
+    """What the router looks at"""
+
+    message_chars: int
+    history_messages: int
+    account_ids: int
+    transaction_ids: int
+    keywords: Tuple[str, ...]
+
+
+class RouteDecision(NamedTuple):
+    """The tier chosen for a turn, its model and output budget, and why"""
+
+    tier: str
+    model: str
+    max_output_tokens: int
+    reason: str
+    features: RouteFeatures
+
+
+class ModelRouter:
+    """
+    Picks a model tier and output budget for each turn, locally and in microseconds.
+
+    Turns about specific accounts or transactions go to the standard tier, or heavy when they
+    also ask for analysis or planning, as do long messages and deep conversations. Small talk and
+    short general questions go to the light tier. Everything else, including anything that
+    needs a calculation tool, current information or a chart, stays on standard.
+
+    Each decision is logged with the turn's outcome, under ROUTE_LOG_PREFIX, for offline tuning.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        light_model: str,
+        standard_model: str,
+        heavy_model: str,
+        light_max_output_tokens: int = 1024,
+        standard_max_output_tokens: int = 2048,
+        heavy_max_output_tokens: int = 4096,
+        long_message_chars: int = 400,
+        deep_history_messages: int = 20,
+    ):
+        self.__tiers = {
+            "light": (light_model, light_max_output_tokens),
+            "standard": (standard_model, standard_max_output_tokens),
+            "heavy": (heavy_model, heavy_max_output_tokens),
+        }
+        self.__long_message_chars = long_message_chars
+        self.__deep_history_messages = deep_history_messages
+
+    @staticmethod
+    def features(message: str, history: List[FormattedChatMessage], context: Optional[List[str]]) -> RouteFeatures:
+        """Extracts the routing features of a turn"""
+        context_text = " ".join(context or [])
+        return RouteFeatures(
+            message_chars=len(message),
+            history_messages=len(history),
+            account_ids=len(set(ACCOUNT_ID.findall(context_text))),
+            transaction_ids=len(set(TRANSACTION_ID.findall(context_text))),
+            keywords=tuple(name for name, pattern in KEYWORD_CLASSES.items() if pattern.search(message)),
+        )
+
+    def route(
+        self, message: str, history: List[FormattedChatMessage], context: Optional[List[str]] = None
+    ) -> RouteDecision:
+        """Chooses the tier for a turn"""
+        features = self.features(message, history, context)
+        tier, reason = self.__classify(features)
+        ROUTES.inc(tier=tier, reason=reason)
+        model, max_output_tokens = self.__tiers[tier]
+        return RouteDecision(tier, model, max_output_tokens, reason, features)
+
+    def __classify(self, features: RouteFeatures) -> Tuple[str, str]:
+        keywords = set(features.keywords)
+        ids = features.account_ids + features.transaction_ids
+        if ids:
+            if keywords & {"analysis", "planning"} or ids > 3:
+                return "heavy", "ids_with_analysis"
+            return "standard", "ids"
+        if features.message_chars > self.__long_message_chars:
+            return "heavy", "long_message"
+        if features.history_messages > self.__deep_history_messages:
+            return "heavy", "deep_history"
+        needs_tools = keywords & {"planning", "analysis", "web"}
+        # "thanks, that chart helped" is still small talk
+        if "smalltalk" in keywords and features.message_chars < 80 and not needs_tools:
+            return "light", "smalltalk"
+        if needs_tools or "chart" in keywords:
+            return "standard", "needs_tools"
+        if features.message_chars < 160 and features.history_messages <= 6:
+            return "light", "short_question"
+        return "standard", "default"
+
+    def record(self, decision: RouteDecision, **outcome: Any):
+        """Logs a decision with how the turn went, counting outcomes that hint it was under-routed"""
+        signals = []
+        if decision.tier == "light" and outcome.get("tool_calls"):
+            signals.append("tool_calls")
+        if outcome.get("output_tokens", 0) >= 0.9 * decision.max_output_tokens:
+            signals.append("output_cap")
+        if outcome.get("status") == "error" or outcome.get("limit_reached"):
+            signals.append("failed")
+        for signal in signals:
+            MISROUTE_SIGNALS.inc(tier=decision.tier, signal=signal)
+
+        entry: Dict[str, Any] = {
+            "tier": decision.tier,
+            "model": decision.model,
+            "max_output_tokens": decision.max_output_tokens,
+            "reason": decision.reason,
+            "features": decision.features._asdict(),
+            "outcome": outcome,
+            "signals": signals,
+        }
+        logger.info(f"{ROUTE_LOG_PREFIX}{json.dumps(entry, separators=(',', ':'), default=str)}")
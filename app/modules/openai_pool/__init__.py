@@ -0,0 +1,3 @@
+"""All OpenAI client pool functionality"""
+
+from app.modules.openai_pool.openai_pool import OpenAIPool, PooledClient, TokenBucket
@@ -0,0 +1,258 @@
+"""This module contains the OpenAI client pool that spreads calls across keys by rate-limit headroom"""
+
+import asyncio
+import logging
+import math
+import random
+import re
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+from app.utils import METRICS, count_json_tokens, count_tokens
+
+logger = logging.getLogger(__name__)
+
+POOL_CALLS = METRICS.counter("openai_pool_calls_total", "Calls made through the pool, by key and outcome")
+POOL_RETRIES = METRICS.counter("openai_pool_retries_total", "Calls retried on another attempt, by reason")
+POOL_WAIT = METRICS.histogram(
+    "openai_pool_wait_seconds",
+    "Time calls waited for a key with enough rate-limit headroom",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10),
+)
+POOL_HEADROOM = METRICS.gauge("openai_pool_headroom_ratio", "Share of each key's budget left, by key and budget")
+POOL_ESTIMATED_TOKENS = METRICS.counter("openai_pool_estimated_tokens_total", "Tokens reserved ahead of calls")
+
+# e.g. "1s", "6m0s", "20ms", "1h2m3.5s"
+RESET_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+RESET_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+# Output tokens reserved for calls that don't set max_output_tokens
+DEFAULT_OUTPUT_TOKENS = 1024
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parses an x-ratelimit-reset-* duration into seconds"""
+    if not value:
+        return None
+    parts = RESET_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * RESET_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """A per-minute budget that refills continuously, re-synced from the API's rate-limit headers"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.__rate = self.capacity / 60
+        self.__updated = time.monotonic()
+
+    def refill(self, now: float):
+        """Adds what has accrued since the last refill"""
+        self.level = min(self.capacity, self.level + (now - self.__updated) * self.__rate)
+        self.__updated = now
+
+    def headroom(self, amount: float) -> float:
+        """Share of the budget left after taking `amount`"""
+        return (self.level - amount) / self.capacity
+
+    def fits(self, amount: float) -> bool:
+        """Whether `amount` can be taken now; larger than the whole budget fits once it's full"""
+        return self.level >= min(amount, self.capacity)
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` fits"""
+        return max(0.0, min(amount, self.capacity) - self.level) / self.__rate
+
+    def take(self, amount: float):
+        """Reserves `amount`, which may leave the bucket in debt"""
+        self.level -= amount
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], reset: Optional[float]):
+        """Adopts the server's view of the budget"""
+        if limit:
+            self.capacity = limit
+        if remaining is None:
+            return
+        self.level = remaining
+        self.__updated = time.monotonic()
+        # The server refills to full over `reset` seconds
+        if reset and self.capacity > remaining:
+            self.__rate = (self.capacity - remaining) / reset
+        else:
+            self.__rate = self.capacity / 60
+
+
+class PooledClient:
+    """One key's client with its request and token budgets"""
+
+    def __init__(self, name: str, client, requests_per_minute: float, tokens_per_minute: float):
+        self.name = name
+        self.client = client
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.cooldown_until = 0.0
+
+    def refill(self, now: float):
+        """Refills both budgets"""
+        self.requests.refill(now)
+        self.tokens.refill(now)
+
+    def headroom(self, tokens: int) -> float:
+        """Share of the tighter budget left after this call"""
+        return min(self.requests.headroom(1), self.tokens.headroom(tokens))
+
+    def fits(self, tokens: int, now: float) -> bool:
+        """Whether the call fits both budgets and the key isn't backing off"""
+        return now >= self.cooldown_until and self.requests.fits(1) and self.tokens.fits(tokens)
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until the call would fit"""
+        return max(self.cooldown_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def sync(self, headers: Mapping[str, str]):
+        """Re-syncs both budgets from x-ratelimit-* response headers"""
+        for budget, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            bucket.sync(
+                _header_number(headers, f"x-ratelimit-limit-{budget}"),
+                _header_number(headers, f"x-ratelimit-remaining-{budget}"),
+                parse_reset(headers.get(f"x-ratelimit-reset-{budget}")),
+            )
+            POOL_HEADROOM.set(max(0.0, bucket.headroom(0)), key=self.name, budget=budget)
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class PooledResponses:
+    """Stands in for AsyncOpenAI().responses"""
+
+    def __init__(self, pool: "OpenAIPool"):
+        self.__pool = pool
+
+    async def create(self, **params):
+        """Creates a response on the key with the most headroom"""
+        return await self.__pool.create_response(params)
+
+
+class OpenAIPool:
+    """
+    Spreads OpenAI calls over several keys or organizations.
+
+    Each key keeps token buckets for its requests and tokens per minute, seeded with the given
+    budgets and re-synced from the x-ratelimit-* headers of every response. A call's prompt and
+    maximum output tokens are estimated up front and reserved on the key with the most headroom
+    left; when no key has enough, the call waits for the soonest refill, up to `max_wait`.
+
+    A 429 puts its key into a jittered exponential backoff, honouring Retry-After, and the call
+    is retried on another key. Server and connection errors are retried after a jittered delay
+    without cooling the key down. The pool does all the retrying, so the clients should be
+    created with max_retries=0.
+
+    Only `responses.create` is pooled, which is all the async callers use.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        clients: List[Any],
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 200_000,
+        max_retries: int = 3,
+        max_wait: float = 10.0,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+    ):
+        self.__keys = [
+            PooledClient(f"key{index}", client, requests_per_minute, tokens_per_minute)
+            for index, client in enumerate(clients)
+        ]
+        self.__max_retries = max_retries
+        self.__max_wait = max_wait
+        self.__backoff_base = backoff_base
+        self.__backoff_max = backoff_max
+        self.__fixed_tokens: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+        self.responses = PooledResponses(self)
+
+    def estimate_tokens(self, params: Dict[str, Any]) -> int:
+        """Tokens the call counts against the budget: its prompt plus the most it may write"""
+        instructions = params.get("instructions") or ""
+        tools = params.get("tools") or []
+        # Instructions and tool definitions repeat across calls, so their count is kept
+        fixed_key = (instructions, tuple(str(tool.get("name", tool.get("type"))) for tool in tools))
+        fixed = self.__fixed_tokens.get(fixed_key)
+        if fixed is None:
+            fixed = count_tokens(instructions) + count_json_tokens(tools)
+            if len(self.__fixed_tokens) >= 64:
+                self.__fixed_tokens.clear()
+            self.__fixed_tokens[fixed_key] = fixed
+        prompt = params.get("input") or ""
+        prompt_tokens = count_tokens(prompt) if isinstance(prompt, str) else count_json_tokens(prompt)
+        return fixed + prompt_tokens + (params.get("max_output_tokens") or DEFAULT_OUTPUT_TOKENS)
+
+    async def create_response(self, params: Dict[str, Any]):
+        """Runs responses.create through the pool, retrying rate limits and transient errors"""
+        tokens = self.estimate_tokens(params)
+        POOL_ESTIMATED_TOKENS.inc(tokens)
+        attempt = 0
+        while True:
+            key = await self.__acquire(tokens)
+            try:
+                raw = await key.client.responses.with_raw_response.create(**params)
+            except RateLimitError as e:
+                POOL_CALLS.inc(key=key.name, outcome="rate_limited")
+                key.sync(e.response.headers)
+                self.__back_off(key, attempt, e.response.headers)
+                if attempt == self.__max_retries:
+                    raise
+                POOL_RETRIES.inc(reason="rate_limited")
+            except (APIConnectionError, InternalServerError) as e:
+                POOL_CALLS.inc(key=key.name, outcome="error")
+                if attempt == self.__max_retries:
+                    raise
+                POOL_RETRIES.inc(reason=type(e).__name__)
+                await asyncio.sleep(self.__backoff(attempt))
+            else:
+                POOL_CALLS.inc(key=key.name, outcome="ok")
+                key.sync(raw.headers)
+                return raw.parse()
+            attempt += 1
+
+    async def __acquire(self, tokens: int) -> PooledClient:
+        """Reserves the call on the key with the most headroom, waiting for one if none fits"""
+        started = time.monotonic()
+        while True:
+            now = time.monotonic()
+            for key in self.__keys:
+                key.refill(now)
+            ready = [key for key in self.__keys if key.fits(tokens, now)]
+            waited = now - started
+            if not ready and waited >= self.__max_wait:
+                # Out of patience: send it on the key closest to ready and let the API decide
+                ready = [min(self.__keys, key=lambda key: key.wait_time(tokens, now))]
+            if ready:
+                key = max(ready, key=lambda key: key.headroom(tokens))
+                key.requests.take(1)
+                key.tokens.take(tokens)
+                POOL_WAIT.observe(waited)
+                return key
+            wait = min(key.wait_time(tokens, now) for key in self.__keys)
+            await asyncio.sleep(min(max(wait, 0.001), self.__max_wait - waited))
+
+    def __back_off(self, key: PooledClient, attempt: int, headers: Mapping[str, str]):
+        retry_after = _header_number(headers, "retry-after-ms")
+        retry_after = retry_after / 1000 if retry_after is not None else _header_number(headers, "retry-after")
+        delay = max(retry_after or 0.0, self.__backoff(attempt))
+        key.cooldown_until = time.monotonic() + delay
+        logger.warning(f"OpenAI rate limited {key.name}, backing off for {delay:.2f}s")
+
+    def __backoff(self, attempt: int) -> float:
+        # Full jitter, so keys and workers that were limited together don't retry together
+        return random.uniform(0, min(self.__backoff_max, self.__backoff_base * math.pow(2, attempt)))
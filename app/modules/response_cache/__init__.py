@@ -0,0 +1,3 @@
+"""All response cache functionality"""
+
+from app.modules.response_cache.response_cache import ResponseCache
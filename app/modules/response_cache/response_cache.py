@@ -0,0 +1,154 @@
+"""This module contains the exact-match cache for answers to tool-free turns"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from app.modules.model_router import RouteDecision
+from app.utils import METRICS, FormattedChatMessage
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = METRICS.counter("response_cache_lookups_total", "Response cache lookups, by result")
+CACHE_LOOKUP_SECONDS = METRICS.histogram(
+    "response_cache_lookup_seconds",
+    "Time taken by response cache lookups, by result",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+CACHE_STORES = METRICS.counter("response_cache_stores_total", "Answers written to the response cache, by tier")
+CACHE_ERRORS = METRICS.counter("response_cache_errors_total", "DynamoDB tier calls that failed, by operation")
+
+
+def _normalize(text: str) -> str:
+    """Folds case and whitespace, so trivially different phrasings share a key"""
+    return " ".join(text.split()).casefold()
+
+
+class ResponseCache:
+    """
+    Caches the streamed answers of turns that finished without tool calls or web searches.
+
+    The key is a hash of the model, instructions and tools together with the normalized history
+    and message. A routed turn is keyed on the model and output budget it was routed to, and a
+    turn sent only some tools on the tool groups it was sent, so turns that reach the model
+    differently never share an answer. Only turns whose whole history fits in `history_window` messages are cached, so a
+    key always covers everything the model saw and an answer can't depend on context outside it.
+
+    Lookups check an in-process LRU first and then, when a table is configured, DynamoDB. Entries
+    expire after `ttl` seconds in both tiers; DynamoDB's own TTL removes them from the table
+    eventually, so expiry is also checked on read.
+    """
+
+    # pylint: disable=R0913
+    def __init__(
+        self,
+        model: str,
+        instructions: str,
+        tools: List[Dict[str, Any]],
+        table=None,
+        max_entries: int = 1000,
+        ttl: float = 3600.0,
+        history_window: int = 4,
+    ):
+        self.__table = table
+        self.__max_entries = max_entries
+        self.__ttl = ttl
+        self.__history_window = history_window
+        # Everything but the conversation is fixed per process, so it is hashed once
+        self.__prefix = hashlib.sha256(
+            json.dumps([model, instructions, tools], sort_keys=True, separators=(",", ":")).encode()
+        ).hexdigest()
+        # key -> (expiry as a Unix timestamp, raw response text)
+        self.__entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self.__writes: Set["asyncio.Task[None]"] = set()
+
+    def key(
+        self,
+        history: List[FormattedChatMessage],
+        message: str,
+        route: Optional[RouteDecision] = None,
+        tool_groups: Optional[FrozenSet[str]] = None,
+    ) -> Optional[str]:
+        """Returns the cache key for a turn, or None if its history is too long to cache"""
+        if len(history) > self.__history_window:
+            return None
+        conversation = [[item["role"], _normalize(str(item["content"]))] for item in history]
+        conversation.append(["user", _normalize(message)])
+        # None stands for the default model and every tool
+        model = [route.model, route.max_output_tokens] if route is not None else None
+        groups = sorted(tool_groups) if tool_groups is not None else None
+        digest = hashlib.sha256(self.__prefix.encode())
+        digest.update(json.dumps([model, groups, conversation], separators=(",", ":")).encode())
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Returns the cached answer for a key, promoting DynamoDB hits into memory"""
+        started = time.perf_counter()
+        result = "miss"
+        text = self.__get_local(key)
+        if text is not None:
+            result = "memory"
+        elif self.__table is not None:
+            text = await self.__get_remote(key)
+            if text is not None:
+                result = "dynamodb"
+        CACHE_LOOKUPS.inc(result=result)
+        CACHE_LOOKUP_SECONDS.observe(time.perf_counter() - started, result=result)
+        return text
+
+    def put(self, key: str, text: str):
+        """Caches an answer in memory now and in DynamoDB in the background"""
+        self.__put_local(key, text, time.time() + self.__ttl)
+        CACHE_STORES.inc(tier="memory")
+        if self.__table is not None:
+            task = asyncio.create_task(self.__put_remote(key, text))
+            self.__writes.add(task)
+            task.add_done_callback(self.__writes.discard)
+
+    async def close(self):
+        """Waits for background DynamoDB writes to finish"""
+        if self.__writes:
+            await asyncio.gather(*self.__writes, return_exceptions=True)
+
+    def __get_local(self, key: str) -> Optional[str]:
+        entry = self.__entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self.__entries[key]
+            return None
+        self.__entries.move_to_end(key)
+        return entry[1]
+
+    def __put_local(self, key: str, text: str, expires_at: float):
+        self.__entries[key] = (expires_at, text)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.__max_entries:
+            self.__entries.popitem(last=False)
+
+    async def __get_remote(self, key: str) -> Optional[str]:
+        try:
+            response = await asyncio.to_thread(self.__table.get_item, Key={"cache_key": key})
+        except Exception as e:  # pylint: disable=W0718
+            # The cache is an optimization, so a failing table only costs the hit
+            CACHE_ERRORS.inc(operation="get")
+            logger.warning(f"Response cache lookup failed: {e}")
+            return None
+        item = response.get("Item")
+        if not item or float(item.get("expires_at", 0)) <= time.time():
+            return None
+        self.__put_local(key, item["response_text"], float(item["expires_at"]))
+        return item["response_text"]
+
+    async def __put_remote(self, key: str, text: str):
+        item = {"cache_key": key, "response_text": text, "expires_at": int(time.time() + self.__ttl)}
+        try:
+            await asyncio.to_thread(self.__table.put_item, Item=item)
+            CACHE_STORES.inc(tier="dynamodb")
+        except Exception as e:  # pylint: disable=W0718
+            CACHE_ERRORS.inc(operation="put")
+            logger.warning(f"Response cache write failed: {e}")
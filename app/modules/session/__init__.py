@@ -1,3 +1,4 @@
 """All session functionality"""
 
 from app.modules.session.session_service import SessionService
+from app.modules.session.session_worker import SessionWorker
@@ -0,0 +1,105 @@
+"""This module contains the background worker that keeps session info up to date"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from app.utils import METRICS, TRACER, FormattedChatMessage
+
+logger = logging.getLogger(__name__)
+
+UPDATE_LATENCY = METRICS.histogram(
+    "session_update_offloaded_seconds",
+    "Session update time moved off the request path, i.e. time-to-first-byte saved per request",
+)
+UPDATES_COALESCED = METRICS.counter(
+    "session_updates_coalesced_total", "Session updates merged into an already pending update"
+)
+UPDATES_FAILED = METRICS.counter("session_updates_failed_total", "Background session updates that raised")
+
+
+class SessionWorker:
+    """
+    Runs SessionService.update_session in the background so the stream can start immediately.
+
+    Updates for the same session are coalesced: while one is pending only the latest history is
+    kept, and a session is never updated by two workers at the same time.
+    """
+
+    def __init__(self, session_service, concurrency: int = 4):
+        self.__session_service = session_service
+        self.__concurrency = concurrency
+        self.__pending: Dict[str, Dict[str, Any]] = {}
+        self.__in_flight: Set[str] = set()
+        self.__queue: Optional[asyncio.Queue] = None
+        self.__workers: List[asyncio.Task] = []
+
+    def submit(
+        self,
+        session_id: str,
+        history: List[FormattedChatMessage],
+        is_first_message: bool,
+    ):
+        """Schedules a session update, merging it into any pending update for the session"""
+        pending = self.__pending.get(session_id)
+        if pending is not None:
+            pending["history"] = history
+            pending["is_first_message"] = pending["is_first_message"] or is_first_message
+            UPDATES_COALESCED.inc()
+            return
+
+        self.__pending[session_id] = {
+            "session_id": session_id,
+            "history": history,
+            "is_first_message": is_first_message,
+        }
+        if session_id not in self.__in_flight:
+            self.__get_queue().put_nowait(session_id)
+
+    async def close(self):
+        """Waits for every pending update to finish and stops the workers"""
+        if self.__queue is None:
+            return
+        await self.__queue.join()
+        for worker in self.__workers:
+            worker.cancel()
+        await asyncio.gather(*self.__workers, return_exceptions=True)
+        self.__workers = []
+        self.__queue = None
+
+    def __get_queue(self) -> asyncio.Queue:
+        if self.__queue is None:
+            self.__queue = asyncio.Queue()
+            self.__workers = [asyncio.create_task(self.__run()) for _ in range(self.__concurrency)]
+        return self.__queue
+
+    async def __run(self):
+        """Processes queued session ids one at a time"""
+        assert self.__queue is not None
+        queue = self.__queue
+        while True:
+            session_id = await queue.get()
+            args = self.__pending.pop(session_id, None)
+            if args is None:
+                queue.task_done()
+                continue
+
+            self.__in_flight.add(session_id)
+            start = time.perf_counter()
+            span = TRACER.start_trace(session_id=session_id).start_span(
+                "session_update", first_message=args["is_first_message"], messages=len(args["history"])
+            )
+            try:
+                await asyncio.to_thread(self.__session_service.update_session, **args)
+                span.end(status="ok")
+            except Exception as e:  # pylint: disable=W0718
+                logger.error(f"Failed to update session {session_id}: {e}")
+                UPDATES_FAILED.inc()
+                span.end(status="error", error=type(e).__name__)
+            finally:
+                UPDATE_LATENCY.observe(time.perf_counter() - start)
+                self.__in_flight.discard(session_id)
+                if session_id in self.__pending:
+                    queue.put_nowait(session_id)
+                queue.task_done()
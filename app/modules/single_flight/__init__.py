@@ -0,0 +1,3 @@
+"""All single-flight request coalescing functionality"""
+
+from app.modules.single_flight.single_flight import Flight, SingleFlight
@@ -0,0 +1,160 @@
+"""This module contains the single-flight registry that shares one generation between duplicate requests"""
+
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+
+from app.utils import METRICS
+
+logger = logging.getLogger(__name__)
+
+FLIGHT_REQUESTS = METRICS.counter(
+    "single_flight_requests_total", "Requests by role: leader, follower (joined mid-stream) or replay"
+)
+FLIGHTS_ABANDONED = METRICS.counter(
+    "single_flight_abandoned_total", "Generations cancelled after every request for them disconnected"
+)
+
+
+class Flight:
+    """
+    One generation and every frame it has produced so far.
+
+    A pump task drives the generation and appends its frames to a buffer. Each request reads the
+    buffer from the start through subscribe(), so a duplicate that arrives mid-stream or after the
+    end gets the whole stream. The generation is cancelled once nobody has been subscribed for
+    `abandon_grace` seconds, which leaves a retrying client time to reattach.
+    """
+
+    def __init__(self, key: str, abandon_grace: float, on_done: Callable[["Flight", bool], None]):
+        self.key = key
+        self.frames: List[Any] = []
+        self.done = False
+        self.subscribers = 0
+        self.__abandon_grace = abandon_grace
+        self.__on_done = on_done
+        self.__headers: "asyncio.Future[Dict[str, str]]" = asyncio.get_running_loop().create_future()
+        self.__changed = asyncio.Event()
+        self.__error: Optional[BaseException] = None
+        self.__task: Optional["asyncio.Task[None]"] = None
+        self.__abandon: Optional[asyncio.TimerHandle] = None
+
+    def start(self, frames: AsyncGenerator[Any, None], headers: Dict[str, str]):
+        """Starts pumping the generation, releasing requests waiting for the response headers"""
+        self.__headers.set_result(headers)
+        self.__task = asyncio.create_task(self.__pump(frames))
+
+    def fail(self, error: BaseException):
+        """Fails a flight whose generation never started, so waiting duplicates get the same error"""
+        self.__headers.set_exception(error)
+        # Marks the exception as retrieved when no duplicate is waiting for it
+        self.__headers.exception()
+        self.__finish(ok=False)
+
+    async def headers(self) -> Dict[str, str]:
+        """Waits for the leader to start the generation and returns its response headers"""
+        return await asyncio.shield(self.__headers)
+
+    async def subscribe(self) -> AsyncGenerator[Any, None]:
+        """Yields every frame of the generation from the start, following it live until it ends"""
+        self.subscribers += 1
+        if self.__abandon is not None:
+            self.__abandon.cancel()
+            self.__abandon = None
+        try:
+            index = 0
+            while True:
+                if index < len(self.frames):
+                    index += 1
+                    yield self.frames[index - 1]
+                    continue
+                if self.done:
+                    if self.__error is not None:
+                        raise self.__error
+                    return
+                await self.__changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done:
+                self.__abandon = asyncio.get_running_loop().call_later(self.__abandon_grace, self.__cancel)
+
+    async def __pump(self, frames: AsyncGenerator[Any, None]):
+        ok = False
+        try:
+            async for frame in frames:
+                self.frames.append(frame)
+                self.__notify()
+            ok = True
+        except Exception as e:  # pylint: disable=W0718
+            # Subscribers re-raise it, so each request fails the way it would have on its own
+            self.__error = e
+        finally:
+            await frames.aclose()
+            self.__finish(ok)
+
+    def __notify(self):
+        self.__changed.set()
+        self.__changed = asyncio.Event()
+
+    def __finish(self, ok: bool):
+        self.done = True
+        self.__notify()
+        self.__on_done(self, ok)
+
+    def __cancel(self):
+        self.__abandon = None
+        if not self.subscribers and not self.done and self.__task is not None:
+            FLIGHTS_ABANDONED.inc()
+            self.__task.cancel()
+
+
+class SingleFlight:
+    """
+    Coalesces duplicate submissions of the same message into one generation.
+
+    Requests are keyed by session, conversation position (history length), a hash of the message
+    and the client's idempotency key, if it sent one, so the same message sent again later in the
+    conversation starts its own turn. Without a position or an idempotency key a request isn't
+    coalesced at all. The first request for a key leads and drives generation; duplicates that arrive
+    while it runs follow the same stream, and those arriving up to `replay_window` seconds after
+    it completed get it replayed. Failed or abandoned generations are forgotten at once, so a
+    retry starts over.
+    """
+
+    def __init__(self, replay_window: float = 10.0, abandon_grace: float = 2.0):
+        self.__replay_window = replay_window
+        self.__abandon_grace = abandon_grace
+        self.__flights: Dict[str, Flight] = {}
+
+    @staticmethod
+    def key(
+        session_id: str, message: str, position: Optional[int] = None, idempotency_key: Optional[str] = None
+    ) -> Optional[str]:
+        """Returns the key that identifies duplicate submissions, or None if the request can't be matched"""
+        if position is None and not idempotency_key:
+            return None
+        digest = hashlib.sha256(message.encode()).hexdigest()
+        return f"{session_id}:{'' if position is None else position}:{digest}:{idempotency_key or ''}"
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """Returns the flight for a key and whether the caller leads it"""
+        flight = self.__flights.get(key)
+        if flight is not None:
+            FLIGHT_REQUESTS.inc(role="replay" if flight.done else "follower")
+            return flight, False
+        flight = Flight(key, self.__abandon_grace, self.__finished)
+        self.__flights[key] = flight
+        FLIGHT_REQUESTS.inc(role="leader")
+        return flight, True
+
+    def __finished(self, flight: Flight, ok: bool):
+        if not ok:
+            self.__forget(flight)
+            return
+        asyncio.get_running_loop().call_later(self.__replay_window, self.__forget, flight)
+
+    def __forget(self, flight: Flight):
+        # A newer flight may have replaced this one under the same key
+        if self.__flights.get(flight.key) is flight:
+            del self.__flights[flight.key]
@@ -0,0 +1,3 @@
+"""All tool selection functionality"""
+
+from app.modules.tool_selection.tool_selector import ToolSelector, ToolSet
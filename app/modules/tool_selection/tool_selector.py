@@ -0,0 +1,115 @@
+"""This module contains the tool selector that sends each model hop only the tools its turn can use"""
+
+import itertools
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+from app.utils import ACCOUNT_ID, METRICS, SMALLTALK, TRANSACTION_ID, FormattedChatMessage, count_json_tokens
+
+TOOL_SETS = METRICS.counter("tool_selection_turns_total", "Turns by the tool groups selected for them")
+TOKENS_SAVED = METRICS.counter(
+    "tool_selection_prompt_tokens_saved_total", "Prompt tokens of tool definitions left out of model calls"
+)
+TURN_TOKENS_SAVED = METRICS.histogram(
+    "tool_selection_tokens_saved_per_turn",
+    "Prompt tokens of tool definitions left out across a turn's model hops",
+    buckets=(0, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000),
+)
+
+# Tool name, or type for hosted tools, to the group that brings it in
+TOOL_GROUPS = {
+    "web_search_preview": "web",
+    "calculate_compound_interest": "interest",
+    "compare_compound_interest": "interest",
+    "simulate_portfolio": "simulation",
+    "get_acct_details": "accounts",
+    "get_transaction_details": "transactions",
+}
+GROUP_KEYWORDS = {
+    "web": re.compile(
+        r"\b(?:latest|today|current(?:ly)?|news|right now|this (?:week|month|year)|market|stock price)\b",
+        re.IGNORECASE,
+    ),
+    "interest": re.compile(
+        r"\b(?:interest|compound\w*|apy|apr|savings?|cds?|grow\w*|invest\w*|deposit\w*|principal|how much will)\b",
+        re.IGNORECASE,
+    ),
+    "simulation": re.compile(
+        r"\b(?:simulat\w*|monte carlo|portfolio|retire\w*|stocks?|volatil\w*|risk\w*|index funds?|401k|ira)\b",
+        re.IGNORECASE,
+    ),
+}
+# Earlier messages scanned for account and transaction IDs the model could look up
+HISTORY_SCAN_MESSAGES = 6
+
+
+class ToolSet(NamedTuple):
+    """A subset of the agent's tools and how many prompt tokens it costs, counted once"""
+
+    groups: FrozenSet[str]
+    tools: List[Dict[str, Any]]
+    tokens: int
+
+
+def _tool_key(tool: Dict[str, Any]) -> str:
+    return tool.get("name") or tool["type"]
+
+
+class ToolSelector:
+    """
+    Picks which of the agent's tools each model hop is sent.
+
+    A turn's tool groups come from its message keywords and from account or transaction IDs in
+    its context, message or recent history; the lookup tools are only useful with IDs to look
+    up. Short small talk gets no tools. A turn with no signal at all keeps every tool, so an
+    ambiguous question never loses one it needs. Each hop also gets the groups of tools earlier
+    hops already called.
+
+    Every combination of groups is built and counted up front, so a hop just looks its subset up.
+    """
+
+    def __init__(self, tools: List[Dict[str, Any]]):
+        groups = sorted({TOOL_GROUPS[_tool_key(tool)] for tool in tools if _tool_key(tool) in TOOL_GROUPS})
+        self.__groups = frozenset(groups)
+        self.__sets: Dict[FrozenSet[str], ToolSet] = {}
+        for size in range(len(groups) + 1):
+            for combination in itertools.combinations(groups, size):
+                selected = frozenset(combination)
+                # Tools outside every group are always sent; order is kept so prompt prefixes stay stable
+                subset = [
+                    tool
+                    for tool in tools
+                    if _tool_key(tool) not in TOOL_GROUPS or TOOL_GROUPS[_tool_key(tool)] in selected
+                ]
+                self.__sets[selected] = ToolSet(selected, subset, count_json_tokens(subset))
+        self.full_tokens = self.__sets[self.__groups].tokens
+
+    def select(
+        self, message: str, history: List[FormattedChatMessage], context: Optional[List[str]] = None
+    ) -> FrozenSet[str]:
+        """Returns the tool groups for a turn"""
+        if SMALLTALK.search(message) and len(message) < 80 and not context:
+            selected: FrozenSet[str] = frozenset()
+        else:
+            recent = " ".join(str(item.get("content", "")) for item in history[-HISTORY_SCAN_MESSAGES:])
+            text = " ".join([*(context or []), message, recent])
+            groups = {group for group, pattern in GROUP_KEYWORDS.items() if pattern.search(message)}
+            if ACCOUNT_ID.search(text):
+                groups.add("accounts")
+            if TRANSACTION_ID.search(text):
+                groups.add("transactions")
+            selected = frozenset(groups & self.__groups) or self.__groups
+        TOOL_SETS.inc(groups=",".join(sorted(selected)) or "none")
+        return selected
+
+    def for_hop(self, groups: FrozenSet[str], tools_used: Iterable[str]) -> ToolSet:
+        """Returns the tools for a hop: the turn's groups plus those of tools already called"""
+        used = {TOOL_GROUPS[name] for name in tools_used if name in TOOL_GROUPS}
+        tool_set = self.__sets[(groups | used) & self.__groups]
+        TOKENS_SAVED.inc(self.full_tokens - tool_set.tokens)
+        return tool_set
+
+    @staticmethod
+    def record_turn(tokens_saved: int):
+        """Reports the tool tokens a finished turn didn't send"""
+        TURN_TOKENS_SAVED.observe(tokens_saved)
@@ -2,6 +2,15 @@
 
 from app.utils.agent_params import *
 from app.utils.agent_tools import *
+from app.utils.charts import *
 from app.utils.format_history import *
+from app.utils.interest_engine import *
+from app.utils.message_patterns import *
+from app.utils.metrics import *
+from app.utils.monte_carlo import *
 from app.utils.prompts import *
+from app.utils.sse import *
+from app.utils.stream_json import *
+from app.utils.tokens import *
+from app.utils.tracing import *
 from app.utils.types import *
@@ -1,11 +1,13 @@
 # pylint: skip-file
 """Consts for all agent params"""
 
+from typing import Any, Dict, List
+
 from app.utils.prompts import AGENT_PROMPT
 
 AGENT_INSTRUCTIONS = AGENT_PROMPT
 AGENT_MODEL = "gpt-4o-mini"
-AGENT_TOOLS = [
+AGENT_TOOLS: List[Dict[str, Any]] = [
     {"type": "web_search_preview"},
     {
         "type": "function",
@@ -24,7 +26,7 @@ AGENT_TOOLS = [
                 },
                 "time_years": {
                     "type": "number",
-                    "description": "Investment time period in years (can be fractional)",
+                    "description": "Investment time period in years (can be fractional, maximum 100)",
                 },
                 "compounds_per_year": {
                     "type": ["integer", "string"],
@@ -57,6 +59,110 @@ AGENT_TOOLS = [
             "strict": True,
         },
     },
+    {
+        "type": "function",
+        "name": "compare_compound_interest",
+        "description": "Compare compound interest outcomes across every combination of rates, time periods, contributions and compounding frequencies in one call. Use this instead of calling calculate_compound_interest repeatedly for what-if comparisons.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "principal": {
+                    "type": "number",
+                    "description": "Initial investment amount",
+                },
+                "annual_rates": {
+                    "type": "array",
+                    "items": {"type": "number"},
+                    "description": "Annual interest rates to compare, as percentages (e.g., 5 for 5%)",
+                },
+                "time_years": {
+                    "type": "array",
+                    "items": {"type": "number"},
+                    "description": "Investment time periods to compare, in years (can be fractional, maximum 100)",
+                },
+                "additional_contributions": {
+                    "type": ["array", "null"],
+                    "items": {"type": "number"},
+                    "description": "Periodic contribution amounts to compare",
+                },
+                "compounds_per_year": {
+                    "type": ["array", "null"],
+                    "items": {"type": ["integer", "string"]},
+                    "description": "Compounding frequencies to compare, as integers or any of: 'daily', 'monthly', 'quarterly', 'semi-annually', 'annually'",
+                },
+                "contribution_frequency": {
+                    "type": ["string", "null"],
+                    "enum": ["monthly", "quarterly", "annually"],
+                    "description": "Frequency of additional contributions",
+                },
+            },
+            "required": [
+                "principal",
+                "annual_rates",
+                "time_years",
+                "additional_contributions",
+                "compounds_per_year",
+                "contribution_frequency",
+            ],
+            "additionalProperties": False,
+        },
+        "strict": True,
+    },
+    {
+        "type": "function",
+        "name": "simulate_portfolio",
+        "description": "Run a Monte Carlo simulation of portfolio growth with monthly contributions and return percentile bands of outcomes per year. Use this when the user asks about a range of possible outcomes instead of a single deterministic projection.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "principal": {
+                    "type": "number",
+                    "description": "Initial investment amount",
+                },
+                "expected_return": {
+                    "type": "number",
+                    "description": "Expected annual return as a percentage (e.g., 7 for 7%)",
+                },
+                "volatility": {
+                    "type": "number",
+                    "description": "Annual volatility of returns as a percentage (e.g., 15 for a diversified stock portfolio)",
+                },
+                "time_years": {
+                    "type": "integer",
+                    "description": "Projection horizon in whole years (maximum 50)",
+                },
+                "monthly_contribution": {
+                    "type": ["number", "null"],
+                    "description": "Amount contributed at the end of every month",
+                },
+                "paths": {
+                    "type": ["integer", "null"],
+                    "description": "Number of simulated paths (default 5000, maximum 20000)",
+                },
+                "seed": {
+                    "type": ["integer", "null"],
+                    "description": "Random seed for a reproducible simulation",
+                },
+                "percentiles": {
+                    "type": ["array", "null"],
+                    "items": {"type": "number"},
+                    "description": "Percentiles to report (default 10, 25, 50, 75, 90)",
+                },
+            },
+            "required": [
+                "principal",
+                "expected_return",
+                "volatility",
+                "time_years",
+                "monthly_contribution",
+                "paths",
+                "seed",
+                "percentiles",
+            ],
+            "additionalProperties": False,
+        },
+        "strict": True,
+    },
     {
         "type": "function",
         "name": "get_acct_details",
@@ -1,14 +1,12 @@
 # pylint: skip-file
 """The functions provided to the AI agent"""
 
-import logging
-import os
-import traceback
-from decimal import ROUND_HALF_UP, Decimal
-from typing import Dict, Literal, Union
+from typing import Any, Dict, List, Literal, Optional, Union
 
-import requests
-from dotenv import load_dotenv
+import numpy as np
+
+from app.utils.charts import CHART_KEY, bar_chart, line_chart
+from app.utils.interest_engine import MAX_YEARS, compound_interest_grid
 
 
 def calculate_compound_interest(
@@ -21,14 +19,14 @@ def calculate_compound_interest(
     additional_contribution: float = 0,
     contribution_frequency: Literal["monthly", "quarterly", "annually"] = "monthly",
     rounding_decimals: int = 2,
-) -> Dict[str, Union[float, Dict[int, float]]]:
+) -> Dict[str, Any]:
     """
     Calculate compound interest with optional periodic contributions.
 
     Args:
         principal: Initial investment amount
         annual_rate: Annual interest rate as a percentage (e.g., 5 for 5%)
-        time_years: Investment time period in years (can be fractional)
+        time_years: Investment time period in years (can be fractional), capped at MAX_YEARS
         compounds_per_year: Number of times interest compounds per year
             Can be an integer or one of: 'daily', 'monthly', 'quarterly', 'semi-annually', 'annually'
         additional_contribution: Additional periodic contribution amount
@@ -41,6 +39,7 @@ def calculate_compound_interest(
         - interest_earned: Total interest earned
         - contributions_total: Total amount contributed
         - yearly_breakdown: Dict of year-by-year balances
+        - chart: Line chart of the yearly balances, delivered to the client directly
 
     Raises:
         ValueError: If input parameters are invalid
@@ -58,214 +57,124 @@ def calculate_compound_interest(
         contribution_frequency = "monthly"
     if not rounding_decimals:
         rounding_decimals = 2
-
-    # Convert annual_rate to decimal
-    rate = annual_rate / 100
-
-    # Convert string compound frequencies to numbers
-    compounds_mapping = {
-        "daily": 365,
-        "monthly": 12,
-        "quarterly": 4,
-        "semi-annually": 2,
-        "annually": 1,
-    }
-
-    if isinstance(compounds_per_year, str):
-        if compounds_per_year not in compounds_mapping:
-            raise ValueError(
-                f"Invalid compounding frequency. Must be one of {list(compounds_mapping.keys())}"
-            )
-        compounds_per_year = compounds_mapping[compounds_per_year]
-
-    # Convert contribution frequency to number of contributions per year
-    contribution_mapping = {"monthly": 12, "quarterly": 4, "annually": 1}
-    contributions_per_year = contribution_mapping[contribution_frequency]
-
-    # Initialize tracking variables
-    yearly_breakdown = {}
-    total = Decimal(str(principal))
-    total_contributions = Decimal(str(principal))
-
-    # Calculate compound interest year by year
-    for year in range(1, int(time_years) + 1):
-        # Compound interest on existing balance
-        total *= (1 + Decimal(str(rate)) / compounds_per_year) ** compounds_per_year
-
-        # Add periodic contributions
-        contribution_amount = Decimal(additional_contribution) * contributions_per_year
-        total += contribution_amount
-        total_contributions += contribution_amount
-
-        # Store yearly balance
-        yearly_breakdown[year] = float(
-            total.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        )
-
-    # Handle partial final year if time_years is not a whole number
-    if time_years % 1 > 0:
-        remaining_time = time_years % 1
-        # Compound interest for partial year
-        total *= (1 + Decimal(str(rate)) / Decimal(str(compounds_per_year))) ** (
-            Decimal(str(compounds_per_year)) * Decimal(str(remaining_time))
-        )
-        # Add contributions for partial year
-        partial_contributions = (
-            Decimal(str(additional_contribution))
-            * Decimal(str(contributions_per_year))
-            * Decimal(str(remaining_time))
-        )
-        total += partial_contributions
-        total_contributions += partial_contributions
-        yearly_breakdown[int(time_years) + 1] = float(
-            total.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-        )
-
-    # Prepare results
-    final_amount = float(total.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
-    interest_earned = final_amount - float(total_contributions)
+    time_years = min(time_years, MAX_YEARS)
+
+    # A single scenario of the vectorized engine, with Decimal final values
+    grid = compound_interest_grid(
+        principal=principal,
+        annual_rates=[annual_rate],
+        time_years=[time_years],
+        additional_contributions=[additional_contribution],
+        compounds_per_year=[compounds_per_year],
+        contribution_frequency=contribution_frequency,
+        exact=True,
+    )
+    yearly_breakdown = _yearly_balances(np.asarray(grid["schedule"])[0])
 
     return {
-        "total_amount": final_amount,
-        "interest_earned": round(interest_earned, rounding_decimals),
-        "contributions_total": float(total_contributions),
+        "total_amount": float(grid["exact_total_amount"][0]),
+        "interest_earned": round(float(grid["exact_interest_earned"][0]), rounding_decimals),
+        "contributions_total": float(grid["exact_contributions_total"][0]),
         "yearly_breakdown": yearly_breakdown,
+        CHART_KEY: _balance_chart(yearly_breakdown, time_years),
     }
 
 
-def get_acct_details(acct_ids: list[str]):
-    """
-    Retrieves detailed account information for multiple accounts from a financial connections API endpoint.
-
-    Args:
-        acct_ids (list[str]): A list of unique account IDs to retrieve details for.
-
-    Returns:
-        list[dict]: A list of JSON responses containing account details.
-
-    Raises:
-        requests.exceptions.HTTPError: If any API request fails.
-        requests.exceptions.RequestException: For other request-related errors.
-        OSError: If environment variables are not properly configured.
-    """
-
-    load_dotenv()
-    API_URL = os.getenv("API_URL")
-
-    if not API_URL:
-        raise OSError("API_URL environment variable is not set.")
-
-    headers = {"Content-Type": "application/json"}
-    account_details = []
-
-    for acct_id in acct_ids:
-        url = f"{API_URL}/financial-connections/accounts/{acct_id}"
-        response = requests.get(url, headers=headers, timeout=10)
+def _yearly_balances(schedule: np.ndarray) -> Dict[int, float]:
+    """Maps each year of one scenario's schedule to its balance in cents, skipping the NaN past the horizon"""
+    balances = np.round(schedule[1:], 2).tolist()
+    return {year: balance for year, balance in enumerate(balances, start=1) if balance == balance}
 
-        if response.status_code == 200:
-            data = response.json()
 
-            # Convert balance values from cents to dollars
-            if "balance" in data:
-                balance = data["balance"]
-                if "cash" in balance and "available" in balance["cash"]:
-                    balance["cash"]["available"]["usd"] /= 100
-                if "current" in balance:
-                    balance["current"]["usd"] /= 100
+def _balance_chart(yearly_breakdown: Dict[int, float], time_years: float):
+    """Line chart of a schedule, labelling a fractional final year with the exact horizon"""
+    return line_chart((f"Year {min(year, time_years):g}", amount) for year, amount in yearly_breakdown.items())
 
-            account_details.append(data)
-        else:
-            response.raise_for_status()
 
-    return account_details
+MAX_COMPARISON_SCENARIOS = 60
+# How each compared input is shown in a scenario's chart label
+SCENARIO_LABELS = {
+    "annual_rate": "{:g}%",
+    "time_years": "{:g} years",
+    "additional_contribution": "+{:g}",
+    "compounds_per_year": "{}x a year",
+}
 
 
-def get_transaction_details(transaction_ids: list[str]):
+def compare_compound_interest(
+    principal: float,
+    annual_rates: List[float],
+    time_years: List[float],
+    additional_contributions: Optional[List[float]] = None,
+    compounds_per_year: Optional[List[Union[int, str]]] = None,
+    contribution_frequency: Optional[Literal["monthly", "quarterly", "annually"]] = None,
+) -> Dict[str, Any]:
     """
-    Retrieves detailed account information for multiple transactions from a financial connections API endpoint.
+    Compare compound interest outcomes across a grid of scenarios in a single call.
+
+    Every combination of the given rates, horizons, contributions and compounding frequencies is
+    evaluated. Final values are computed with Decimal arithmetic, as in
+    calculate_compound_interest. The final balances are charted for the client rather than
+    returned year by year.
 
     Args:
-        transaction_ids (list[str]): A list of unique transaction IDs to retrieve details for.
+        principal: Initial investment amount
+        annual_rates: Annual interest rates as percentages (e.g., 5 for 5%)
+        time_years: Investment time periods in years (can be fractional), each capped at MAX_YEARS
+        additional_contributions: Periodic contribution amounts to compare
+        compounds_per_year: Compounding frequencies to compare, as integers or names like 'monthly'
+        contribution_frequency: Frequency of additional contributions
 
     Returns:
-        list[dict]: A list of JSON responses containing transaction details.
+        Dict containing:
+        - scenarios: One entry per combination with its inputs, total_amount, interest_earned
+          and contributions_total
+        - chart: Bar chart of each scenario's total, or the yearly balances of a single scenario,
+          delivered to the client directly
 
     Raises:
-        requests.exceptions.HTTPError: If any API request fails.
-        requests.exceptions.RequestException: For other request-related errors.
-        OSError: If environment variables are not properly configured.
+        ValueError: If input parameters are invalid or describe too many scenarios
     """
-    # Configure logging
-    logger = logging.getLogger(__name__)
-
-    try:
-        load_dotenv()
-        API_URL = os.getenv("API_URL")
-
-        logger.info(f"API_URL: {API_URL}")
-
-        if not API_URL:
-            logger.error("API_URL environment variable is not set")
-            raise OSError("API_URL environment variable is not set.")
-
-        headers = {"Content-Type": "application/json"}
-        transaction_details = []
-
-        logger.info(f"Processing {len(transaction_ids)} transaction IDs")
-
-        for transaction_id in transaction_ids:
-            try:
-                url = f"{API_URL}/financial-connections/transactions/{transaction_id}"
-                logger.info(f"Making request to: {url}")
-
-                response = requests.get(url, headers=headers, timeout=10)
-                logger.info(f"Response status code: {response.status_code}")
-
-                if response.status_code == 200:
-                    data = response.json()
-                    logger.debug(f"Raw response data: {data}")
-
-                    # Convert balance values from cents to dollars
-                    if "amount" in data:
-                        data["amount"] /= 100
-                        logger.debug(f"Converted amount to dollars: {data['amount']}")
-
-                    transaction_details.append(data)
-                else:
-                    logger.error(
-                        f"Request failed with status code: {response.status_code}"
-                    )
-                    logger.error(f"Response content: {response.text}")
-                    response.raise_for_status()
-            except requests.exceptions.HTTPError as http_err:
-                logger.error(
-                    f"HTTP error for transaction ID {transaction_id}: {http_err}"
-                )
-                logger.error(
-                    f"Response details: {response.text if 'response' in locals() else 'No response'}"
-                )
-                raise
-            except requests.exceptions.RequestException as req_err:
-                logger.error(
-                    f"Request error for transaction ID {transaction_id}: {req_err}"
-                )
-                raise
-            except Exception as e:
-                logger.error(
-                    f"Unexpected error for transaction ID {transaction_id}: {e}"
-                )
-                logger.error(f"Traceback: {traceback.format_exc()}")
-                raise
-
-        logger.info(
-            f"Successfully retrieved details for {len(transaction_details)} transactions"
+    additional_contributions = additional_contributions or [0]
+    compounds_per_year = compounds_per_year or [12]
+    contribution_frequency = contribution_frequency or "monthly"
+
+    scenario_count = len(annual_rates) * len(time_years) * len(additional_contributions) * len(compounds_per_year)
+    if scenario_count > MAX_COMPARISON_SCENARIOS:
+        raise ValueError(f"Too many scenarios ({scenario_count}). The maximum is {MAX_COMPARISON_SCENARIOS}")
+
+    grid = compound_interest_grid(
+        principal=principal,
+        annual_rates=annual_rates,
+        time_years=time_years,
+        additional_contributions=additional_contributions,
+        compounds_per_year=compounds_per_year,
+        contribution_frequency=contribution_frequency,
+        exact=True,
+    )
+
+    scenarios = [
+        {
+            "annual_rate": float(grid["annual_rate"][index]),
+            "time_years": float(grid["time_years"][index]),
+            "additional_contribution": float(grid["additional_contribution"][index]),
+            "compounds_per_year": int(grid["compounds_per_year"][index]),
+            "total_amount": float(grid["exact_total_amount"][index]),
+            "interest_earned": float(grid["exact_interest_earned"][index]),
+            "contributions_total": float(grid["exact_contributions_total"][index]),
+        }
+        for index in range(scenario_count)
+    ]
+
+    # The model only gets final values; the client gets the chart, which would otherwise cost up
+    # to MAX_YEARS balances per scenario in the prompt
+    if scenario_count == 1:
+        chart = _balance_chart(_yearly_balances(np.asarray(grid["schedule"])[0]), scenarios[0]["time_years"])
+    else:
+        varying = [key for key in SCENARIO_LABELS if len({scenario[key] for scenario in scenarios}) > 1]
+        chart = bar_chart(
+            (" / ".join(SCENARIO_LABELS[key].format(scenario[key]) for key in varying), scenario["total_amount"])
+            for scenario in scenarios
         )
-        return transaction_details
 
-    except OSError as os_err:
-        logger.error(f"OS Error: {os_err}")
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error in get_transaction_details: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        raise
+    return {"scenarios": scenarios, CHART_KEY: chart}
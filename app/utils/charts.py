@@ -0,0 +1,38 @@
+"""Chart-ready series that tools attach to their results"""
+
+from typing import Any, Iterable, Optional, Tuple
+
+from app.utils.types import ChartType, GraphResponse
+
+# Tools return a GraphResponse under this key. The agent sends it straight to the client and
+# only tells the model it was shown, so the model never has to write the numbers out itself.
+CHART_KEY = "chart"
+
+
+def _chart(chart_type: ChartType, points: Iterable[Tuple[str, float]]) -> GraphResponse:
+    return {
+        "type": chart_type,
+        "data": [{"label": label, "amount": amount} for label, amount in points],
+    }
+
+
+def line_chart(points: Iterable[Tuple[str, float]]) -> GraphResponse:
+    """Builds a line chart from (label, amount) pairs"""
+    return _chart(ChartType.LINE, points)
+
+
+def bar_chart(points: Iterable[Tuple[str, float]]) -> GraphResponse:
+    """Builds a bar chart from (label, amount) pairs"""
+    return _chart(ChartType.BAR, points)
+
+
+def as_graph(value: Any) -> Optional[GraphResponse]:
+    """Returns a graph the model wrote as a GraphResponse, or None if it doesn't have that shape"""
+    if not isinstance(value, dict) or not isinstance(value.get("data"), list):
+        return None
+    try:
+        chart_type = ChartType(value.get("type"))
+    except ValueError:
+        return None
+    points = [point for point in value["data"] if isinstance(point, dict) and "label" in point and "amount" in point]
+    return _chart(chart_type, ((point["label"], point["amount"]) for point in points))
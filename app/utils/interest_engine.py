@@ -0,0 +1,168 @@
+"""Vectorized compound interest engine for evaluating many scenarios in one call"""
+
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import product
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+
+COMPOUNDING_FREQUENCIES = {
+    "daily": 365,
+    "monthly": 12,
+    "quarterly": 4,
+    "semi-annually": 2,
+    "annually": 1,
+}
+CONTRIBUTION_FREQUENCIES = {"monthly": 12, "quarterly": 4, "annually": 1}
+
+CENT = Decimal("0.01")
+# Longer horizons are capped, so a model-supplied time_years can't build arbitrarily large schedules
+MAX_YEARS = 100
+
+
+def parse_compounds_per_year(value: Union[int, float, str]) -> int:
+    """Returns the periods per year for a count, a numeric string such as "12", or a name such as 'monthly'"""
+    if isinstance(value, str):
+        if value in COMPOUNDING_FREQUENCIES:
+            return COMPOUNDING_FREQUENCIES[value]
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(
+                f"Invalid compounding frequency. Must be a positive integer or one of {list(COMPOUNDING_FREQUENCIES)}"
+            ) from None
+    if int(value) < 1:
+        raise ValueError("Compounding frequency must be at least once a year")
+    return int(value)
+
+
+def compound_interest_grid(
+    principal: float,
+    annual_rates: Sequence[float],
+    time_years: Sequence[float],
+    additional_contributions: Sequence[float] = (0,),
+    compounds_per_year: Sequence[Union[int, str]] = (12,),
+    contribution_frequency: str = "monthly",
+    exact: bool = False,
+) -> Dict[str, Union[np.ndarray, List[Decimal]]]:
+    """
+    Evaluates every combination of rate, horizon, contribution and compounding frequency at once.
+
+    Interest compounds on the balance each year, then a year's worth of contributions is added.
+    Whole years use the closed-form annuity formula, and a fractional final year compounds for the
+    remaining fraction.
+
+    Args:
+        principal: Initial investment amount
+        annual_rates: Annual interest rates as percentages (e.g., 5 for 5%)
+        time_years: Investment horizons in years (can be fractional), capped at MAX_YEARS
+        additional_contributions: Periodic contribution amounts
+        compounds_per_year: Compounding frequencies, as integers or names like 'monthly'
+        contribution_frequency: Frequency of additional contributions
+        exact: Also compute final values with Decimal arithmetic, rounded to cents for display
+
+    Returns:
+        Dict of arrays with one row per scenario:
+        - annual_rate, time_years, additional_contribution, compounds_per_year: scenario inputs
+        - schedule: (scenarios, years + 1) balances at the end of each year, NaN past the horizon
+        - total_amount, contributions_total, interest_earned: final values
+        - exact_total_amount, exact_contributions_total, exact_interest_earned: Decimal values, if exact
+
+    Raises:
+        ValueError: If input parameters are invalid
+    """
+    if principal < 0 or any(rate < 0 for rate in annual_rates) or any(years <= 0 for years in time_years):
+        raise ValueError("Principal, rate, and time must be positive numbers")
+    if contribution_frequency not in CONTRIBUTION_FREQUENCIES:
+        raise ValueError(f"Invalid contribution frequency. Must be one of {list(CONTRIBUTION_FREQUENCIES.keys())}")
+
+    frequencies = [parse_compounds_per_year(value) for value in compounds_per_year]
+    horizons = [min(years, MAX_YEARS) for years in time_years]
+    scenarios = np.array(
+        list(product(annual_rates, horizons, additional_contributions, frequencies)),
+        dtype=float,
+    ).reshape(-1, 4)
+    rates, years, contributions, compounds = scenarios.T
+
+    period_growth = 1 + rates / 100 / compounds
+    yearly_growth = period_growth**compounds
+    annual_contribution = contributions * CONTRIBUTION_FREQUENCIES[contribution_frequency]
+    whole_years = np.floor(years)
+    partial_years = years - whole_years
+
+    # Balance at the end of every whole year, via the closed-form annuity formula
+    max_years = int(np.ceil(years.max()))
+    elapsed = np.arange(max_years + 1, dtype=float)
+    growth = yearly_growth[:, None] ** elapsed[None, :]
+    # Rows with no growth to speak of accumulate contributions linearly, rather than dividing by ~0
+    flat = np.abs(yearly_growth - 1) <= 1e-5
+    denominator = np.where(flat, 1.0, yearly_growth - 1)
+    annuity = np.where(flat[:, None], elapsed[None, :], (growth - 1) / denominator[:, None])
+    schedule = principal * growth + annual_contribution[:, None] * annuity
+
+    # A fractional final year compounds and contributes for the remaining fraction only
+    rows = np.arange(len(scenarios))
+    whole_index = whole_years.astype(int)
+    final = schedule[rows, whole_index]
+    has_partial = partial_years > 0
+    if has_partial.any():
+        final = final * period_growth ** (compounds * partial_years) + annual_contribution * partial_years
+        schedule[rows[has_partial], whole_index[has_partial] + 1] = final[has_partial]
+    last_year = np.ceil(years)
+    if (last_year < max_years).any():
+        schedule[elapsed[None, :] > last_year[:, None]] = np.nan
+
+    contributions_total = principal + annual_contribution * years
+    result: Dict[str, Union[np.ndarray, List[Decimal]]] = {
+        "annual_rate": rates,
+        "time_years": years,
+        "additional_contribution": contributions,
+        "compounds_per_year": compounds.astype(int),
+        "schedule": schedule,
+        "total_amount": final,
+        "contributions_total": contributions_total,
+        "interest_earned": final - contributions_total,
+    }
+
+    if exact:
+        exact_values = [
+            _exact_final_values(principal, annual_rate, horizon, contribution, frequency, contribution_frequency)
+            for annual_rate, horizon, contribution, frequency in scenarios.tolist()
+        ]
+        result["exact_total_amount"] = [total for total, _, _ in exact_values]
+        result["exact_contributions_total"] = [contributed for _, contributed, _ in exact_values]
+        result["exact_interest_earned"] = [interest for _, _, interest in exact_values]
+
+    return result
+
+
+def _exact_final_values(
+    principal: float,
+    annual_rate: float,
+    time_years: float,
+    additional_contribution: float,
+    compounds_per_year: float,
+    contribution_frequency: str,
+):
+    """Decimal version of the closed-form final balance, rounded to cents"""
+    compounds = Decimal(int(compounds_per_year))
+    rate_per_period = Decimal(str(annual_rate)) / 100 / compounds
+    whole_years = int(time_years)
+    partial_years = Decimal(str(time_years)) - whole_years
+    annual_contribution = Decimal(str(additional_contribution)) * CONTRIBUTION_FREQUENCIES[contribution_frequency]
+    principal_value = Decimal(str(principal))
+
+    yearly_growth = (1 + rate_per_period) ** int(compounds)
+    growth = yearly_growth**whole_years
+    if yearly_growth == 1:
+        total = principal_value + annual_contribution * whole_years
+    else:
+        total = principal_value * growth + annual_contribution * (growth - 1) / (yearly_growth - 1)
+
+    if partial_years > 0:
+        total *= (1 + rate_per_period) ** (compounds * partial_years)
+        total += annual_contribution * partial_years
+
+    contributions_total = principal_value + annual_contribution * Decimal(str(time_years))
+    total_amount = total.quantize(CENT, rounding=ROUND_HALF_UP)
+    return total_amount, contributions_total.quantize(CENT), (total_amount - contributions_total).quantize(CENT)
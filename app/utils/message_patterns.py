@@ -0,0 +1,12 @@
+"""Patterns for reading cheap signals out of user messages and their context"""
+
+import re
+
+# Stripe Financial Connections accounts and transactions
+ACCOUNT_ID = re.compile(r"\b(?:fca|acct)_[A-Za-z0-9]{6,}")
+TRANSACTION_ID = re.compile(r"\b(?:fctxn|txn)_[A-Za-z0-9]{6,}")
+# Greetings, thanks and acknowledgements at the start of a message
+SMALLTALK = re.compile(
+    r"^\W*(?:hi|hello|hey|thanks|thank you|thx|ok|okay|cool|great|nice|got it|bye|good (?:morning|night))\b",
+    re.IGNORECASE,
+)
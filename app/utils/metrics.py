@@ -0,0 +1,152 @@
+"""In-process metrics registry rendered in the Prometheus text format"""
+
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.__values: Dict[LabelKey, float] = {}
+        self.__lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """Increments the counter for the given labels"""
+        key = _label_key(labels)
+        with self.__lock:
+            self.__values[key] = self.__values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Returns the current value for the given labels"""
+        return self.__values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        """Returns the exposition lines for this metric"""
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.__values.items()]
+
+
+class Gauge:
+    """Value that can go up and down, optionally split by labels"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.__values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels: str):
+        """Sets the gauge for the given labels"""
+        self.__values[_label_key(labels)] = value
+
+    def value(self, **labels: str) -> float:
+        """Returns the current value for the given labels"""
+        return self.__values.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        """Returns the exposition lines for this metric"""
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.__values.items()]
+
+
+class Histogram:
+    """Bucketed distribution of observed values, optionally split by labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.__counts: Dict[LabelKey, List[int]] = {}
+        self.__sums: Dict[LabelKey, float] = {}
+        self.__lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        """Records a single observation for the given labels"""
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.__lock:
+            counts = self.__counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self.__sums[key] = self.__sums.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        """Returns the number of observations for the given labels"""
+        return sum(self.__counts.get(_label_key(labels), []))
+
+    def total(self, **labels: str) -> float:
+        """Returns the sum of observations for the given labels"""
+        return self.__sums.get(_label_key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        """Returns the exposition lines for this metric"""
+        lines = []
+        for key, counts in self.__counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {self.__sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric in the process so they can be scraped together"""
+
+    def __init__(self):
+        self.__metrics: Dict[str, object] = {}
+        self.__lock = threading.Lock()
+
+    def counter(self, name: str, description: str) -> Counter:
+        """Returns the counter with this name, creating it if needed"""
+        return self.__get_or_create(name, lambda: Counter(name, description))
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        """Returns the gauge with this name, creating it if needed"""
+        return self.__get_or_create(name, lambda: Gauge(name, description))
+
+    def histogram(self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Returns the histogram with this name, creating it if needed"""
+        return self.__get_or_create(name, lambda: Histogram(name, description, buckets))
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in list(self.__metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.description}")  # type: ignore[attr-defined]
+            lines.append(f"# TYPE {metric.name} {metric.kind}")  # type: ignore[attr-defined]
+            lines.extend(metric.samples())  # type: ignore[attr-defined]
+        return "\n".join(lines) + "\n"
+
+    def __get_or_create(self, name, factory):
+        with self.__lock:
+            if name not in self.__metrics:
+                self.__metrics[name] = factory()
+            return self.__metrics[name]
+
+
+METRICS = MetricsRegistry()
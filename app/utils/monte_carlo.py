@@ -0,0 +1,119 @@
+"""Monte Carlo portfolio projection, designed to run inside a worker process"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.utils.charts import CHART_KEY, line_chart
+
+MAX_PATHS = 20000
+MAX_YEARS = 50
+CHUNK_SIZE = 1000
+DEFAULT_PERCENTILES: List[float] = [10, 25, 50, 75, 90]
+
+
+def simulate_portfolio(
+    principal: float,
+    expected_return: float,
+    volatility: float,
+    time_years: int,
+    monthly_contribution: Optional[float] = None,
+    paths: Optional[int] = None,
+    seed: Optional[int] = None,
+    percentiles: Optional[List[float]] = None,
+    cpu_time_limit: float = 2.0,
+) -> Dict[str, Any]:
+    """
+    Simulate portfolio growth with monthly contributions over many random return paths.
+
+    Monthly log returns are drawn from a normal distribution matching the given annual expected
+    return and volatility. Paths are simulated in chunks, and simulation stops early once
+    `cpu_time_limit` seconds of CPU time have been used.
+
+    Args:
+        principal: Initial investment amount
+        expected_return: Expected annual return as a percentage (e.g., 7 for 7%)
+        volatility: Annual volatility (standard deviation of returns) as a percentage
+        time_years: Projection horizon in whole years
+        monthly_contribution: Amount added at the end of every month
+        paths: Number of simulated paths, capped at MAX_PATHS
+        seed: Seed for a reproducible simulation
+        percentiles: Percentiles to report, defaults to 10/25/50/75/90
+        cpu_time_limit: CPU seconds the simulation may use before stopping early
+
+    Returns:
+        Dict containing:
+        - labels: Year labels for each point in the series
+        - percentile_series: Chart-ready {"label", "amount"} series for each percentile
+        - contributions_total: Total amount contributed including the principal
+        - paths_simulated: Number of paths actually simulated
+        - truncated: Whether the CPU time limit stopped the simulation early
+        - chart: Line chart of the median path, when the 50th percentile was requested
+
+    Raises:
+        ValueError: If input parameters are invalid
+    """
+    if principal < 0 or volatility < 0 or time_years <= 0:
+        raise ValueError("Principal, volatility, and time must be positive numbers")
+    if expected_return <= -100:
+        raise ValueError("Expected return must be greater than -100%")
+    if paths is not None and paths < 1:
+        raise ValueError("Paths must be at least 1")
+    levels: List[float] = list(percentiles) if percentiles else DEFAULT_PERCENTILES
+    if any(not 0 <= percentile <= 100 for percentile in levels):
+        raise ValueError("Percentiles must be between 0 and 100")
+
+    start = time.process_time()
+    years = min(int(time_years), MAX_YEARS)
+    months = years * 12
+    total_paths = min(int(paths or 5000), MAX_PATHS)
+    contribution = monthly_contribution or 0
+
+    annual_mean = expected_return / 100
+    annual_sigma = volatility / 100
+    monthly_mu = (np.log1p(annual_mean) - annual_sigma**2 / 2) / 12
+    monthly_sigma = annual_sigma / np.sqrt(12)
+
+    rng = np.random.default_rng(seed)
+    year_end_balances = []
+    simulated = 0
+    truncated = False
+
+    while simulated < total_paths:
+        if simulated and time.process_time() - start > cpu_time_limit:
+            truncated = True
+            break
+
+        size = min(CHUNK_SIZE, total_paths - simulated)
+        growth = np.exp(rng.normal(monthly_mu, monthly_sigma, size=(size, months)))
+        balances = np.empty((size, years + 1))
+        balances[:, 0] = principal
+        balance = np.full(size, float(principal))
+        for month in range(months):
+            balance = balance * growth[:, month] + contribution
+            if (month + 1) % 12 == 0:
+                balances[:, (month + 1) // 12] = balance
+        year_end_balances.append(balances)
+        simulated += size
+
+    all_balances = np.concatenate(year_end_balances)
+    bands = np.percentile(all_balances, levels, axis=0)
+    labels = [f"Year {year}" for year in range(years + 1)]
+
+    percentile_series: Dict[str, List[Dict[str, Any]]] = {
+        f"p{percentile:g}": [
+            {"label": label, "amount": round(float(amount), 2)} for label, amount in zip(labels, band)
+        ]
+        for percentile, band in zip(levels, bands)
+    }
+    result: Dict[str, Any] = {
+        "labels": labels,
+        "percentile_series": percentile_series,
+        "contributions_total": round(principal + contribution * months, 2),
+        "paths_simulated": simulated,
+        "truncated": truncated,
+    }
+    if "p50" in percentile_series:
+        result[CHART_KEY] = line_chart((point["label"], point["amount"]) for point in percentile_series["p50"])
+    return result
@@ -147,6 +147,14 @@ Don't include "graph" when:
 - Answering yes/no questions
 - Giving qualitative responses
 
+CHARTS FROM TOOLS:
+When a tool result contains "chart": {"id": "...", "shown_to_user": true}, that chart has already been
+shown to the user. Don't copy its numbers into "graph"; reference it instead:
+{
+  "message": "...",
+  "graph": {"series_ref": "chart_1"}
+}
+
 EXAMPLE RESPONSES:
 
 For a simple advice question:
@@ -199,4 +207,18 @@ IMPORTANT RULES:
 6. Don't make specific investment recommendations
 7. Don't provide tax advice
 8. Don't promise specific returns
+9. Never rewrite a chart that was already shown to the user, use "series_ref" instead
+"""
+
+FORCED_ANSWER_PROMPT = (
+    "No more tools can be used for this message. Answer the user's question now with the information you "
+    "already have, in the usual JSON format, and briefly say if anything could not be looked up."
+)
+
+CONTEXT_SUMMARY_PROMPT = """
+  You maintain a running summary of a conversation between a user and a financial advisor AI.
+  You will be given the current summary (which may be empty) followed by the messages that happened after it.
+  Return an updated summary in plain text that keeps every fact needed to continue the conversation:
+  the user's goals, figures they shared, accounts or transactions discussed, and advice already given.
+  Keep it under 200 words and do not add anything that was not said.
 """
@@ -0,0 +1,184 @@
+"""Server-sent event framing and delivery"""
+
+import asyncio
+from typing import Any, AsyncGenerator, Awaitable, Callable, List, NamedTuple, Optional, Set, Tuple, Union
+
+import orjson
+
+from app.utils.metrics import METRICS
+
+SSE_DONE = "data: [DONE]\n\n"
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+SSE_WRITES = METRICS.counter("sse_writes_total", "Chunks written to SSE streams")
+SSE_DELTAS_COALESCED = METRICS.counter(
+    "sse_deltas_coalesced_total", "Text deltas merged into the frame of the delta before them"
+)
+
+_END = object()
+# Keeps cancelled producers referenced until their cleanup has finished
+_DRAINING: Set["asyncio.Task[None]"] = set()
+
+
+class SSEDelta(NamedTuple):
+    """A text delta, framed as {field: text}, that may be merged with the deltas next to it"""
+
+    text: str
+    field: str = "delta"
+    event: Optional[str] = None
+
+
+class SSECoalescing:
+    """
+    Batches frames into fewer, larger writes. A batch is written once it holds max_bytes of
+    text or max_delay seconds after its first frame, whichever comes first, and consecutive
+    deltas in it are merged into one frame.
+    """
+
+    def __init__(self, max_bytes: int = 512, max_delay: float = 0.05):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+
+
+def format_sse(data: Any, event: Optional[str] = None) -> str:
+    """Frames data as a server-sent event, JSON-encoding anything that isn't already a string"""
+    payload = data if isinstance(data, str) else orjson.dumps(data, option=ORJSON_OPTIONS).decode()
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+
+class _FrameBatch:
+    """Frames waiting to be written together, with the current run of deltas kept unframed"""
+
+    def __init__(self):
+        self.frames: List[str] = []
+        self.size = 0
+        self.has_delta = False
+        self.__deltas: List[str] = []
+        self.__key: Optional[Tuple[str, Optional[str]]] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.frames or self.__deltas)
+
+    def add(self, item: Union[str, SSEDelta]):
+        """Adds a frame, merging a delta into the run before it when the run has the same event"""
+        if isinstance(item, SSEDelta):
+            key = (item.field, item.event)
+            if key != self.__key:
+                self.__close_run()
+                self.__key = key
+            self.__deltas.append(item.text)
+            # Characters rather than encoded bytes, which is close enough for a flush threshold
+            self.size += len(item.text)
+            self.has_delta = True
+        else:
+            self.__close_run()
+            self.frames.append(item)
+            self.size += len(item)
+
+    def take(self) -> str:
+        """Returns the batch as one chunk and empties it"""
+        self.__close_run()
+        chunk = "".join(self.frames)
+        self.frames = []
+        self.size = 0
+        self.has_delta = False
+        return chunk
+
+    def __close_run(self):
+        if self.__deltas:
+            field, event = self.__key
+            SSE_DELTAS_COALESCED.inc(len(self.__deltas) - 1)
+            self.frames.append(format_sse({field: "".join(self.__deltas)}, event=event))
+            self.__deltas = []
+            self.__key = None
+
+
+async def stream_until_disconnect(
+    frames: AsyncGenerator[Union[str, SSEDelta], None],
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    poll_interval: float = 1.0,
+    max_buffered: int = 64,
+    coalescing: Optional[SSECoalescing] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Relays frames from a generator that runs in its own task, and cancels that task as soon as
+    the client goes away.
+
+    The server cancels the response when it notices a disconnect; running the generator in a
+    separate task means its cleanup (closing upstream streams, recording partial output) still
+    runs to completion. is_disconnected is polled while no frames are flowing, for servers that
+    only report a disconnect on the next write.
+
+    Without coalescing every frame, and every delta, is written on its own. With it, frames are
+    batched per SSECoalescing, except that the first delta is written at once so batching never
+    holds back the first token.
+    """
+    queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=max_buffered)
+
+    async def produce():
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+        except Exception as e:  # pylint: disable=W0718
+            await queue.put(e)
+            return
+        finally:
+            await frames.aclose()
+        await queue.put(_END)
+
+    producer = asyncio.ensure_future(produce())
+    _DRAINING.add(producer)
+    producer.add_done_callback(_DRAINING.discard)
+
+    loop = asyncio.get_running_loop()
+    batch = _FrameBatch()
+    flush_at: Optional[float] = None
+    first_delta_sent = False
+    pending_get: Optional["asyncio.Future[Any]"] = None
+    try:
+        while True:
+            if pending_get is None:
+                pending_get = asyncio.ensure_future(queue.get())
+            timeout = poll_interval if is_disconnected else None
+            if flush_at is not None:
+                until_flush = max(0.0, flush_at - loop.time())
+                timeout = until_flush if timeout is None else min(timeout, until_flush)
+            done, _ = await asyncio.wait({pending_get}, timeout=timeout)
+            if not done:
+                if flush_at is not None and loop.time() >= flush_at:
+                    flush_at = None
+                    SSE_WRITES.inc()
+                    yield batch.take()
+                elif is_disconnected is not None and await is_disconnected():
+                    return
+                continue
+
+            item = pending_get.result()
+            pending_get = None
+            if item is _END or isinstance(item, Exception):
+                if batch:
+                    SSE_WRITES.inc()
+                    yield batch.take()
+                if item is _END:
+                    return
+                raise item
+
+            if coalescing is None:
+                SSE_WRITES.inc()
+                yield item if isinstance(item, str) else format_sse({item.field: item.text}, event=item.event)
+                continue
+
+            batch.add(item)
+            if batch.size >= coalescing.max_bytes or (batch.has_delta and not first_delta_sent):
+                first_delta_sent = first_delta_sent or batch.has_delta
+                flush_at = None
+                SSE_WRITES.inc()
+                yield batch.take()
+            elif flush_at is None:
+                flush_at = loop.time() + coalescing.max_delay
+    finally:
+        if pending_get is not None:
+            pending_get.cancel()
+        producer.cancel()
@@ -0,0 +1,265 @@
+"""Incremental parser for the agent's streamed JSON responses"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+StreamEvent = Tuple[str, Any]
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+# Parser states
+_BEFORE_OBJECT = "before_object"
+_IN_FENCE = "in_fence"
+_BEFORE_KEY = "before_key"
+_IN_KEY = "in_key"
+_BEFORE_COLON = "before_colon"
+_BEFORE_VALUE = "before_value"
+_IN_MESSAGE = "in_message"
+_IN_VALUE = "in_value"
+_AFTER_VALUE = "after_value"
+_DONE = "done"
+_INVALID = "invalid"
+
+
+class ResponseStreamParser:
+    """
+    Parses a streamed {"message": ..., "graph": ...} object as the deltas arrive.
+
+    feed() returns ("message.delta", text) events with the unescaped message text as soon as it
+    is streamed, and a single ("graph", dict) event once the graph value closes. result() returns
+    the parsed object without a second json.loads over the whole response, or None when the
+    model didn't answer with a JSON object, in which case raw_text() is the fallback.
+
+    A markdown code fence before the object is skipped. When the response turns out not to be a
+    JSON object before any event was sent, such as a plain-text answer, the text is streamed as
+    message.delta events instead, so the answer still reaches the client.
+    """
+
+    def __init__(self):
+        self.__chunks: List[str] = []
+        self.__state = _BEFORE_OBJECT
+        self.__fence_parts: Optional[List[str]] = None
+        # Set once the response is streamed as plain text
+        self.__raw = False
+        self.__streamed = False
+        self.__result: Dict[str, Any] = {}
+        self.__key_parts: List[str] = []
+        self.__key = ""
+        self.__message_parts: List[str] = []
+        self.__escape: Optional[str] = None
+        self.__high_surrogate: Optional[int] = None
+        self.__value_parts: List[str] = []
+        self.__value_depth = 0
+        self.__value_in_string = False
+        self.__value_escaped = False
+
+    def feed(self, chunk: str) -> List[StreamEvent]:
+        """Consumes one delta and returns the events it completed"""
+        self.__chunks.append(chunk)
+        if self.__raw:
+            return [("message.delta", chunk)] if chunk else []
+        events: List[StreamEvent] = []
+        index = 0
+        while index < len(chunk) and self.__state not in (_DONE, _INVALID):
+            index = self.__step(chunk, index, events)
+        self.__streamed = self.__streamed or bool(events)
+        if self.__state == _INVALID and not self.__streamed:
+            # Not a JSON response, so everything so far is message text
+            self.__raw = True
+            return [("message.delta", self.raw_text())]
+        return events
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Returns the parsed object once the stream is complete, otherwise None"""
+        if self.__state != _DONE:
+            return None
+        return self.__result
+
+    def raw_text(self) -> str:
+        """Returns everything fed so far"""
+        return "".join(self.__chunks)
+
+    def partial_message(self) -> str:
+        """Returns the message text streamed so far, or the raw text if this isn't a JSON response"""
+        if self.__state == _INVALID:
+            return self.raw_text()
+        if "message" in self.__result:
+            return self.__result["message"]
+        return "".join(self.__message_parts)
+
+    # pylint: disable=R0911,R0912
+    def __step(self, chunk: str, index: int, events: List[StreamEvent]) -> int:
+        """Advances through the chunk from index, returning the next index to read"""
+        state = self.__state
+        char = chunk[index]
+
+        if state == _IN_MESSAGE:
+            return self.__read_message(chunk, index, events)
+        if state == _IN_VALUE:
+            return self.__read_value(chunk, index, events)
+        if state == _IN_FENCE:
+            return self.__read_fence(chunk, index)
+        if state == _IN_KEY:
+            end = chunk.find('"', index)
+            if end == -1:
+                self.__key_parts.append(chunk[index:])
+                return len(chunk)
+            self.__key_parts.append(chunk[index:end])
+            self.__key = "".join(self.__key_parts)
+            self.__state = _BEFORE_COLON
+            return end + 1
+
+        if char.isspace():
+            return index + 1
+
+        if state == _BEFORE_OBJECT:
+            if char == "`" and self.__fence_parts is None:
+                self.__fence_parts = []
+                self.__state = _IN_FENCE
+                return index
+            self.__state = _BEFORE_KEY if char == "{" else _INVALID
+        elif state == _BEFORE_KEY:
+            if char == '"':
+                self.__key_parts = []
+                self.__state = _IN_KEY
+            else:
+                self.__state = _DONE if char == "}" else _INVALID
+        elif state == _BEFORE_COLON:
+            self.__state = _BEFORE_VALUE if char == ":" else _INVALID
+        elif state == _BEFORE_VALUE:
+            if self.__key == "message" and char == '"':
+                self.__message_parts = []
+                self.__state = _IN_MESSAGE
+            else:
+                self.__value_parts = []
+                self.__value_depth = 0
+                self.__value_in_string = False
+                self.__value_escaped = False
+                self.__state = _IN_VALUE
+                return index
+        elif state == _AFTER_VALUE:
+            if char == ",":
+                self.__state = _BEFORE_KEY
+            else:
+                self.__state = _DONE if char == "}" else _INVALID
+        return index + 1
+
+    def __read_fence(self, chunk: str, index: int) -> int:
+        """Skips an opening code fence line such as ```json"""
+        assert self.__fence_parts is not None
+        end = chunk.find("\n", index)
+        self.__fence_parts.append(chunk[index:] if end == -1 else chunk[index:end])
+        line = "".join(self.__fence_parts)
+        if not line.startswith("```"[:len(line)]) or (end != -1 and len(line) < 3):
+            self.__state = _INVALID
+            return len(chunk) if end == -1 else end
+        if end == -1:
+            return len(chunk)
+        self.__state = _BEFORE_OBJECT
+        return end + 1
+
+    def __read_message(self, chunk: str, index: int, events: List[StreamEvent]) -> int:
+        """Streams unescaped message text up to the closing quote"""
+        text: List[str] = []
+        while index < len(chunk):
+            if self.__escape is not None:
+                index = self.__read_escape(chunk, index, text)
+                continue
+
+            match = _STRING_SPECIAL.search(chunk, index)
+            end = match.start() if match else len(chunk)
+            text.append(chunk[index:end])
+            if match is None:
+                index = end
+                break
+            if match.group() == "\\":
+                self.__escape = ""
+                index = end + 1
+                continue
+
+            # Closing quote
+            self.__result["message"] = "".join(self.__message_parts) + "".join(text)
+            self.__state = _AFTER_VALUE
+            index = end + 1
+            break
+
+        delta = "".join(text)
+        if delta:
+            self.__message_parts.append(delta)
+            events.append(("message.delta", delta))
+        return index
+
+    def __read_escape(self, chunk: str, index: int, text: List[str]) -> int:
+        """Decodes one escape sequence, which may be split across chunks"""
+        assert self.__escape is not None
+        if self.__escape == "":
+            char = chunk[index]
+            if char != "u":
+                text.append(_ESCAPES.get(char, char))
+                self.__escape = None
+                return index + 1
+            self.__escape = "u"
+            index += 1
+
+        needed = 5 - len(self.__escape)
+        self.__escape += chunk[index:index + needed]
+        index += min(needed, len(chunk) - index)
+        if len(self.__escape) < 5:
+            return index
+
+        code = int(self.__escape[1:], 16)
+        self.__escape = None
+        if 0xD800 <= code <= 0xDBFF:
+            self.__high_surrogate = code
+        elif 0xDC00 <= code <= 0xDFFF and self.__high_surrogate is not None:
+            text.append(chr(0x10000 + ((self.__high_surrogate - 0xD800) << 10) + (code - 0xDC00)))
+            self.__high_surrogate = None
+        else:
+            text.append(chr(code))
+        return index
+
+    def __read_value(self, chunk: str, index: int, events: List[StreamEvent]) -> int:
+        """Buffers any non-message value until it is complete, then parses it"""
+        start = index
+        while index < len(chunk):
+            char = chunk[index]
+            if self.__value_in_string:
+                if self.__value_escaped:
+                    self.__value_escaped = False
+                elif char == "\\":
+                    self.__value_escaped = True
+                elif char == '"':
+                    self.__value_in_string = False
+            elif char == '"':
+                self.__value_in_string = True
+            elif char in "{[":
+                self.__value_depth += 1
+            elif char in "}]" and self.__value_depth > 0:
+                self.__value_depth -= 1
+            elif self.__value_depth == 0 and (char in ",}" or char.isspace()):
+                # A scalar value ends at the next delimiter
+                self.__value_parts.append(chunk[start:index])
+                return self.__close_value(index, events)
+
+            index += 1
+            if self.__value_depth == 0 and not self.__value_in_string and char in '}]"':
+                self.__value_parts.append(chunk[start:index])
+                return self.__close_value(index, events)
+
+        self.__value_parts.append(chunk[start:index])
+        return index
+
+    def __close_value(self, index: int, events: List[StreamEvent]) -> int:
+        try:
+            value = json.loads("".join(self.__value_parts))
+        except json.JSONDecodeError:
+            self.__state = _INVALID
+            return index
+
+        self.__result[self.__key] = value
+        if self.__key == "graph" and isinstance(value, dict):
+            events.append(("graph", value))
+        self.__state = _AFTER_VALUE
+        return index
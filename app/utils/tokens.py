@@ -0,0 +1,41 @@
+"""Local token counting for prompt budgeting"""
+
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Iterable, Mapping, Optional
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+TOKEN_ENCODING = "o200k_base"  # gpt-4o family
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=1)
+def _get_encoding() -> Optional[tiktoken.Encoding]:
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:  # pylint: disable=W0718
+        # The encoding is downloaded on first use; estimate rather than fail without it
+        logger.warning(f"Falling back to approximate token counts, could not load {TOKEN_ENCODING}: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens in a string with the model's tokenizer"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: Iterable[Mapping[str, Any]]) -> int:
+    """Counts tokens across chat messages, including per-message overhead"""
+    return sum(count_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def count_json_tokens(value: Any) -> int:
+    """Counts tokens in the JSON serialization of a value, e.g. tool definitions"""
+    return count_tokens(json.dumps(value, separators=(",", ":"), default=str))
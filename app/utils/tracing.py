@@ -0,0 +1,120 @@
+"""Low-overhead structured tracing for the request lifecycle"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Union
+
+from app.utils.metrics import METRICS
+
+TRACE_LOGGER = logging.getLogger("app.trace")
+
+SPAN_SECONDS = METRICS.histogram("trace_span_seconds", "Duration of traced spans, by span name")
+
+
+class Span:
+    """A timed unit of work. Its duration is always recorded, and logged when the trace is sampled"""
+
+    def __init__(self, trace: "Trace", name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self.__trace = trace
+        self.__start = time.perf_counter()
+        self.__duration: Optional[float] = None
+
+    def set(self, **attrs: Any):
+        """Adds attributes to the span"""
+        self.attrs.update(attrs)
+
+    def end(self, **attrs: Any) -> float:
+        """Ends the span, returning its duration in seconds. Ending it again has no effect"""
+        if self.__duration is None:
+            self.attrs.update(attrs)
+            self.__duration = time.perf_counter() - self.__start
+            SPAN_SECONDS.observe(self.__duration, span=self.name)
+            self.__trace.log(logging.INFO, self.name, duration_ms=round(self.__duration * 1000, 3), **self.attrs)
+        return self.__duration
+
+
+class Trace:
+    """
+    Groups the spans and events of one request under a trace id.
+
+    Sampling is decided once per trace, so a sampled request is logged completely and the rest
+    cost a boolean check per log call. `chunks` tells the stream loop whether per-chunk events
+    are wanted, so it can skip building them altogether.
+    """
+
+    def __init__(self, sampled: bool, attrs: Dict[str, Any]):
+        self.sampled = sampled
+        self.trace_id = uuid.uuid4().hex[:16] if sampled else ""
+        self.attrs = attrs
+        self.started_at = time.monotonic()
+        self.chunks = sampled and TRACE_LOGGER.isEnabledFor(logging.DEBUG)
+
+    def start_span(self, name: str, **attrs: Any) -> Span:
+        """Starts a span that the caller ends"""
+        return Span(self, name, attrs)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Span]:
+        """Times the enclosed block as a span, marking it as failed or cancelled if it raises"""
+        span = self.start_span(name, **attrs)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.set(status="cancelled")
+            raise
+        except Exception as e:
+            span.set(status="error", error=type(e).__name__)
+            raise
+        finally:
+            span.end()
+
+    def event(self, name: str, level: int = logging.DEBUG, **attrs: Any):
+        """Logs a point-in-time event, DEBUG by default"""
+        self.log(level, name, **attrs)
+
+    def log(self, level: int, name: str, **attrs: Any):
+        """Logs one structured record if the trace is sampled and the level is enabled"""
+        if self.sampled and TRACE_LOGGER.isEnabledFor(level):
+            record = {"trace_id": self.trace_id, "name": name, **self.attrs, **attrs}
+            TRACE_LOGGER.log(level, json.dumps(record, default=str))
+
+
+class Tracer:
+    """Starts traces, sampling a fraction of them for structured logging"""
+
+    def __init__(self):
+        self.sample_rate = 1.0
+
+    def configure(self, level: Union[int, str] = logging.INFO, sample_rate: float = 1.0):
+        """
+        Sets the trace log level and the fraction of traces that are logged.
+        Records go through the handlers of the app or root logger; without any, one writing the JSON
+        lines to stderr is attached, since Python's fallback handler drops everything below WARNING.
+        """
+        TRACE_LOGGER.setLevel(level)
+        if not TRACE_LOGGER.hasHandlers():
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            TRACE_LOGGER.addHandler(handler)
+        self.sample_rate = sample_rate
+
+    def start_trace(self, **attrs: Any) -> Trace:
+        """Starts a trace, deciding whether it is sampled"""
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        return Trace(sampled, attrs)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Span]:
+        """Times a span of background work that doesn't belong to a request"""
+        with self.start_trace().span(name, **attrs) as span:
+            yield span
+
+
+TRACER = Tracer()
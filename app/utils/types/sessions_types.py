@@ -24,6 +24,8 @@ class FormattedMessageOwner(str, Enum):
 
     USER = "user"
     ASSISTANT = "assistant"
+    # Context the service adds for the model, such as a summary of earlier turns
+    DEVELOPER = "developer"
 
 
 class ChartDataPoint(TypedDict):
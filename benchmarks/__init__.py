@@ -0,0 +1 @@
+"""Benchmarks for the agent microservice. Run each module with `python -m benchmarks.<name>`."""
@@ -0,0 +1,167 @@
+"""
+A burst of turns against an upstream that can only serve so many streams, with and without
+admission control.
+
+The stand-in upstream answers 429 once more than CAPACITY streams are open, and its first token
+slows as load rises. One heavy user sends HEAVY_REQUESTS at once alongside LIGHT_USERS sending a
+few each. Without admission every turn goes straight upstream; with it the limit starts above
+the upstream's capacity and has to find it from the 429s and latency it sees.
+
+    python -m benchmarks.admission_control
+"""
+
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+
+from app.modules import AdmissionController, AdmissionRejected
+from app.utils import METRICS
+from benchmarks.stubs import StubResponses, build_agent_service, consume, text_events
+
+ANSWER = json.dumps({"message": "A steady savings habit matters more than the perfect account. " * 6})
+CAPACITY = 24
+BASE_FIRST_EVENT_DELAY = 0.2
+# Extra first-token latency per open stream, as a loaded upstream queues work
+LOAD_DELAY = 0.02
+EVENT_DELAY = 0.003
+HEAVY_REQUESTS = 60
+LIGHT_USERS = 30
+LIGHT_REQUESTS = 3
+
+
+class UpstreamRateLimited(Exception):
+    """Matches openai.RateLimitError closely enough for the agent"""
+
+    status_code = 429
+
+
+class LimitedStream:
+    """Wraps a stub stream, counting it as open until it ends or is closed"""
+
+    def __init__(self, stream, responses: "LimitedResponses"):
+        self.__stream = stream
+        self.__responses = responses
+        self.__open = True
+
+    def __aiter__(self):
+        return self.__iterate()
+
+    async def __iterate(self):
+        try:
+            async for event in self.__stream:
+                yield event
+        finally:
+            self.__end()
+
+    async def close(self):
+        """Matches AsyncStream.close"""
+        await self.__stream.close()
+        self.__end()
+
+    def __end(self):
+        if self.__open:
+            self.__open = False
+            self.__responses.active -= 1
+
+
+class LimitedResponses(StubResponses):
+    """Rejects streams beyond CAPACITY and slows the first token as more are open"""
+
+    def __init__(self):
+        super().__init__(lambda params: text_events(ANSWER), event_delay=EVENT_DELAY)
+        self.active = 0
+        self.max_active = 0
+        self.rate_limited = 0
+
+    async def create(self, **params):
+        if self.active >= CAPACITY:
+            self.rate_limited += 1
+            raise UpstreamRateLimited("Rate limit reached")
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        stream = await super().create(**params)
+        await asyncio.sleep(BASE_FIRST_EVENT_DELAY + LOAD_DELAY * self.active)
+        return LimitedStream(stream, self)
+
+
+async def send(service, user_id: str, index: int):
+    """Sends one turn, returning its outcome and how long the client waited for it"""
+    started = time.perf_counter()
+    try:
+        response = await service.handle_message(
+            message=f"Where should I keep my savings? ({user_id} #{index})",
+            history=[],
+            user_id=user_id,
+            session_id=f"{user_id}-{index}",
+        )
+    except AdmissionRejected as e:
+        return user_id, f"shed:{e.reason}", time.perf_counter() - started, e.retry_after
+    try:
+        await consume(response.body_iterator)
+    except UpstreamRateLimited:
+        return user_id, "upstream_429", time.perf_counter() - started, None
+    return user_id, "ok", time.perf_counter() - started, None
+
+
+async def burst(label: str, admission):
+    """Sends the whole burst at once and prints how it went"""
+    responses = LimitedResponses()
+    service = build_agent_service(responses, admission=admission)
+    requests = [("heavy", index) for index in range(HEAVY_REQUESTS)]
+    requests += [(f"light-{user}", index) for user in range(LIGHT_USERS) for index in range(LIGHT_REQUESTS)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(send(service, user_id, index) for user_id, index in requests))
+    elapsed = time.perf_counter() - started
+
+    outcomes = Counter(outcome for _, outcome, _, _ in results)
+    ok = sorted(seconds for _, outcome, seconds, _ in results if outcome == "ok")
+    shed = [seconds for _, outcome, seconds, _ in results if outcome.startswith("shed")]
+    light_ok = sum(1 for user_id, outcome, _, _ in results if outcome == "ok" and user_id != "heavy")
+    heavy_ok = outcomes["ok"] - light_ok
+    print(f"\n{label}: {len(requests)} turns in {elapsed:.1f}s, upstream peak {responses.max_active} streams")
+    print(f"  outcomes: {', '.join(f'{outcome} {count}' for outcome, count in sorted(outcomes.items()))}")
+    print(
+        f"  completed: light users {light_ok}/{LIGHT_USERS * LIGHT_REQUESTS}, heavy user {heavy_ok}/{HEAVY_REQUESTS}"
+    )
+    if ok:
+        print(f"  completed latency p50 {statistics.median(ok):.2f}s p95 {ok[int(len(ok) * 0.95) - 1]:.2f}s")
+    if shed:
+        retry_after = sorted(retry for _, outcome, _, retry in results if outcome.startswith("shed"))
+        print(
+            f"  shed in p50 {statistics.median(shed) * 1000:.1f}ms, "
+            f"Retry-After {retry_after[0]}-{retry_after[-1]}s"
+        )
+    if admission is not None:
+        print(f"  concurrency limit now {admission.limit}")
+
+
+async def main():
+    await burst("no admission control", None)
+    admission = AdmissionController(
+        max_concurrency=64, min_concurrency=4, per_user_limit=4, max_queue=64, queue_timeout=5.0,
+        latency_target=0.6, cooldown=0.5,
+    )
+    await burst("admission control", admission)
+    # The limit learned from the first burst carries over
+    await burst("admission control, second burst", admission)
+
+    wait = METRICS.histogram("admission_queue_wait_seconds", "")
+    rejections = METRICS.counter("admission_rejections_total", "")
+    decreases = METRICS.counter("admission_limit_decreases_total", "")
+    admitted = wait.count(outcome="admitted")
+    print(
+        f"\nqueue wait: {admitted} admitted, mean {wait.total(outcome='admitted') / max(1, admitted):.2f}s, "
+        f"{wait.count(outcome='timeout')} timed out"
+    )
+    reasons = ("user_limit", "queue_full", "queue_timeout")
+    print(f"rejections: {', '.join(f'{reason} {rejections.value(reason=reason):g}' for reason in reasons)}")
+    print(
+        f"limit cuts: rate_limit {decreases.value(signal='rate_limit'):g}, "
+        f"latency {decreases.value(signal='latency'):g}"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+"""
+What happens upstream when the client goes away mid-turn.
+
+Two disconnects are simulated: the server cancelling the response while the answer is
+streaming, and a client that disappears while a slow tool is running, which is only noticed by
+polling because no frames are flowing.
+
+    python -m benchmarks.client_disconnect
+"""
+
+import asyncio
+import json
+import time
+
+from app.utils import METRICS
+from benchmarks.stubs import (
+    StubChatLogWriter,
+    StubResponses,
+    build_agent_service,
+    function_call_events,
+    text_events,
+)
+
+ANSWER = json.dumps({"message": "Here's a long explanation of your options. " * 40})
+EVENT_DELAY = 0.005
+TOOL_LATENCY = 10.0
+
+
+class SlowFinancialConnections:
+    """Lookups that take TOOL_LATENCY seconds and record whether they were cancelled"""
+
+    def __init__(self):
+        self.cancelled = 0
+
+    async def get_acct_details(self, acct_ids, user_id=""):
+        """Sleeps, counting cancellations"""
+        try:
+            await asyncio.sleep(TOOL_LATENCY)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return [{"id": acct_id} for acct_id in acct_ids]
+
+
+def make_script(stage: str):
+    """Streams a long answer, first looking up two accounts when disconnecting during tools"""
+
+    def script(params):
+        if stage == "model" or params.get("previous_response_id") or "Based on this context" in str(params["input"]):
+            return text_events(ANSWER)
+        return function_call_events(
+            [{"name": "get_acct_details", "arguments": {"acct_ids": [f"acct_{i}"]}} for i in range(2)]
+        )
+
+    return script
+
+
+async def run(stage: str):
+    """Disconnects during `stage` and reports what was left running"""
+    responses = StubResponses(make_script(stage), event_delay=EVENT_DELAY)
+    chat_log_writer = StubChatLogWriter()
+    financial_connections = SlowFinancialConnections()
+    service = build_agent_service(
+        responses, chat_log_writer=chat_log_writer, financial_connections_service=financial_connections
+    )
+    disconnected = asyncio.Event()
+
+    async def is_disconnected():
+        return disconnected.is_set()
+
+    response = await service.handle_message(
+        message="Explain my accounts",
+        history=[],
+        user_id="u",
+        session_id="s",
+        stream_format="events",
+        is_disconnected=is_disconnected,
+    )
+
+    frames = []
+
+    async def read():
+        async for frame in response.body_iterator:
+            frames.append(frame)
+            if stage == "model" and len(frames) == 20:
+                return
+
+    start = time.perf_counter()
+    reader = asyncio.ensure_future(read())
+    if stage == "model":
+        await reader
+        # The server closes the response body once it sees the disconnect
+        await response.body_iterator.aclose()
+    else:
+        await asyncio.sleep(0.1)
+        disconnected.set()
+        await reader
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.05)
+
+    stream = responses.streams[-1]
+    saved = [item for item in chat_log_writer.items if item.get("aborted")]
+    print(
+        f"{stage:>6} {elapsed:>9.2f} {len(frames):>7} {len(responses.calls):>12} {str(stream.closed):>14} "
+        f"{financial_connections.cancelled:>15} {len(saved[0]['message_content']) if saved else 0:>14}"
+    )
+
+
+async def main():
+    print(f"{'stage':>6} {'seconds':>9} {'frames':>7} {'model calls':>12} {'stream closed':>14} "
+          f"{'tools cancelled':>15} {'partial chars':>14}")
+    for stage in ("model", "tools"):
+        await run(stage)
+    aborted = METRICS.counter("agent_generations_aborted_total", "")
+    tokens_saved = METRICS.counter("agent_aborted_output_tokens_saved_total", "")
+    print(f"aborted turns: model={aborted.value(stage='model'):g} tools={aborted.value(stage='tools'):g}, "
+          f"estimated output tokens saved: {tokens_saved.value():g}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Lookup latency for N transactions against a local stub of the financial connections API.
+
+Compares the previous approach (one blocking requests.get per ID, in sequence, no shared
+session) with FinancialConnectionsService fanning out over a pooled keep-alive client.
+
+    python -m benchmarks.financial_connections
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from app.modules import FinancialConnectionsService
+
+UPSTREAM_LATENCY = 0.02
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every transaction lookup after UPSTREAM_LATENCY"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):  # pylint: disable=C0103
+        """Returns a fake transaction for the requested ID"""
+        time.sleep(UPSTREAM_LATENCY)
+        transaction_id = self.path.rsplit("/", 1)[-1]
+        self.__send({"id": transaction_id, "amount": 1234})
+
+    def do_POST(self):  # pylint: disable=C0103
+        """Returns fake transactions for a batch of IDs"""
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(UPSTREAM_LATENCY)
+        self.__send([{"id": transaction_id, "amount": 1234} for transaction_id in body["ids"]])
+
+    def log_message(self, *_args):  # pylint: disable=W0221
+        """Keeps the benchmark output clean"""
+
+    def __send(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serial_lookup(api_url, transaction_ids):
+    """The previous implementation: one blocking request per ID"""
+    results = []
+    for transaction_id in transaction_ids:
+        response = requests.get(f"{api_url}/financial-connections/transactions/{transaction_id}", timeout=10)
+        results.append(response.json())
+    return results
+
+
+async def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    pooled = FinancialConnectionsService(api_url=api_url)
+    batched = FinancialConnectionsService(api_url=api_url, use_batch_endpoints=True)
+
+    print(f"upstream latency {UPSTREAM_LATENCY}s")
+    print(f"{'ids':>4} {'serial':>8} {'pooled':>8} {'batched':>8}")
+    for count in (1, 10, 40):
+        ids = [f"txn_{i}" for i in range(count)]
+
+        start = time.perf_counter()
+        serial_lookup(api_url, ids)
+        serial = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await pooled.get_transaction_details(ids)
+        fanned_out = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await batched.get_transaction_details(ids)
+        batch = time.perf_counter() - start
+
+        print(f"{count:>4} {serial:>8.3f} {fanned_out:>8.3f} {batch:>8.3f}")
+
+    await pooled.close()
+    await batched.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
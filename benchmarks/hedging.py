@@ -0,0 +1,105 @@
+"""
+Time to first token with and without hedging the first model hop.
+
+The stand-in model's first event usually comes after ~300ms, but a few calls stall for seconds,
+as a slow upstream connection would. The same workload runs unhedged and then with hedge
+budgets of 5% and 10%, reporting first-frame percentiles, the hedge rate and the extra
+upstream calls it cost.
+
+    python -m benchmarks.hedging
+"""
+
+import asyncio
+import json
+import random
+import time
+from typing import List
+
+from app.modules import Hedger
+from app.utils import METRICS
+from benchmarks.stubs import StubResponses, StubStream, build_agent_service, consume, text_events
+
+ANSWER = json.dumps({"message": "Putting your emergency fund in a high-yield savings account keeps it safe. " * 2})
+REQUESTS = 400
+CONCURRENCY = 20
+EVENT_DELAY = 0.002
+
+
+class TailLatencyResponses(StubResponses):
+    """Streams ANSWER after a first-event delay with a long tail"""
+
+    def __init__(self, seed: int):
+        super().__init__(lambda params: text_events(ANSWER), event_delay=EVENT_DELAY)
+        self.__rng = random.Random(seed)
+
+    def first_event_delay(self) -> float:
+        """Mostly ~300ms, sometimes a second, occasionally a multi-second stall"""
+        roll = self.__rng.random()
+        if roll < 0.03:
+            return self.__rng.uniform(2.0, 4.0)
+        if roll < 0.08:
+            return self.__rng.uniform(0.8, 1.2)
+        return self.__rng.lognormvariate(-1.2, 0.2)
+
+    async def create(self, **params):
+        self.calls.append(params)
+        self.streams.append(StubStream(text_events(ANSWER), self.first_event_delay(), EVENT_DELAY))
+        return self.streams[-1]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile, in milliseconds"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+async def run(label: str, hedger):
+    """Sends REQUESTS turns, CONCURRENCY at a time, and prints first-frame percentiles"""
+    responses = TailLatencyResponses(seed=7)
+    service = build_agent_service(responses, hedger=hedger)
+    queue = list(range(REQUESTS))
+    firsts: List[float] = []
+    hedges = METRICS.counter("agent_hedges_total", "")
+    outcomes = ("hedge_won", "primary_won")
+    before = {outcome: hedges.value(outcome=outcome) for outcome in outcomes}
+
+    async def worker():
+        while queue:
+            index = queue.pop()
+            started = time.perf_counter()
+            first = []
+            response = await service.handle_message(
+                message=f"Where should I keep my emergency fund? #{index}",
+                history=[],
+                user_id="u",
+                session_id=f"s{index}",
+                stream_format="events",
+            )
+            await consume(response.body_iterator, on_first=lambda: first.append(time.perf_counter() - started))
+            firsts.append(first[0])
+
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    won = {outcome: hedges.value(outcome=outcome) - before[outcome] for outcome in outcomes}
+    hedged = sum(won.values())
+    print(
+        f"{label:>14} {percentile(firsts, 50):>7.0f} {percentile(firsts, 95):>7.0f} {percentile(firsts, 99):>7.0f} "
+        f"{max(firsts) * 1000:>7.0f} {hedged / REQUESTS:>9.1%} {won['hedge_won']:>9g} "
+        f"{(len(responses.calls) - REQUESTS) / REQUESTS:>11.1%}"
+    )
+    return firsts
+
+
+async def main():
+    print(f"{REQUESTS} turns, {CONCURRENCY} at a time; first frame ms")
+    print(f"{'':>14} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'hedged':>9} {'hedge won':>9} {'extra calls':>11}")
+    baseline = await run("unhedged", None)
+    for budget in (0.05, 0.10):
+        hedged = await run(f"budget {budget:.0%}", Hedger(budget=budget, min_delay=0.25))
+        gains = ", ".join(
+            f"p{pct} {percentile(baseline, pct) - percentile(hedged, pct):+.0f}ms" for pct in (50, 95, 99)
+        )
+        print(f"{'':>14} saved {gains}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
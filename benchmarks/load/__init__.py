@@ -0,0 +1,6 @@
+"""
+End-to-end load harness: the real service, run against local stand-ins for OpenAI, DynamoDB
+and the financial connections API, driven by closed-loop virtual users.
+
+    python -m benchmarks.load --concurrency 1,10,50 --duration 20
+"""
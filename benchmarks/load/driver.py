@@ -0,0 +1,283 @@
+"""
+Closed-loop load driver for the agent service.
+
+Each virtual user posts a scenario's message to /agent/execute with stream_format "events",
+reads the stream to the end and immediately sends the next one, for `duration` seconds at each
+concurrency level. The driver records time to the first message.delta, total latency, output
+tokens per second and the peak number of open streams, both as seen by the client and by the
+OpenAI stand-in.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.utils import count_tokens
+from benchmarks.load import standins
+from benchmarks.load.fake_openai import load_recordings
+
+READY_TIMEOUT = 30.0
+
+
+class Sample:
+    """Timings of one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.tokens = 0
+        self.graphs = 0
+        self.error: Optional[str] = None
+
+
+class ClientStats:
+    """Open streams as seen by the client"""
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, in milliseconds"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[index] * 1000, 1)
+
+
+async def send(client: httpx.AsyncClient, app_url: str, message: str, user_id: str, stats: ClientStats) -> Sample:
+    """Sends one message and reads its event stream to the end"""
+    sample = Sample()
+    payload = {
+        "message_content": message,
+        "session_id": f"load-{uuid.uuid4().hex}",
+        "user_id": user_id,
+        "history": [],
+        "stream_format": "events",
+    }
+    text: List[str] = []
+    stats.active += 1
+    stats.max_active = max(stats.max_active, stats.active)
+    try:
+        async with client.stream("POST", f"{app_url}/agent/execute", json=payload) as response:
+            if response.status_code != 200:
+                sample.error = f"status {response.status_code}"
+                return sample
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = line[len("data: "):]
+                    if data == "[DONE]":
+                        break
+                    if event == "message.delta":
+                        sample.ttft = sample.ttft or time.perf_counter() - sample.start
+                        text.append(json.loads(data)["delta"])
+                    elif event == "graph":
+                        sample.graphs += 1
+                    elif event == "error":
+                        sample.error = data
+                    event = None
+            else:
+                sample.error = sample.error or "stream ended without [DONE]"
+    except httpx.HTTPError as e:
+        sample.error = type(e).__name__
+    finally:
+        stats.active -= 1
+        sample.latency = time.perf_counter() - sample.start
+        sample.tokens = count_tokens("".join(text))
+    return sample
+
+
+async def run_level(
+    app_url: str, openai_url: Optional[str], scenario: str, message: str, concurrency: int, duration: float
+) -> Dict[str, Any]:
+    """Runs `concurrency` virtual users for `duration` seconds and summarizes the samples"""
+    # pylint: disable=R0913,R0914
+    stats = ClientStats()
+    samples: List[Sample] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(120.0), limits=limits) as client:
+        if openai_url:
+            await client.post(f"{openai_url}/stats/reset")
+        deadline = time.perf_counter() + duration
+
+        # Each virtual user is its own user, so per-user admission limits don't throttle the run
+        async def virtual_user(user_id: str):
+            while time.perf_counter() < deadline:
+                samples.append(await send(client, app_url, message, user_id, stats))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(f"load-test-{index}") for index in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        upstream = (await client.get(f"{openai_url}/stats")).json() if openai_url else {}
+
+    ok = [sample for sample in samples if sample.error is None]
+    ttfts = [sample.ttft for sample in ok if sample.ttft is not None]
+    latencies = [sample.latency for sample in ok]
+    stream_rates = [
+        sample.tokens / (sample.latency - sample.ttft)
+        for sample in ok
+        if sample.ttft is not None and sample.latency > sample.ttft
+    ]
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if sample.error:
+            errors[sample.error] = errors.get(sample.error, 0) + 1
+
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests": len(samples),
+        "errors": errors,
+        "requests_per_s": round(len(ok) / elapsed, 2),
+        "ttft_ms": {"p50": percentile(ttfts, 50), "p95": percentile(ttfts, 95), "p99": percentile(ttfts, 99)},
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        },
+        "tokens_per_s": {
+            "per_stream_mean": round(sum(stream_rates) / len(stream_rates), 1) if stream_rates else None,
+            "aggregate": round(sum(sample.tokens for sample in ok) / elapsed, 1),
+        },
+        "graphs_per_request": round(sum(sample.graphs for sample in ok) / len(ok), 2) if ok else None,
+        "max_concurrent_streams": {
+            "client": stats.max_active,
+            "upstream": upstream.get("max_active_streams"),
+        },
+        "upstream_streams_per_request": round(upstream["streams"] / len(samples), 2) if upstream and samples else None,
+    }
+
+
+async def wait_ready(urls: List[str], processes: List[subprocess.Popen]):
+    """Polls each URL until it answers, failing early if a process exits"""
+    deadline = time.monotonic() + READY_TIMEOUT
+    async with httpx.AsyncClient(timeout=1.0) as client:
+        for url in urls:
+            while True:
+                for process in processes:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+                try:
+                    await client.get(url)
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise
+                    await asyncio.sleep(0.2)
+
+
+def spawn(args: argparse.Namespace) -> List[subprocess.Popen]:
+    """Starts the stand-ins and the service, pointed at them"""
+    standin_args = [
+        "--openai-port", str(args.openai_port),
+        "--dynamodb-port", str(args.dynamodb_port),
+        "--fc-port", str(args.fc_port),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--first-token-latency", str(args.first_token_latency),
+        "--latency-jitter", str(args.latency_jitter),
+        "--dynamodb-latency", str(args.dynamodb_latency),
+        "--fc-latency", str(args.fc_latency),
+    ]
+    env = {
+        **os.environ,
+        **standins.service_env(args),
+        "RESPONSE_CHAINING": "true" if args.chaining else "false",
+        # Every virtual user sends the same message, so a cache would turn the run into a replay test
+        "RESPONSE_CACHE_ENABLED": "true" if args.response_cache else "false",
+        "RESPONSE_CACHE_TABLE": "response_cache" if args.response_cache else "",
+        "TRACE_SAMPLE_RATE": os.environ.get("TRACE_SAMPLE_RATE", "0"),
+    }
+    app_command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", standins.HOST,
+        "--port", str(args.app_port),
+        "--log-level", "warning",
+        "--no-access-log",
+    ]
+    return [
+        subprocess.Popen([sys.executable, "-m", "benchmarks.load.standins", *standin_args]),
+        subprocess.Popen(app_command, env=env),
+    ]
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Runs every scenario at every concurrency level"""
+    recordings = load_recordings()
+    openai_url = f"http://{standins.HOST}:{args.openai_port}"
+    processes: List[subprocess.Popen] = []
+    if args.app_url:
+        app_url = args.app_url.rstrip("/")
+    else:
+        app_url = f"http://{standins.HOST}:{args.app_port}"
+        processes = spawn(args)
+
+    try:
+        await wait_ready([f"{openai_url}/stats", f"{app_url}/metrics"], processes)
+        runs = []
+        for scenario in args.scenarios.split(","):
+            message = f"{recordings[scenario]['message']} [scenario:{scenario}]"
+            for concurrency in (int(level) for level in args.concurrency.split(",")):
+                result = await run_level(app_url, openai_url, scenario, message, concurrency, args.duration)
+                runs.append(result)
+                print(
+                    f"{scenario:>12} c={concurrency:<4} {result['requests']:>6} req"
+                    f"  errors {sum(result['errors'].values()):>4}"
+                    f"  ttft p50/p95/p99 {result['ttft_ms']['p50']}/{result['ttft_ms']['p95']}"
+                    f"/{result['ttft_ms']['p99']} ms"
+                    f"  latency p95 {result['latency_ms']['p95']} ms"
+                    f"  tok/s {result['tokens_per_s']['aggregate']}"
+                    f"  streams {result['max_concurrent_streams']['upstream']}"
+                )
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+    return {
+        "config": {
+            "app_url": app_url,
+            "duration_s": args.duration,
+            "chaining": args.chaining,
+            "response_cache": args.response_cache,
+            "tokens_per_second": args.tokens_per_second,
+            "first_token_latency": args.first_token_latency,
+            "fc_latency": args.fc_latency,
+            "dynamodb_latency": args.dynamodb_latency,
+        },
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="plain_chat,single_tool,multi_tool")
+    parser.add_argument("--concurrency", default="1,10,50", help="Comma separated numbers of virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per scenario and concurrency level")
+    parser.add_argument("--app-port", type=int, default=8700)
+    parser.add_argument("--app-url", help="Load an already running service instead of starting one")
+    parser.add_argument("--chaining", action="store_true", help="Start the service with RESPONSE_CHAINING=true")
+    parser.add_argument("--response-cache", action="store_true", help="Start the service with the response cache on")
+    parser.add_argument("--output", default="benchmarks/load/results.json")
+    standins.add_arguments(parser)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"results written to {args.output}")
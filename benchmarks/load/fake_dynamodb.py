@@ -0,0 +1,111 @@
+"""
+In-memory stand-in for the parts of the DynamoDB JSON API the service uses.
+
+Supports PutItem, BatchWriteItem, GetItem, UpdateItem with plain SET expressions, and Query
+with a single equality key condition, which is enough for chat_logs and session_info. Items
+are kept in DynamoDB's typed JSON form. An optional per-call latency approximates a network
+round trip.
+"""
+
+import asyncio
+import json
+import re
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Key attribute of each table the service writes to
+TABLE_KEYS = {"chat_logs": "message_id", "session_info": "session_id", "response_cache": "cache_key"}
+CONTENT_TYPE = "application/x-amz-json-1.0"
+SET_CLAUSE = re.compile(r"([#\w]+)\s*=\s*(:\w+)")
+KEY_CONDITION = re.compile(r"^\s*([#\w]+)\s*=\s*(:\w+)\s*$")
+
+
+class FakeDynamoDB:
+    """Keeps tables as dicts of typed items, keyed by each table's key attribute"""
+
+    def __init__(self, latency: float = 0.0):
+        self.__latency = latency
+        self.__tables: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    async def handle(self, operation: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Runs one API operation"""
+        self.calls[operation] += 1
+        if self.__latency:
+            await asyncio.sleep(self.__latency)
+        handler = getattr(self, f"_op_{operation}", None)
+        if handler is None:
+            raise ValueError(f"Unsupported operation {operation}")
+        return handler(body)
+
+    def _op_PutItem(self, body):  # pylint: disable=C0103
+        self.__put(body["TableName"], body["Item"])
+        return {}
+
+    def _op_BatchWriteItem(self, body):  # pylint: disable=C0103
+        for table_name, requests in body["RequestItems"].items():
+            for request in requests:
+                self.__put(table_name, request["PutRequest"]["Item"])
+        return {"UnprocessedItems": {}}
+
+    def _op_GetItem(self, body):  # pylint: disable=C0103
+        item = self.__tables[body["TableName"]].get(self.__key(body["TableName"], body["Key"]))
+        return {"Item": item} if item else {}
+
+    def _op_UpdateItem(self, body):  # pylint: disable=C0103
+        table_name = body["TableName"]
+        key = self.__key(table_name, body["Key"])
+        item = self.__tables[table_name].setdefault(key, dict(body["Key"]))
+        names = body.get("ExpressionAttributeNames", {})
+        values = body.get("ExpressionAttributeValues", {})
+        for name, placeholder in SET_CLAUSE.findall(body["UpdateExpression"]):
+            item[names.get(name, name)] = values[placeholder]
+        return {}
+
+    def _op_Query(self, body):  # pylint: disable=C0103
+        match = KEY_CONDITION.match(body["KeyConditionExpression"])
+        if match is None:
+            raise ValueError(f"Unsupported key condition {body['KeyConditionExpression']}")
+        name = body.get("ExpressionAttributeNames", {}).get(match.group(1), match.group(1))
+        value = body["ExpressionAttributeValues"][match.group(2)]
+        table = self.__tables[body["TableName"]]
+        items: List[Dict[str, Any]] = [item for item in table.values() if item.get(name) == value]
+        items.sort(
+            key=lambda item: item.get("timestamp", {}).get("S", ""),
+            reverse=not body.get("ScanIndexForward", True),
+        )
+        return {"Items": items, "Count": len(items), "ScannedCount": len(items)}
+
+    def __put(self, table_name: str, item: Dict[str, Any]):
+        self.__tables[table_name][self.__key(table_name, item)] = item
+
+    @staticmethod
+    def __key(table_name: str, item: Dict[str, Any]) -> str:
+        return item[TABLE_KEYS.get(table_name, next(iter(item)))]["S"]
+
+
+def create_app(dynamodb: FakeDynamoDB) -> FastAPI:
+    """Builds the fake DynamoDB endpoint"""
+    app = FastAPI()
+
+    @app.post("/")
+    async def dispatch(request: Request):
+        operation = request.headers.get("x-amz-target", "").rsplit(".", 1)[-1]
+        try:
+            result = await dynamodb.handle(operation, json.loads(await request.body() or b"{}"))
+        except (KeyError, ValueError) as e:
+            return JSONResponse(
+                {"__type": "com.amazon.coral.validate#ValidationException", "message": str(e)},
+                status_code=400,
+                media_type=CONTENT_TYPE,
+            )
+        return JSONResponse(result, media_type=CONTENT_TYPE)
+
+    @app.get("/stats")
+    async def stats():
+        return dict(dynamodb.calls)
+
+    return app
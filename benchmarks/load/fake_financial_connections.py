@@ -0,0 +1,71 @@
+"""
+Stand-in for the financial connections API.
+
+Serves any account or transaction ID, single or batched, with deterministic fake data in the
+upstream's shape: amounts and balances in cents. Each request waits `latency` seconds first.
+"""
+
+import asyncio
+import zlib
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, HTTPException, Request
+
+
+def fake_account(account_id: str) -> Dict[str, Any]:
+    """Builds an account whose balance is derived from its ID"""
+    cents = 100000 + zlib.crc32(account_id.encode()) % 5000000
+    return {
+        "id": account_id,
+        "category": "cash",
+        "subcategory": "checking",
+        "display_name": "Checking",
+        "institution_name": "Load Test Bank",
+        "last4": account_id[-4:].rjust(4, "0"),
+        "balance": {"type": "cash", "cash": {"available": {"usd": cents}}, "current": {"usd": cents}},
+    }
+
+
+def fake_transaction(transaction_id: str) -> Dict[str, Any]:
+    """Builds a transaction whose amount is derived from its ID"""
+    cents = -(500 + zlib.crc32(transaction_id.encode()) % 50000)
+    return {
+        "id": transaction_id,
+        "account": "fca_checking",
+        "amount": cents,
+        "currency": "usd",
+        "description": "Load test purchase",
+        "status": "posted",
+    }
+
+
+FAKES = {"accounts": fake_account, "transactions": fake_transaction}
+
+
+def create_app(latency: float = 0.05) -> FastAPI:
+    """Builds the fake financial connections API"""
+    app = FastAPI()
+    calls = {"single": 0, "batch": 0}
+
+    @app.post("/financial-connections/{resource}/batch")
+    async def get_batch(resource: str, request: Request) -> List[Dict[str, Any]]:
+        if resource not in FAKES:
+            raise HTTPException(status_code=404)
+        calls["batch"] += 1
+        ids = (await request.json())["ids"]
+        await asyncio.sleep(latency)
+        return [FAKES[resource](item_id) for item_id in ids]
+
+    @app.get("/financial-connections/{resource}/{item_id}")
+    async def get_one(resource: str, item_id: str) -> Dict[str, Any]:
+        if resource not in FAKES:
+            raise HTTPException(status_code=404)
+        calls["single"] += 1
+        await asyncio.sleep(latency)
+        return FAKES[resource](item_id)
+
+    @app.get("/stats")
+    async def stats():
+        return calls
+
+    return app
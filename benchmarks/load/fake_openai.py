@@ -0,0 +1,248 @@
+"""
+Stand-in for the OpenAI API that replays recorded Responses streams.
+
+Each recording in recordings/ is a list of hops, and each hop is the output the model streamed
+for one request: function calls as argument deltas, messages as text deltas. A conversation is
+matched to a recording by the "[scenario:<name>]" marker in the user's message, and follow-ups
+advance to the next hop, whether they are chained with previous_response_id or rebuilt with
+the tool results in the prompt. A request made with tool_choice "none" gets the final hop.
+
+Deltas are streamed at a fixed token rate after a first-token latency, roughly one token each.
+Non-streaming responses (context summaries) and chat completions (session titles) get canned
+answers.
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+RECORDINGS_DIR = Path(__file__).parent / "recordings"
+SCENARIO_MARKER = re.compile(r"\[scenario:([a-z_]+)\]")
+# A generous tier that never runs out, so the service's client pool schedules but never waits
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit-requests": "100000",
+    "x-ratelimit-remaining-requests": "100000",
+    "x-ratelimit-reset-requests": "0s",
+    "x-ratelimit-limit-tokens": "100000000",
+    "x-ratelimit-remaining-tokens": "100000000",
+    "x-ratelimit-reset-tokens": "0s",
+}
+
+
+def load_recordings() -> Dict[str, Dict[str, Any]]:
+    """Loads every recording, keyed by scenario name"""
+    recordings = {}
+    for path in sorted(RECORDINGS_DIR.glob("*.json")):
+        recording = json.loads(path.read_text())
+        recordings[recording["scenario"]] = recording
+    return recordings
+
+
+def _sse(data: Dict[str, Any]) -> str:
+    return f"event: {data['type']}\ndata: {json.dumps(data)}\n\n"
+
+
+def _response_fields(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields every Response object carries, echoed from the request"""
+    return {
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": params.get("model"),
+        "parallel_tool_calls": params.get("parallel_tool_calls", True),
+        "tool_choice": params.get("tool_choice", "auto"),
+        # The API echoes function tools with every field filled in
+        "tools": [
+            {"description": None, "strict": False, **tool} if tool.get("type") == "function" else tool
+            for tool in params.get("tools", [])
+        ],
+    }
+
+
+class FakeResponses:
+    """Replays recorded hops as Responses API streaming events"""
+
+    def __init__(
+        self,
+        recordings: Dict[str, Dict[str, Any]],
+        tokens_per_second: float = 60.0,
+        first_token_latency: float = 0.4,
+        latency_jitter: float = 0.1,
+    ):
+        self.__recordings = recordings
+        self.__token_delay = 1 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.__first_token_latency = first_token_latency
+        self.__latency_jitter = latency_jitter
+        # response id -> (scenario, hop) so chained follow-ups can find their place
+        self.__responses: Dict[str, Tuple[str, int]] = {}
+        self.streams = 0
+        self.active_streams = 0
+        self.max_active_streams = 0
+
+    def select(self, params: Dict[str, Any]) -> Tuple[str, int]:
+        """Returns the (scenario, hop) a request should be answered with"""
+        previous = params.get("previous_response_id")
+        if previous in self.__responses:
+            scenario, hop = self.__responses[previous]
+            hop += 1
+        else:
+            text = json.dumps(params.get("input", ""))
+            match = SCENARIO_MARKER.search(text)
+            scenario = match.group(1) if match and match.group(1) in self.__recordings else "plain_chat"
+            hop = self.__rebuilt_hop(scenario, text.count("Result from "))
+
+        hops = self.__recordings[scenario]["hops"]
+        if params.get("tool_choice") == "none":
+            hop = len(hops) - 1
+        return scenario, min(hop, len(hops) - 1)
+
+    async def stream(self, params: Dict[str, Any]):
+        """Streams one hop of a recording"""
+        scenario, hop = self.select(params)
+        response_id = f"resp_{uuid.uuid4().hex}"
+        self.__responses[response_id] = (scenario, hop)
+        output: List[Dict[str, Any]] = self.__recordings[scenario]["hops"][hop]["output"]
+        response = {**_response_fields(params), "id": response_id, "output": [], "status": "in_progress"}
+        done_items: List[Dict[str, Any]] = []
+
+        self.streams += 1
+        self.active_streams += 1
+        self.max_active_streams = max(self.max_active_streams, self.active_streams)
+        try:
+            yield _sse({"type": "response.created", "sequence_number": 0, "response": response})
+            jitter = random.uniform(-self.__latency_jitter, self.__latency_jitter)
+            await asyncio.sleep(max(0.0, self.__first_token_latency + jitter))
+
+            output_tokens = 0
+            for index, item in enumerate(output):
+                item_id = f"item_{uuid.uuid4().hex[:12]}"
+                if item["type"] == "function_call":
+                    added = {
+                        "type": "function_call",
+                        "id": item_id,
+                        "call_id": f"call_{uuid.uuid4().hex[:12]}",
+                        "name": item["name"],
+                        "arguments": "",
+                        "status": "in_progress",
+                    }
+                    delta_type = "response.function_call_arguments.delta"
+                    deltas = item["argument_deltas"]
+                else:
+                    added = {
+                        "type": "message",
+                        "id": item_id,
+                        "role": "assistant",
+                        "content": [],
+                        "status": "in_progress",
+                    }
+                    delta_type = "response.output_text.delta"
+                    deltas = item["text_deltas"]
+
+                yield _sse({"type": "response.output_item.added", "output_index": index, "item": added})
+                for delta in deltas:
+                    event = {"type": delta_type, "item_id": item_id, "output_index": index, "delta": delta}
+                    yield _sse({**event, "content_index": 0})
+                    output_tokens += 1
+                    if self.__token_delay:
+                        await asyncio.sleep(self.__token_delay)
+                done = {**added, "status": "completed"}
+                if item["type"] == "function_call":
+                    done["arguments"] = "".join(deltas)
+                else:
+                    done["content"] = [{"type": "output_text", "text": "".join(deltas), "annotations": []}]
+                yield _sse({"type": "response.output_item.done", "output_index": index, "item": done})
+                done_items.append(done)
+
+            input_tokens = len(json.dumps(params.get("input", ""))) // 4 + len(params.get("instructions") or "") // 4
+            usage = {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            }
+            completed = {**response, "output": done_items, "status": "completed", "usage": usage}
+            yield _sse({"type": "response.completed", "response": completed})
+        finally:
+            self.active_streams -= 1
+
+    def __rebuilt_hop(self, scenario: str, results_seen: int) -> int:
+        """Works out the hop of a rebuilt follow-up from how many tool results its prompt carries"""
+        calls = 0
+        for hop, recorded in enumerate(self.__recordings[scenario]["hops"]):
+            if calls >= results_seen:
+                return hop
+            calls += sum(1 for item in recorded["output"] if item["type"] == "function_call")
+        return len(self.__recordings[scenario]["hops"]) - 1
+
+
+def create_app(responses: FakeResponses) -> FastAPI:
+    """Builds the fake OpenAI API around a FakeResponses"""
+    app = FastAPI()
+
+    @app.post("/v1/responses")
+    async def create_response(request: Request):
+        params = await request.json()
+        if params.get("stream"):
+            return StreamingResponse(
+                responses.stream(params), media_type="text/event-stream", headers=RATE_LIMIT_HEADERS
+            )
+        return JSONResponse(
+            {
+                **_response_fields(params),
+                "id": f"resp_{uuid.uuid4().hex}",
+                "status": "completed",
+                "output": [
+                    {
+                        "type": "message",
+                        "id": f"msg_{uuid.uuid4().hex[:12]}",
+                        "role": "assistant",
+                        "status": "completed",
+                        "content": [
+                            {"type": "output_text", "text": "The user asked about their finances.", "annotations": []}
+                        ],
+                    }
+                ],
+            },
+            headers=RATE_LIMIT_HEADERS,
+        )
+
+    @app.post("/v1/chat/completions")
+    async def create_chat_completion(request: Request):
+        params = await request.json()
+        return JSONResponse(
+            {
+                "id": f"chatcmpl_{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": params.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": json.dumps({"title": "Load test session"})},
+                    }
+                ],
+            }
+        )
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "streams": responses.streams,
+            "active_streams": responses.active_streams,
+            "max_active_streams": responses.max_active_streams,
+        }
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        responses.streams = 0
+        responses.max_active_streams = responses.active_streams
+        return {}
+
+    return app
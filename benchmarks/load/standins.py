@@ -0,0 +1,83 @@
+"""
+Runs the OpenAI, DynamoDB and financial connections stand-ins in one process.
+
+    python -m benchmarks.load.standins --tokens-per-second 60 --first-token-latency 0.4
+
+Point the service at them with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8701/v1 OPENAI_API_KEY=load-test
+    ENV=local DYNAMODB_ENDPOINT=http://127.0.0.1:8702 API_URL=http://127.0.0.1:8703
+"""
+
+import argparse
+import asyncio
+import logging
+from typing import Dict, List
+
+import uvicorn
+
+from benchmarks.load import fake_dynamodb, fake_financial_connections, fake_openai
+
+HOST = "127.0.0.1"
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Adds the stand-in options, shared with the load driver"""
+    parser.add_argument("--openai-port", type=int, default=8701)
+    parser.add_argument("--dynamodb-port", type=int, default=8702)
+    parser.add_argument("--fc-port", type=int, default=8703)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="Replay rate of recorded deltas")
+    parser.add_argument("--first-token-latency", type=float, default=0.4, help="Seconds before the first delta")
+    parser.add_argument("--latency-jitter", type=float, default=0.1, help="Uniform +/- jitter on that latency")
+    parser.add_argument("--dynamodb-latency", type=float, default=0.005)
+    parser.add_argument("--fc-latency", type=float, default=0.05)
+
+
+def service_env(args: argparse.Namespace) -> Dict[str, str]:
+    """Environment that points the service at the stand-ins"""
+    return {
+        "OPENAI_BASE_URL": f"http://{HOST}:{args.openai_port}/v1",
+        "OPENAI_API_KEY": "load-test",
+        "ENV": "local",
+        "DYNAMODB_ENDPOINT": f"http://{HOST}:{args.dynamodb_port}",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "API_URL": f"http://{HOST}:{args.fc_port}",
+    }
+
+
+def build_servers(args: argparse.Namespace) -> List[uvicorn.Server]:
+    """Builds a uvicorn server for each stand-in"""
+    responses = fake_openai.FakeResponses(
+        fake_openai.load_recordings(),
+        tokens_per_second=args.tokens_per_second,
+        first_token_latency=args.first_token_latency,
+        latency_jitter=args.latency_jitter,
+    )
+    apps = [
+        (fake_openai.create_app(responses), args.openai_port),
+        (fake_dynamodb.create_app(fake_dynamodb.FakeDynamoDB(latency=args.dynamodb_latency)), args.dynamodb_port),
+        (fake_financial_connections.create_app(latency=args.fc_latency), args.fc_port),
+    ]
+    return [
+        uvicorn.Server(uvicorn.Config(app, host=HOST, port=port, log_level="warning", access_log=False))
+        for app, port in apps
+    ]
+
+
+async def serve(args: argparse.Namespace):
+    """Serves every stand-in until interrupted"""
+    await asyncio.gather(*(server.serve() for server in build_servers(args)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    for name, value in service_env(args).items():
+        logging.info(f"{name}={value}")
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
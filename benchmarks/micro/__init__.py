@@ -0,0 +1,5 @@
+"""
+Micro-benchmarks for the per-request CPU work, with stored baselines and a regression gate.
+
+    python -m benchmarks.micro
+"""
@@ -0,0 +1,127 @@
+"""
+Micro-benchmark cases for the per-request CPU work.
+
+Each case is built once from fixed fixtures and returns a zero-argument callable that does one
+unit of work, so the runner can time it in a tight loop. Fixtures are deterministic, so results
+only move when the code under test does.
+"""
+
+import json
+from typing import Any, Callable, Dict, List
+
+from app.utils import (
+    AGENT_INSTRUCTIONS,
+    AGENT_TOOLS,
+    MessageOwner,
+    ResponseStreamParser,
+    calculate_compound_interest,
+    format_history,
+    format_sse,
+)
+from benchmarks.stubs import StubResponses, build_agent_service
+
+HISTORY_LENGTH = 200
+DELTA_SIZE = 4
+
+PARAGRAPH = (
+    "Based on your checking balance of $4,200 and recent spending, you could set aside about $250 "
+    "a month. Invested at 6% alongside your balance, that could grow to roughly $270,000 over 30 years. "
+)
+ANSWER = json.dumps(
+    {
+        "message": PARAGRAPH * 6,
+        "graph": {
+            "type": "line",
+            "data": [{"label": f"Year {year}", "amount": round(4200 * 1.06 ** year, 2)} for year in range(31)],
+        },
+    }
+)
+DELTAS = [ANSWER[i:i + DELTA_SIZE] for i in range(0, len(ANSWER), DELTA_SIZE)]
+
+
+class DiscardingChatLogWriter:
+    """Accepts items without keeping them, so repeated saves don't grow memory"""
+
+    async def save(self, item: Dict[str, Any]):
+        """Drops the item"""
+        return item
+
+
+def chat_history(length: int) -> List[Dict[str, Any]]:
+    """Alternating user and AI chat logs, as stored in DynamoDB"""
+    return [
+        {
+            "message_id": f"msg_{i}",
+            "session_id": "bench",
+            "user_id": "bench",
+            "message_type": "USER" if i % 2 == 0 else "AI",
+            "message_content": f"Message {i} about budgeting, savings goals and recent transactions. " * 4,
+            "timestamp": f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}+00:00",
+        }
+        for i in range(length)
+    ]
+
+
+def run_sync(coroutine):
+    """Runs a coroutine that never suspends, without an event loop"""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("Coroutine suspended")
+
+
+def build_cases() -> Dict[str, Callable[[], Any]]:
+    """Returns every case, keyed by name"""
+    history = chat_history(HISTORY_LENGTH)
+    formatted = format_history(history)
+    service = build_agent_service(
+        StubResponses(lambda params: []),
+        instructions=AGENT_INSTRUCTIONS,
+        tools=AGENT_TOOLS,
+        chat_log_writer=DiscardingChatLogWriter(),
+    )
+    # The helpers under test are private, so reach them through their mangled names
+    get_params = getattr(service, "_AgentService__get_params")
+    save_message = getattr(service, "_AgentService__save_message")
+    graph = json.loads(ANSWER)["graph"]
+
+    def sse_frames():
+        return [format_sse({"delta": delta}, event="message.delta") for delta in DELTAS]
+
+    def sse_frames_raw():
+        return [format_sse({"content": delta}) for delta in DELTAS]
+
+    def stream_parser():
+        parser = ResponseStreamParser()
+        for delta in DELTAS:
+            parser.feed(delta)
+        return parser.result()
+
+    def save():
+        return run_sync(
+            save_message(
+                user_id="bench",
+                session_id="bench",
+                message_type=MessageOwner.AI,
+                message_content=ANSWER,
+                graph_data=graph,
+            )
+        )
+
+    return {
+        f"format_history[{HISTORY_LENGTH}]": lambda: format_history(history),
+        f"get_params[{HISTORY_LENGTH}]": lambda: get_params(formatted, "How much should I save each month?"),
+        "sse_frames_per_response[events]": sse_frames,
+        "sse_frames_per_response[raw]": sse_frames_raw,
+        "final_response_json_loads": lambda: json.loads(ANSWER),
+        "stream_parser_per_response": stream_parser,
+        "compound_interest[daily,50y]": lambda: calculate_compound_interest(
+            10000, 7, 50, compounds_per_year="daily", additional_contribution=300
+        ),
+        "compound_interest[monthly,50y]": lambda: calculate_compound_interest(
+            10000, 7, 50, compounds_per_year="monthly", additional_contribution=300
+        ),
+        "compound_interest[daily,1y]": lambda: calculate_compound_interest(10000, 7, 1, compounds_per_year="daily"),
+        "save_message_item": save,
+    }
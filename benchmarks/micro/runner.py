@@ -0,0 +1,122 @@
+"""
+Times each micro-benchmark case and compares it against the stored baseline.
+
+Every case is run in a calibrated loop of at least `min_time` seconds, `repeat` times. The
+fastest repeat is the figure that is compared, as it is the least disturbed by whatever else the
+machine is doing; the median is reported alongside it. A case fails the gate when it is slower
+than its baseline by more than `threshold` on `retries` fresh measurements as well, so one noisy
+run doesn't fail it. Baselines are saved from the run with the median of `save_runs` fastest
+repeats, rather than from one run that may have landed on an unusually quiet moment.
+
+    python -m benchmarks.micro                  # compare against baselines.json
+    python -m benchmarks.micro --save           # record new baselines
+    python -m benchmarks.micro --filter sse     # only cases whose name contains "sse"
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from benchmarks.micro.cases import build_cases
+
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+
+
+def calibrate(case: Callable[[], Any], min_time: float) -> int:
+    """Returns how many calls take at least min_time seconds"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            case()
+        if time.perf_counter() - start >= min_time:
+            return loops
+        loops *= 2
+
+
+def measure(case: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, float]:
+    """Returns the fastest and median time per call, in microseconds"""
+    loops = calibrate(case, min_time)
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            case()
+        timings.append((time.perf_counter() - start) / loops * 1e6)
+    return {"min_us": round(min(timings), 3), "median_us": round(statistics.median(timings), 3), "loops": loops}
+
+
+def measure_typical(case: Callable[[], Any], repeat: int, min_time: float, runs: int) -> Dict[str, float]:
+    """Measures a case `runs` times and returns the run with the median fastest repeat"""
+    results = sorted((measure(case, repeat, min_time) for _ in range(runs)), key=lambda result: result["min_us"])
+    return results[(len(results) - 1) // 2]
+
+
+def machine() -> Dict[str, str]:
+    """Describes where the numbers were taken, since baselines only compare on the same machine"""
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.machine()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", action="store_true", help="Store the results as the new baselines")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown, as a fraction")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.1, help="Seconds per repeat")
+    parser.add_argument("--retries", type=int, default=2, help="Fresh measurements of a case before it fails")
+    parser.add_argument("--save-runs", type=int, default=5, help="Runs per case when recording baselines")
+    parser.add_argument("--baselines", type=Path, default=BASELINES_PATH)
+    args = parser.parse_args()
+
+    stored = json.loads(args.baselines.read_text()) if args.baselines.exists() else {"cases": {}}
+    baselines: Dict[str, Dict[str, float]] = stored["cases"]
+    if not args.save and stored.get("machine") and stored["machine"] != machine():
+        print(f"warning: baselines were taken on {stored['machine']}, comparisons may not hold")
+
+    results: Dict[str, Dict[str, float]] = {}
+    regressions = []
+    print(f"{'case':<36} {'min us':>12} {'median us':>12} {'baseline':>12} {'change':>8}")
+    for name, case in build_cases().items():
+        if args.filter not in name:
+            continue
+        baseline = baselines.get(name)
+        if args.save:
+            result = measure_typical(case, args.repeat, args.min_time, args.save_runs)
+        else:
+            result = measure(case, args.repeat, args.min_time)
+            for _ in range(args.retries if baseline else 0):
+                if result["min_us"] <= baseline["min_us"] * (1 + args.threshold):
+                    break
+                # Only a slowdown that holds up on a fresh measurement counts
+                retry = measure(case, args.repeat, args.min_time)
+                result = min(result, retry, key=lambda run: run["min_us"])
+        results[name] = result
+        if baseline is None:
+            change = "new"
+            baseline_text = "-"
+        else:
+            ratio = result["min_us"] / baseline["min_us"] - 1
+            change = f"{ratio:+.1%}"
+            baseline_text = f"{baseline['min_us']:.3f}"
+            if ratio > args.threshold and not args.save:
+                regressions.append(name)
+                change += " !"
+        print(f"{name:<36} {result['min_us']:>12.3f} {result['median_us']:>12.3f} {baseline_text:>12} {change:>8}")
+
+    if args.save:
+        # Cases that were filtered out keep their previous baselines
+        merged = {**baselines, **results}
+        args.baselines.write_text(json.dumps({"machine": machine(), "cases": merged}, indent=2) + "\n")
+        print(f"baselines written to {args.baselines}")
+        return
+
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"no regressions beyond {args.threshold:.0%}")
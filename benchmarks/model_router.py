@@ -0,0 +1,121 @@
+"""
+Offline evaluation of the model router.
+
+By default the routing rules are scored against two sets of hand-labelled turns: accuracy, a
+confusion matrix, and every turn sent to a cheaper tier than it needed (a quality risk) or a
+dearer one (wasted spend). benchmarks/model_router_cases.json was written alongside the rules
+and they were tuned on it, so its score is fit to them. benchmarks/model_router_holdout.json was
+labelled afterwards and never tuned against; its score is the one to quote, and it should stay
+that way: move a case into the tuning set before adjusting the rules for it.
+
+With --log, routing decisions are read back from service logs instead (lines containing
+"model_route ") and summarized per tier and rule with how those turns went, which shows where
+the rules need tuning.
+
+    python -m benchmarks.model_router
+    python -m benchmarks.model_router --log service.log
+"""
+
+import argparse
+import json
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from app.modules import ROUTE_LOG_PREFIX, ModelRouter
+
+CASES = Path(__file__).parent / "model_router_cases.json"
+HOLDOUT = Path(__file__).parent / "model_router_holdout.json"
+TIERS = ("light", "standard", "heavy")
+
+
+def evaluate_cases(path: Path):
+    """Routes every labelled case and compares the tier with its label"""
+    print(f"== {path.name}")
+    router = ModelRouter(light_model="light", standard_model="standard", heavy_model="heavy")
+    cases = json.loads(path.read_text())
+    confusion: Dict[str, Counter] = defaultdict(Counter)
+    mistakes = []
+    started = time.perf_counter()
+    for case in cases:
+        history = [{"role": "user", "content": "earlier message"}] * case["history_messages"]
+        decision = router.route(case["message"], history, case["context"])
+        confusion[case["tier"]][decision.tier] += 1
+        if decision.tier != case["tier"]:
+            mistakes.append((case, decision))
+    per_route = (time.perf_counter() - started) / len(cases)
+
+    correct = sum(confusion[tier][tier] for tier in TIERS)
+    print(f"{len(cases)} labelled turns, {correct / len(cases):.0%} routed to their tier, {per_route * 1e6:.0f}us each")
+    print(f"\n{'label / routed':>16} {' '.join(f'{tier:>9}' for tier in TIERS)}")
+    for label in TIERS:
+        print(f"{label:>16} {' '.join(f'{confusion[label][tier]:>9}' for tier in TIERS)}")
+
+    for title, check in (
+        ("under-routed (cheaper tier than needed)", lambda label, routed: routed < label),
+        ("over-routed (dearer tier than needed)", lambda label, routed: routed > label),
+    ):
+        rows = [
+            (case, decision)
+            for case, decision in mistakes
+            if check(TIERS.index(case["tier"]), TIERS.index(decision.tier))
+        ]
+        print(f"\n{title}: {len(rows)}")
+        for case, decision in rows:
+            print(f"  {case['tier']:>8} -> {decision.tier:<8} {decision.reason:<18} {case['message'][:70]!r}")
+    print()
+
+
+def summarize_log(path: Path):
+    """Aggregates logged decisions and their outcomes per tier and rule"""
+    entries: List[Dict[str, Any]] = []
+    with path.open() as log:
+        for line in log:
+            index = line.find(ROUTE_LOG_PREFIX)
+            if index != -1:
+                entries.append(json.loads(line[index + len(ROUTE_LOG_PREFIX):]))
+    if not entries:
+        print(f"no routing decisions in {path}")
+        return
+
+    groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for entry in entries:
+        groups[(entry["tier"], entry["reason"])].append(entry)
+    print(f"{len(entries)} routed turns")
+    print(
+        f"{'tier':>9} {'rule':<18} {'turns':>6} {'tool use':>9} {'out tok':>8} {'cap hit':>8} "
+        f"{'failed':>7} {'aborted':>8} {'seconds':>8}"
+    )
+    for (tier, reason), group in sorted(groups.items(), key=lambda item: (TIERS.index(item[0][0]), item[0][1])):
+        outcomes = [entry["outcome"] for entry in group]
+        signals = Counter(signal for entry in group for signal in entry["signals"])
+
+        def share(predicate, items=outcomes) -> float:
+            return sum(1 for item in items if predicate(item)) / len(items)
+
+        print(
+            f"{tier:>9} {reason:<18} {len(group):>6} {share(lambda o: o.get('tool_calls')):>9.0%} "
+            f"{sum(o.get('output_tokens', 0) for o in outcomes) / len(group):>8.0f} "
+            f"{signals['output_cap'] / len(group):>8.0%} {signals['failed'] / len(group):>7.0%} "
+            f"{share(lambda o: o.get('status') == 'aborted'):>8.0%} "
+            f"{sum(o.get('seconds', 0) for o in outcomes) / len(group):>8.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--cases", type=Path, nargs="+", default=[CASES, HOLDOUT], help="Labelled turns to score the rules against"
+    )
+    parser.add_argument("--log", type=Path, help="Summarize routing decisions from a service log instead")
+    args = parser.parse_args()
+    if args.log:
+        summarize_log(args.log)
+    else:
+        for path in args.cases:
+            evaluate_cases(path)
+
+
+if __name__ == "__main__":
+    main()
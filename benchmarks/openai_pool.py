@@ -0,0 +1,160 @@
+"""
+Rate-limit-aware scheduling across several OpenAI keys.
+
+Three stand-in keys enforce their own request and token budgets and answer 429 past them. Each
+starts with only a sliver of its minute left, as other workers share the keys, so only the
+rate-limit headers reveal what is really available. The same burst of calls goes out three ways:
+everything on the largest key, round-robin over all keys with SDK-style retries, and through
+the pool, which reserves each call's estimated tokens on the key with the most headroom.
+
+    python -m benchmarks.openai_pool
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, List
+
+import httpx
+from openai import RateLimitError
+
+from app.modules import OpenAIPool
+from app.utils import METRICS
+
+# (requests, tokens) per minute for each key
+KEY_LIMITS = [(300, 150_000), (600, 300_000), (1200, 600_000)]
+# Share of each key's minute left when the benchmark starts
+STARTING_HEADROOM = 0.05
+CALLS_PER_SECOND = 30
+SECONDS = 6
+MAX_OUTPUT_TOKENS = 300
+CALL_LATENCY = 0.05
+SDK_RETRIES = 2
+
+
+class StubKey:
+    """One key's server side: refilling budgets, rate-limit headers and 429s"""
+
+    def __init__(self, name: str, requests_per_minute: int, tokens_per_minute: int):
+        self.name = name
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.remaining = {budget: limit * STARTING_HEADROOM for budget, limit in self.limits.items()}
+        self.updated = time.monotonic()
+        self.calls = 0
+        self.rate_limited = 0
+        self.responses = SimpleNamespace(with_raw_response=SimpleNamespace(create=self.create))
+
+    def headers(self) -> Dict[str, str]:
+        """The x-ratelimit-* headers OpenAI sends"""
+        headers = {}
+        for budget, limit in self.limits.items():
+            remaining = max(0.0, self.remaining[budget])
+            headers[f"x-ratelimit-limit-{budget}"] = str(limit)
+            headers[f"x-ratelimit-remaining-{budget}"] = str(int(remaining))
+            headers[f"x-ratelimit-reset-{budget}"] = f"{(limit - remaining) / limit * 60:.3f}s"
+        return headers
+
+    async def create(self, **params):
+        """Charges the call's estimated tokens up front, as the API does, or rejects it"""
+        now = time.monotonic()
+        for budget, limit in self.limits.items():
+            self.remaining[budget] = min(limit, self.remaining[budget] + (now - self.updated) * limit / 60)
+        self.updated = now
+        tokens = len(json.dumps(params["input"])) // 4 + params["max_output_tokens"]
+        if self.remaining["requests"] < 1 or self.remaining["tokens"] < tokens:
+            self.rate_limited += 1
+            response = httpx.Response(
+                429,
+                headers={**self.headers(), "retry-after-ms": "500"},
+                request=httpx.Request("POST", "https://api.openai.com/v1/responses"),
+            )
+            raise RateLimitError("Rate limit reached", response=response, body=None)
+        self.remaining["requests"] -= 1
+        self.remaining["tokens"] -= tokens
+        self.calls += 1
+        await asyncio.sleep(CALL_LATENCY)
+        return SimpleNamespace(headers=self.headers(), parse=lambda: "ok")
+
+
+def workload(seed: int) -> List[dict]:
+    """Calls with prompts of a few hundred to a couple of thousand tokens"""
+    rng = random.Random(seed)
+    return [
+        {"input": [{"role": "user", "content": "x" * rng.randint(1000, 8000)}], "max_output_tokens": MAX_OUTPUT_TOKENS}
+        for _ in range(CALLS_PER_SECOND * SECONDS)
+    ]
+
+
+async def naive_call(keys: List[StubKey], index: int, params: dict) -> str:
+    """Rotates over the keys, retrying the same key on 429 like the SDK would"""
+    key = keys[index % len(keys)]
+    for attempt in range(SDK_RETRIES + 1):
+        try:
+            await key.responses.with_raw_response.create(**params)
+            return "ok"
+        except RateLimitError:
+            if attempt == SDK_RETRIES:
+                return "failed"
+            await asyncio.sleep(0.5 * 2**attempt)
+    return "failed"
+
+
+async def pooled_call(pool: OpenAIPool, params: dict) -> str:
+    """Sends the call through the pool"""
+    try:
+        await pool.create_response(params)
+        return "ok"
+    except RateLimitError:
+        return "failed"
+
+
+async def run(label: str, send):
+    """Fires the workload at CALLS_PER_SECOND and reports outcomes and per-call latency"""
+    keys = [StubKey(f"key{index}", *limits) for index, limits in enumerate(KEY_LIMITS)]
+    call = send(keys)
+
+    async def timed(index: int, params: dict):
+        await asyncio.sleep(index / CALLS_PER_SECOND)
+        started = time.perf_counter()
+        outcome = await call(index, params)
+        return outcome, time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(timed(index, params) for index, params in enumerate(workload(seed=1))))
+    elapsed = time.perf_counter() - started
+    outcomes = Counter(outcome for outcome, _ in results)
+    latencies = sorted(seconds for outcome, seconds in results if outcome == "ok")
+    shares = " ".join(f"{key.name} {key.calls:>3}" for key in keys)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(
+        f"{label:>22} {outcomes['ok']:>5} {outcomes['failed']:>7} {sum(key.rate_limited for key in keys):>6}"
+        f" {statistics.median(latencies) if latencies else 0:>8.2f}s {p95:>7.2f}s {elapsed:>7.1f}s   {shares}"
+    )
+
+
+async def main():
+    print(f"{CALLS_PER_SECOND * SECONDS} calls at {CALLS_PER_SECOND}/s, keys start with {STARTING_HEADROOM:.0%} left")
+    print(f"{'':>22} {'ok':>5} {'failed':>7} {'429s':>6} {'p50':>9} {'p95':>8} {'total':>8}   calls per key")
+    await run("largest key only", lambda keys: lambda index, params: naive_call(keys[-1:], index, params))
+    await run("round-robin", lambda keys: lambda index, params: naive_call(keys, index, params))
+
+    def pooled(keys):
+        pool = OpenAIPool(clients=keys, requests_per_minute=600, tokens_per_minute=300_000, max_wait=20)
+        return lambda index, params: pooled_call(pool, params)
+
+    await run("pool", pooled)
+    wait = METRICS.histogram("openai_pool_wait_seconds", "")
+    retries = METRICS.counter("openai_pool_retries_total", "")
+    print(
+        f"\npool: mean wait for headroom {wait.total() / max(1, wait.count()):.2f}s, "
+        f"retries after 429 {retries.value(reason='rate_limited'):g}, "
+        f"estimated tokens reserved {METRICS.counter('openai_pool_estimated_tokens_total', '').value():g}"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
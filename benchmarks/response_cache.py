@@ -0,0 +1,122 @@
+"""
+Hit rate and latency of the response cache on a stream of generic questions.
+
+Questions are drawn with a skewed distribution, as real traffic repeats a few favourites, and
+one in ten needs a tool so it is never cached. A second run starts with an empty in-process
+tier over the same table, as a fresh worker would, so its hits come from DynamoDB.
+
+    python -m benchmarks.response_cache
+"""
+
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from app.modules import ResponseCache
+from app.utils import METRICS
+from benchmarks.stubs import StubResponses, build_agent_service, consume, function_call_events, text_events
+
+QUESTIONS = [
+    "How big should my emergency fund be?",
+    "What's the difference between a Roth IRA and a traditional IRA?",
+    "Should I pay off debt or invest first?",
+    "What is a good credit utilization ratio?",
+    "How does compound interest work?",
+    "What's an index fund?",
+    "How much should I save for retirement each month?",
+    "Is it better to rent or buy a home?",
+    "What's the 50/30/20 budgeting rule?",
+    "How do I start building credit?",
+]
+TOOL_QUESTION = "If I invest $5,000 at 6% for 10 years, what will I have?"
+REQUESTS = 200
+FIRST_EVENT_DELAY = 0.3
+EVENT_DELAY = 0.002
+TABLE_LATENCY = 0.005
+
+
+class StubTable:
+    """An in-memory DynamoDB table with a fixed per-call latency"""
+
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key):  # pylint: disable=C0103
+        """Returns the item under the key, if any"""
+        time.sleep(TABLE_LATENCY)
+        item = self.items.get(Key["cache_key"])
+        return {"Item": item} if item else {}
+
+    def put_item(self, Item):  # pylint: disable=C0103
+        """Stores the item"""
+        time.sleep(TABLE_LATENCY)
+        self.items[Item["cache_key"]] = Item
+
+
+def script(params):
+    """Answers every question directly, except the tool question which computes first"""
+    inputs = params["input"] if isinstance(params["input"], list) else []
+    message = str(inputs[-1].get("content", "")) if inputs and isinstance(inputs[-1], dict) else ""
+    if TOOL_QUESTION in message and "Based on this context" not in message:
+        arguments = {"principal": 5000, "annual_rate": 6, "time_years": 10}
+        return function_call_events([{"name": "calculate_compound_interest", "arguments": arguments}])
+    answer = "Here's a general answer to your question about personal finance. " * 8
+    return text_events(json.dumps({"message": answer}))
+
+
+def workload(seed: int):
+    """Question sequence with Zipf-like repetition and a share of tool questions"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(QUESTIONS))]
+    return [
+        TOOL_QUESTION if rng.random() < 0.1 else rng.choices(QUESTIONS, weights)[0]
+        for _ in range(REQUESTS)
+    ]
+
+
+async def run(label: str, cache: ResponseCache, seed: int):
+    """Sends the workload through a service with the given cache and prints its figures"""
+    responses = StubResponses(script, first_event_delay=FIRST_EVENT_DELAY, event_delay=EVENT_DELAY)
+    service = build_agent_service(responses, response_cache=cache)
+    lookups = METRICS.counter("response_cache_lookups_total", "")
+    before = {result: lookups.value(result=result) for result in ("memory", "dynamodb", "miss")}
+    latency = {"hit": [], "miss": []}
+
+    for index, message in enumerate(workload(seed)):
+        hits_before = lookups.value(result="memory") + lookups.value(result="dynamodb")
+        start = time.perf_counter()
+        first = []
+        response = await service.handle_message(
+            message=message, history=[], user_id="u", session_id=f"s{index}", stream_format="events"
+        )
+        await consume(response.body_iterator, on_first=lambda: first.append(time.perf_counter() - start))
+        kind = "hit" if lookups.value(result="memory") + lookups.value(result="dynamodb") > hits_before else "miss"
+        latency[kind].append((first[0] if first else 0.0, time.perf_counter() - start))
+    await cache.close()
+
+    counts = {result: lookups.value(result=result) - before[result] for result in before}
+    print(f"\n{label}: {REQUESTS} requests, {len(responses.calls)} model calls")
+    print(
+        f"  hit rate {(counts['memory'] + counts['dynamodb']) / REQUESTS:.0%} "
+        f"(memory {counts['memory']:g}, dynamodb {counts['dynamodb']:g}, miss {counts['miss']:g})"
+    )
+    for kind, samples in latency.items():
+        if samples:
+            firsts = sorted(sample[0] * 1000 for sample in samples)
+            totals = sorted(sample[1] * 1000 for sample in samples)
+            print(
+                f"  {kind:>4}: {len(samples):>4}  first frame p50 {statistics.median(firsts):7.1f}ms "
+                f"p95 {firsts[int(len(firsts) * 0.95) - 1]:7.1f}ms  total p50 {statistics.median(totals):7.1f}ms"
+            )
+
+
+async def main():
+    table = StubTable()
+    await run("cold worker", ResponseCache(model="stub", instructions="", tools=[], table=table), seed=1)
+    await run("fresh worker, warm table", ResponseCache(model="stub", instructions="", tools=[], table=table), seed=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
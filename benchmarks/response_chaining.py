@@ -0,0 +1,77 @@
+"""
+Input sent per model hop for a three-hop tool chain, with and without response chaining.
+
+Runs against a stub of the Responses streaming protocol that checks each follow-up the way the
+API would: a chained follow-up must reference the previous response and answer every one of
+its function calls with a function_call_output item.
+
+    python -m benchmarks.response_chaining
+"""
+
+import asyncio
+import json
+
+from app.utils import count_json_tokens
+from benchmarks.stubs import StubResponses, build_agent_service, consume, function_call_events, text_events
+
+HISTORY = [
+    {"message_type": "user" if i % 2 == 0 else "ai", "message_content": f"Earlier message {i} " * 20}
+    for i in range(20)
+]
+FINAL_ANSWER = json.dumps({"message": "Your projection is ready."})
+
+
+class ProtocolCheckingScript:
+    """Asks for two tool hops, then answers, validating chained follow-ups along the way"""
+
+    def __init__(self):
+        self.pending_calls = {}
+
+    def __call__(self, params):
+        hop = len(self.pending_calls)
+        if params.get("previous_response_id"):
+            expected = self.pending_calls[hop - 1]
+            outputs = {item["call_id"] for item in params["input"] if item["type"] == "function_call_output"}
+            assert outputs == expected, f"hop {hop}: expected outputs for {expected}, got {outputs}"
+
+        if hop == 2:
+            self.pending_calls[hop] = set()
+            return text_events(FINAL_ANSWER)
+
+        events = function_call_events(
+            [
+                {"name": "compare_compound_interest", "arguments": args}
+                for args in (
+                    {"principal": 1000, "annual_rates": [4, 6], "time_years": [10], "additional_contributions": None,
+                     "compounds_per_year": None, "contribution_frequency": None},
+                    {"principal": 5000, "annual_rates": [5], "time_years": [5, 20], "additional_contributions": [100],
+                     "compounds_per_year": None, "contribution_frequency": None},
+                )
+            ]
+        )
+        self.pending_calls[hop] = {event.item.call_id for event in events if event.type == "response.output_item.added"}
+        return events
+
+
+async def run(chain_responses: bool):
+    """Runs one turn and returns the input tokens sent on each hop"""
+    responses = StubResponses(ProtocolCheckingScript())
+    service = build_agent_service(responses, chain_responses=chain_responses)
+    response = await service.handle_message(
+        message="Compare these savings plans", history=HISTORY, user_id="u", session_id="s"
+    )
+    frames = await consume(response.body_iterator)
+    assert frames[-1] == "data: [DONE]\n\n"
+    return [count_json_tokens(call["input"]) for call in responses.calls]
+
+
+async def main():
+    print(f"{'mode':>10} {'hop input tokens':>30} {'total':>8}")
+    for chain_responses in (False, True):
+        tokens = await run(chain_responses)
+        mode = "chained" if chain_responses else "rebuilt"
+        print(f"{mode:>10} {str(tokens):>30} {sum(tokens):>8}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
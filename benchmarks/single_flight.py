@@ -0,0 +1,103 @@
+"""
+Duplicate submissions with and without single-flight coalescing.
+
+A flaky client sends the same message four times: at once, twice while the first answer is
+streaming and once just after it finished. A second scenario drops the first connection mid-
+stream and retries within the abandon grace period. Model calls, chat_logs rows and whether
+every request got the same stream are compared.
+
+    python -m benchmarks.single_flight
+"""
+
+import asyncio
+import json
+import time
+
+from app.modules import SingleFlight
+from app.utils import METRICS
+from benchmarks.stubs import StubChatLogWriter, StubResponses, build_agent_service, consume, text_events
+
+ANSWER = json.dumps({"message": "Here's what a healthy emergency fund looks like for you. " * 20})
+FIRST_EVENT_DELAY = 0.3
+EVENT_DELAY = 0.005
+# Seconds after the first submission at which each duplicate arrives
+ARRIVALS = (0.0, 0.05, 0.6, 2.5)
+
+
+def build(single_flight):
+    """Builds a service whose model streams ANSWER, counting model calls and chat_logs rows"""
+    responses = StubResponses(lambda params: text_events(ANSWER), FIRST_EVENT_DELAY, EVENT_DELAY)
+    chat_log_writer = StubChatLogWriter()
+    service = build_agent_service(responses, chat_log_writer=chat_log_writer, single_flight=single_flight)
+    return service, responses, chat_log_writer
+
+
+async def submit(service, delay: float, started: float):
+    """Sends the message after `delay` seconds, returning its body and time to first frame"""
+    await asyncio.sleep(delay)
+    sent = time.perf_counter()
+    first = []
+    response = await service.handle_message(
+        message="How big should my emergency fund be?", history=[], user_id="u", session_id="s"
+    )
+    frames = await consume(response.body_iterator, on_first=lambda: first.append(time.perf_counter() - sent))
+    return "".join(frames), first[0] if first else None, sent - started
+
+
+async def duplicates(label: str, single_flight):
+    """Sends every arrival and prints what it cost"""
+    service, responses, chat_log_writer = build(single_flight)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(submit(service, delay, started) for delay in ARRIVALS))
+    identical = all(body == results[0][0] for body, _, _ in results)
+    firsts = " ".join(f"{first * 1000:6.0f}" for _, first, _ in results)
+    print(
+        f"{label:>14} {len(responses.calls):>12} {len(chat_log_writer.items):>14} {str(identical):>10}   {firsts}"
+    )
+
+
+async def retry_after_drop(abandon_grace: float, retry_after: float):
+    """Drops the first connection mid-stream and retries after `retry_after` seconds"""
+    service, responses, chat_log_writer = build(SingleFlight(abandon_grace=abandon_grace))
+
+    async def dropped():
+        response = await service.handle_message(
+            message="How big should my emergency fund be?", history=[], user_id="u", session_id="s"
+        )
+        frames = 0
+        async for _ in response.body_iterator:
+            frames += 1
+            if frames == 10:
+                break
+        await response.body_iterator.aclose()
+
+    await dropped()
+    await asyncio.sleep(retry_after)
+    body, _, _ = await submit(service, 0, time.perf_counter())
+    aborted = sum(1 for item in chat_log_writer.items if item.get("aborted"))
+    complete = body.endswith("data: [DONE]\n\n")
+    print(
+        f"{retry_after:>9.1f}s {abandon_grace:>8.1f}s {len(responses.calls):>12} {aborted:>14} {str(complete):>15}"
+    )
+
+
+async def main():
+    print(f"duplicates arriving at {', '.join(f'{delay:g}s' for delay in ARRIVALS)}")
+    print(f"{'':>14} {'model calls':>12} {'chat_log rows':>14} {'identical':>10}   first frame ms per request")
+    await duplicates("independent", None)
+    await duplicates("single-flight", SingleFlight(replay_window=10.0))
+
+    print("\nfirst connection dropped after 10 frames, then retried")
+    print(f"{'retry':>10} {'grace':>9} {'model calls':>12} {'aborted rows':>14} {'retry complete':>15}")
+    await retry_after_drop(abandon_grace=2.0, retry_after=0.5)
+    await retry_after_drop(abandon_grace=0.2, retry_after=0.5)
+    requests = METRICS.counter("single_flight_requests_total", "")
+    print(
+        f"\nleader {requests.value(role='leader'):g}, follower {requests.value(role='follower'):g}, "
+        f"replay {requests.value(role='replay'):g}, "
+        f"abandoned {METRICS.counter('single_flight_abandoned_total', '').value():g}"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Socket writes and CPU per streamed answer, with and without SSE frame coalescing.
+
+Each answer is streamed through the real StreamingResponse into an ASGI send that counts body
+messages; the server turns each one into a single transport write, so that is the number of
+send syscalls when the socket keeps up. "paced" replays deltas at a model-like rate to show
+writes and time to first token, "burst" replays them back to back to isolate CPU.
+
+    python -m benchmarks.sse_coalescing
+"""
+
+import asyncio
+import json
+import time
+from typing import Optional
+
+from app.utils import SSECoalescing, format_sse
+from benchmarks.stubs import StubResponses, build_agent_service, text_events
+
+ANSWER = json.dumps({"message": "Here's how your savings could grow over the next few years. " * 25})
+PACED_DELAY = 0.005
+RESPONSES = 5
+MODES = {
+    "per-token": None,
+    "256B/20ms": SSECoalescing(max_bytes=256, max_delay=0.02),
+    "512B/50ms": SSECoalescing(max_bytes=512, max_delay=0.05),
+    "4KB/100ms": SSECoalescing(max_bytes=4096, max_delay=0.1),
+}
+
+
+async def stream_once(service, stream_format: str):
+    """Streams one answer, returning (writes, bytes, seconds to first delta)"""
+    response = await service.handle_message(
+        message="How will my savings grow?", history=[], user_id="u", session_id="s", stream_format=stream_format
+    )
+    writes = 0
+    size = 0
+    first_delta: Optional[float] = None
+    start = time.perf_counter()
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal writes, size, first_delta
+        if message["type"] == "http.response.body" and message.get("body"):
+            writes += 1
+            size += len(message["body"])
+            if first_delta is None:
+                first_delta = time.perf_counter() - start
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}, "method": "POST", "headers": []}
+    await response(scope, receive, send)
+    return writes, size, first_delta or 0.0
+
+
+async def run(label: str, coalescing: Optional[SSECoalescing], delay: float, stream_format: str):
+    """Streams RESPONSES answers in one mode and prints the per-answer averages"""
+    service = build_agent_service(
+        StubResponses(lambda params: text_events(ANSWER), event_delay=delay), sse_coalescing=coalescing
+    )
+    writes = size = 0
+    first_delta = 0.0
+    cpu_start = time.process_time()
+    for _ in range(RESPONSES):
+        answer_writes, answer_size, answer_first_delta = await stream_once(service, stream_format)
+        writes += answer_writes
+        size += answer_size
+        first_delta += answer_first_delta
+    cpu = (time.process_time() - cpu_start) / RESPONSES
+    print(
+        f"{label:>10} {stream_format:>7} {writes / RESPONSES:>8.0f} {size / RESPONSES:>8.0f} "
+        f"{first_delta / RESPONSES * 1000:>10.1f} {cpu * 1000:>9.2f}"
+    )
+
+
+def encoder_comparison():
+    """Per-frame encoding cost of the standard library encoder against orjson"""
+    deltas = [{"delta": ANSWER[i:i + 4]} for i in range(0, len(ANSWER), 4)]
+    start = time.perf_counter()
+    for _ in range(20):
+        for delta in deltas:
+            f"event: message.delta\ndata: {json.dumps(delta)}\n\n"  # pylint: disable=W0104
+    stdlib = (time.perf_counter() - start) / (20 * len(deltas))
+    start = time.perf_counter()
+    for _ in range(20):
+        for delta in deltas:
+            format_sse(delta, event="message.delta")
+    fast = (time.perf_counter() - start) / (20 * len(deltas))
+    print(f"frame encoding: json.dumps {stdlib * 1e6:.2f}us, orjson {fast * 1e6:.2f}us per frame")
+
+
+async def main():
+    deltas = len(text_events(ANSWER))
+    print(f"{deltas} deltas per answer, paced at {PACED_DELAY * 1000:g}ms, {RESPONSES} answers per mode")
+    for pacing, delay in (("paced", PACED_DELAY), ("burst", 0.0)):
+        print(f"\n{pacing}")
+        print(f"{'mode':>10} {'format':>7} {'writes':>8} {'bytes':>8} {'ttft ms':>10} {'cpu ms':>9}")
+        for stream_format in ("raw", "events"):
+            for label, coalescing in MODES.items():
+                await run(label, coalescing, delay, stream_format)
+    print()
+    encoder_comparison()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+"""In-process stand-ins for OpenAI and DynamoDB used by the benchmarks"""
+
+import asyncio
+import json
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+
+def text_events(text: str, chunk_size: int = 4) -> List[SimpleNamespace]:
+    """Splits text into response.output_text.delta events"""
+    return [
+        SimpleNamespace(type="response.output_text.delta", delta=text[i:i + chunk_size], output_index=0)
+        for i in range(0, len(text), chunk_size)
+    ]
+
+
+def function_call_events(calls: List[Dict[str, Any]], chunk_size: int = 8) -> List[SimpleNamespace]:
+    """Builds the added/arguments.delta event pairs for a list of {name, arguments} calls"""
+    events = []
+    for index, call in enumerate(calls):
+        call_id = f"call_{uuid.uuid4().hex[:8]}"
+        item = SimpleNamespace(type="function_call", name=call["name"], call_id=call_id, arguments="")
+        events.append(SimpleNamespace(type="response.output_item.added", item=item, output_index=index))
+        arguments = json.dumps(call["arguments"])
+        events.extend(
+            SimpleNamespace(
+                type="response.function_call_arguments.delta",
+                delta=arguments[i:i + chunk_size],
+                output_index=index,
+            )
+            for i in range(0, len(arguments), chunk_size)
+        )
+    return events
+
+
+class StubStream:
+    """Async iterator replaying events with a first-event latency and per-event delay"""
+
+    def __init__(self, events: List[SimpleNamespace], first_event_delay: float, event_delay: float):
+        self.__response = SimpleNamespace(id=f"resp_{uuid.uuid4().hex[:12]}", usage=None)
+        self.__events = [
+            SimpleNamespace(type="response.created", response=self.__response),
+            *events,
+            SimpleNamespace(type="response.completed", response=self.__response),
+        ]
+        self.__first_event_delay = first_event_delay
+        self.__event_delay = event_delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self.__iterate()
+
+    async def __iterate(self):
+        await asyncio.sleep(self.__first_event_delay)
+        for event in self.__events:
+            if self.closed:
+                return
+            yield event
+            if self.__event_delay:
+                await asyncio.sleep(self.__event_delay)
+
+    async def close(self):
+        """Matches AsyncStream.close"""
+        self.closed = True
+
+
+class StubResponses:
+    """Stands in for AsyncOpenAI().responses, scripting each call from the request params"""
+
+    def __init__(
+        self,
+        script: Callable[[Dict[str, Any]], List[SimpleNamespace]],
+        first_event_delay: float = 0.0,
+        event_delay: float = 0.0,
+    ):
+        self.__script = script
+        self.__first_event_delay = first_event_delay
+        self.__event_delay = event_delay
+        self.calls: List[Dict[str, Any]] = []
+        self.streams: List[StubStream] = []
+
+    async def create(self, **params):
+        """Records the params and returns a scripted stream"""
+        self.calls.append(params)
+        self.streams.append(StubStream(self.__script(params), self.__first_event_delay, self.__event_delay))
+        return self.streams[-1]
+
+
+class StubOpenAI:
+    """Stands in for AsyncOpenAI"""
+
+    def __init__(self, responses: StubResponses):
+        self.responses = responses
+
+
+class StubChatLogWriter:
+    """Keeps saved chat log items in memory"""
+
+    def __init__(self):
+        self.items: List[Dict[str, Any]] = []
+
+    async def save(self, item: Dict[str, Any]):
+        """Stores the item"""
+        self.items.append(item)
+        return item
+
+
+class StubSessionWorker:
+    """Ignores session updates"""
+
+    def submit(self, **_kwargs):
+        """Drops the update"""
+
+
+def build_agent_service(responses: StubResponses, **overrides):
+    """Builds an AgentService wired to in-process stubs, with any dependency overridable"""
+    # Imported here so the stubs stay importable without the app's dependencies
+    from app.modules import AgentService, ContextWindowService, HistoryStore  # pylint: disable=C0415
+
+    openai = StubOpenAI(responses)
+    dependencies: Dict[str, Any] = {
+        "openai": openai,
+        "instructions": "",
+        "model": "stub",
+        "tools": [],
+        "chat_log_writer": StubChatLogWriter(),
+        "session_worker": StubSessionWorker(),
+        "history_store": HistoryStore(table=None, index_name=None),
+        "context_window_service": ContextWindowService(
+            openai=openai, instructions="", tools=[], max_input_tokens=1_000_000
+        ),
+        "financial_connections_service": None,
+        "process_pool": None,
+    }
+    dependencies.update(overrides)
+    return AgentService(**dependencies)
+
+
+async def consume(body, on_first: Optional[Callable[[], None]] = None) -> List[str]:
+    """Drains a StreamingResponse body iterator into a list of frames"""
+    frames = []
+    async for frame in body:
+        if not frames and on_first:
+            on_first()
+        frames.append(frame)
+    return frames
@@ -0,0 +1,63 @@
+"""
+End-to-end latency of one agent turn with 1, 3 and 10 parallel tool calls.
+
+The OpenAI stream is stubbed with a fixed first-event latency and each tool sleeps for a fixed
+time, so the numbers isolate how tool calls and follow-up model turns are scheduled.
+
+    python -m benchmarks.tool_calls
+"""
+
+import asyncio
+import json
+import time
+
+from benchmarks.stubs import StubResponses, build_agent_service, consume, function_call_events, text_events
+
+MODEL_LATENCY = 0.25
+TOOL_LATENCY = 0.2
+FINAL_ANSWER = json.dumps({"message": "Here is what I found."})
+
+
+class SlowFinancialConnections:
+    """Simulates upstream lookups with a fixed latency"""
+
+    async def get_acct_details(self, acct_ids, user_id=""):
+        """Returns fake accounts after TOOL_LATENCY"""
+        await asyncio.sleep(TOOL_LATENCY)
+        return [{"id": acct_id, "balance": 100} for acct_id in acct_ids]
+
+
+def make_script(tool_calls: int):
+    """First hop asks for `tool_calls` lookups, every later hop answers"""
+
+    def script(params):
+        if any("Based on this context" in str(item.get("content", "")) for item in params["input"]):
+            return text_events(FINAL_ANSWER)
+        return function_call_events(
+            [{"name": "get_acct_details", "arguments": {"acct_ids": [f"acct_{i}"]}} for i in range(tool_calls)]
+        )
+
+    return script
+
+
+async def run_turn(tool_calls: int):
+    """Runs one turn and returns (seconds, model calls)"""
+    responses = StubResponses(make_script(tool_calls), first_event_delay=MODEL_LATENCY)
+    service = build_agent_service(responses, financial_connections_service=SlowFinancialConnections())
+    start = time.perf_counter()
+    response = await service.handle_message(message="How are my accounts?", history=[], user_id="u", session_id="s")
+    await consume(response.body_iterator)
+    return time.perf_counter() - start, len(responses.calls)
+
+
+async def main():
+    print(f"model latency {MODEL_LATENCY}s, tool latency {TOOL_LATENCY}s")
+    print(f"{'tools':>5} {'seconds':>8} {'model calls':>12} {'sequential estimate':>20}")
+    for tool_calls in (1, 3, 10):
+        seconds, model_calls = await run_turn(tool_calls)
+        sequential = MODEL_LATENCY + tool_calls * (TOOL_LATENCY + MODEL_LATENCY)
+        print(f"{tool_calls:>5} {seconds:>8.3f} {model_calls:>12} {sequential:>20.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Output tokens and stream time for a 30-year projection, with the model writing the graph out
+versus the tool's chart being sent to the client directly.
+
+Text deltas are replayed at a fixed per-delta delay to stand in for the model's output rate.
+
+    python -m benchmarks.tool_charts
+"""
+
+import asyncio
+import json
+import time
+
+from app.utils import calculate_compound_interest, count_tokens
+from benchmarks.stubs import (
+    StubChatLogWriter,
+    StubResponses,
+    build_agent_service,
+    consume,
+    function_call_events,
+    text_events,
+)
+
+ARGUMENTS = {
+    "principal": 10000,
+    "annual_rate": 7,
+    "time_years": 30,
+    "compounds_per_year": None,
+    "additional_contribution": 500,
+    "contribution_frequency": None,
+}
+MESSAGE = "Here's how your savings could grow over the next 30 years with $500 a month at 7%."
+DELTA_DELAY = 0.01
+
+
+def final_answer(params) -> str:
+    """Answers the way the model would, given what the tool output told it"""
+    output = params["input"][0]["output"] if params.get("previous_response_id") else ""
+    if '"shown_to_user"' in output:
+        return json.dumps({"message": MESSAGE, "graph": {"series_ref": "chart_1"}})
+    breakdown = calculate_compound_interest(**ARGUMENTS)["yearly_breakdown"]
+    data = [{"label": f"Year {year}", "amount": amount} for year, amount in breakdown.items()]
+    return json.dumps({"message": MESSAGE, "graph": {"type": "line", "data": data}})
+
+
+async def run(stream_format: str):
+    """Runs one turn, returning (answer tokens, stream seconds, persisted graph points)"""
+    answers = []
+
+    def script(params):
+        if not params.get("previous_response_id"):
+            return function_call_events([{"name": "calculate_compound_interest", "arguments": ARGUMENTS}])
+        answers.append(final_answer(params))
+        return text_events(answers[-1])
+
+    chat_log_writer = StubChatLogWriter()
+    service = build_agent_service(
+        StubResponses(script, event_delay=DELTA_DELAY),
+        chat_log_writer=chat_log_writer,
+        chain_responses=True,
+    )
+    start = time.perf_counter()
+    response = await service.handle_message(
+        message="Project my savings", history=[], user_id="u", session_id="s", stream_format=stream_format
+    )
+    frames = await consume(response.body_iterator)
+    elapsed = time.perf_counter() - start
+
+    assert frames[-1] == "data: [DONE]\n\n"
+    graph = json.loads(chat_log_writer.items[-1]["graph_data"])
+    return count_tokens(answers[-1]), elapsed, len(graph["data"])
+
+
+async def main():
+    print(f"{'stream':>8} {'answer tokens':>14} {'stream s':>9} {'graph points':>13}")
+    for stream_format in ("raw", "events"):
+        tokens, elapsed, points = await run(stream_format)
+        print(f"{stream_format:>8} {tokens:>14} {elapsed:>9.2f} {points:>13}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+"""
+Prompt tokens saved by sending each model hop only the tools its turn can use.
+
+The labelled turns in benchmarks/model_router_cases.json run through the service with every
+tool definition and then with the tool selector, against a stand-in model that answers
+straight away. The report shows the tool-definition tokens sent per turn, how often each tool
+set was picked, and what selection costs per turn. A tool chain then checks that a tool a
+hop called stays available to the next hop.
+
+    python -m benchmarks.tool_selection
+"""
+
+import asyncio
+import json
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List
+
+from app.modules import ToolSelector
+from app.utils import AGENT_TOOLS, count_tokens
+from benchmarks.stubs import StubResponses, build_agent_service, consume, function_call_events, text_events
+
+CASES = Path(__file__).parent / "model_router_cases.json"
+ANSWER = json.dumps({"message": "Here is what I found."})
+
+
+def tool_tokens(params: Dict[str, Any]) -> int:
+    """Tokens of the tool definitions a model call was sent"""
+    return count_tokens(json.dumps(params.get("tools", []), separators=(",", ":")))
+
+
+def tool_names(params: Dict[str, Any]) -> List[str]:
+    """Names, or types for hosted tools, of the tools a model call was sent"""
+    return [tool.get("name") or tool["type"] for tool in params.get("tools", [])]
+
+
+async def run_cases(cases: List[Dict[str, Any]], tool_selector) -> List[List[Dict[str, Any]]]:
+    """Runs every case as its own turn and returns each turn's model calls"""
+    turns = []
+    for index, case in enumerate(cases):
+        responses = StubResponses(lambda params: text_events(ANSWER))
+        service = build_agent_service(responses, tools=AGENT_TOOLS, tool_selector=tool_selector)
+        history = [{"message_type": "USER", "message_content": "earlier message"}] * case["history_messages"]
+        response = await service.handle_message(
+            message=case["message"],
+            history=history,
+            user_id="u",
+            session_id=f"s{index}",
+            context=case["context"] or None,
+        )
+        await consume(response.body_iterator)
+        turns.append(responses.calls)
+    return turns
+
+
+async def run_chain(tool_selector):
+    """A turn whose first hop calls a tool and whose second answers, printing each hop's tools"""
+
+    def script(params):
+        if any("Based on this context" in str(item.get("content", "")) for item in params["input"]):
+            return text_events(ANSWER)
+        arguments = {"principal": 5000, "annual_rate": 0.04, "time_years": 10}
+        return function_call_events([{"name": "calculate_compound_interest", "arguments": arguments}])
+
+    responses = StubResponses(script)
+    service = build_agent_service(responses, tools=AGENT_TOOLS, tool_selector=tool_selector)
+    response = await service.handle_message(
+        message="How much will $5000 grow at 4% over 10 years?", history=[], user_id="u", session_id="chain"
+    )
+    await consume(response.body_iterator)
+    for hop, params in enumerate(responses.calls, start=1):
+        print(f"  hop {hop}: {tool_tokens(params):>5} tool tokens  {', '.join(tool_names(params)) or '(none)'}")
+
+
+async def main():
+    cases = json.loads(CASES.read_text())
+    selector = ToolSelector(AGENT_TOOLS)
+
+    baseline = await run_cases(cases, None)
+    selected = await run_cases(cases, selector)
+    sent = sum(tool_tokens(params) for calls in baseline for params in calls)
+    sent_selected = sum(tool_tokens(params) for calls in selected for params in calls)
+    print(f"{len(cases)} turns, {len(AGENT_TOOLS)} tools, {selector.full_tokens} tokens of tool definitions")
+    print(f"{'':>14} {'tool tokens/turn':>17}")
+    print(f"{'all tools':>14} {sent / len(cases):>17.0f}")
+    print(
+        f"{'selected':>14} {sent_selected / len(cases):>17.0f}  "
+        f"saved {(sent - sent_selected) / len(cases):.0f} per turn ({1 - sent_selected / sent:.0%})"
+    )
+
+    web = sum(1 for calls in selected if "web_search_preview" in tool_names(calls[0]))
+    print(f"\nweb search sent on {web} of {len(cases)} turns")
+    print("tool sets picked:")
+    picked = Counter(", ".join(tool_names(calls[0])) or "(none)" for calls in selected)
+    for tools, count in picked.most_common():
+        print(f"  {count:>3}  {tools}")
+
+    histories = [[{"role": "user", "content": "earlier message"}] * case["history_messages"] for case in cases]
+    started = time.perf_counter()
+    for _ in range(50):
+        for case, history in zip(cases, histories):
+            selector.for_hop(selector.select(case["message"], history, case["context"]), ())
+    per_turn = (time.perf_counter() - started) / (50 * len(cases))
+    print(f"\nselection takes {per_turn * 1e6:.1f}us per turn")
+
+    print("\ntool chain, all tools:")
+    await run_chain(None)
+    print("tool chain, selected:")
+    await run_chain(selector)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
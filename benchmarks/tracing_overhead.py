@@ -0,0 +1,59 @@
+"""
+CPU cost of streaming one long answer with tracing off, sampled spans, and per-chunk events.
+
+The answer is streamed as ANSWER_DELTAS text deltas with no delays, so the time measured is
+the service's own per-chunk work. Trace records go to an in-memory handler.
+
+    python -m benchmarks.tracing_overhead
+"""
+
+import asyncio
+import io
+import json
+import logging
+import time
+
+from app.utils import TRACE_LOGGER, TRACER
+from benchmarks.stubs import StubResponses, build_agent_service, consume, text_events
+
+ANSWER_DELTAS = 4000
+TURNS = 10
+ANSWER = json.dumps({"message": "word " * ANSWER_DELTAS})
+
+
+async def run(level: int, sample_rate: float):
+    """Streams TURNS answers, returning (CPU ms per turn, trace bytes logged per turn)"""
+    output = io.StringIO()
+    handler = logging.StreamHandler(output)
+    TRACE_LOGGER.addHandler(handler)
+    TRACE_LOGGER.propagate = False
+    TRACER.configure(level=level, sample_rate=sample_rate)
+
+    service = build_agent_service(StubResponses(lambda params: text_events(ANSWER, chunk_size=5)))
+    start = time.process_time()
+    for _ in range(TURNS):
+        response = await service.handle_message(
+            message="Explain", history=[], user_id="u", session_id="s", stream_format="events"
+        )
+        await consume(response.body_iterator)
+    elapsed = time.process_time() - start
+
+    TRACE_LOGGER.removeHandler(handler)
+    return elapsed / TURNS * 1000, len(output.getvalue()) // TURNS
+
+
+async def main():
+    await run(logging.WARNING, 0.0)  # warm up
+    print(f"{'tracing':>22} {'cpu ms/turn':>12} {'trace bytes/turn':>17}")
+    for name, level, sample_rate in (
+        ("off", logging.WARNING, 0.0),
+        ("spans, 5% sampled", logging.INFO, 0.05),
+        ("spans, all", logging.INFO, 1.0),
+        ("chunks, all", logging.DEBUG, 1.0),
+    ):
+        cpu_ms, trace_bytes = await run(level, sample_rate)
+        print(f"{name:>22} {cpu_ms:>12.1f} {trace_bytes:>17}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""
+Turn length for a model that keeps asking for tools, with and without turn limits.
+
+The scripted model calls two account lookups on every hop and only answers once tools are
+disabled, or after RUNAWAY_HOPS hops, which stands in for an unbounded turn.
+
+A second run stalls the model's stream, first before its first event and then mid-answer, to
+show model hops being cut off at the deadline as well.
+
+    python -m benchmarks.turn_limits
+"""
+
+import asyncio
+import json
+import time
+
+from app.modules import TurnLimits
+from benchmarks.stubs import StubResponses, StubStream, build_agent_service, consume, function_call_events, text_events
+
+MODEL_LATENCY = 0.05
+TOOL_LATENCY = 0.05
+RUNAWAY_HOPS = 20
+STALL = 10.0
+FINAL_ANSWER = json.dumps({"message": "Here's what I found so far."})
+
+
+class SlowFinancialConnections:
+    """Simulates upstream lookups with a fixed latency"""
+
+    async def get_acct_details(self, acct_ids, user_id=""):
+        """Returns fake accounts after TOOL_LATENCY"""
+        await asyncio.sleep(TOOL_LATENCY)
+        return [{"id": acct_id, "balance": 100} for acct_id in acct_ids]
+
+
+async def run(limits: TurnLimits):
+    """Runs one turn, returning (seconds, model calls, whether the last hop was forced to answer)"""
+    def script(params):
+        if params["tool_choice"] == "none" or len(responses.calls) >= RUNAWAY_HOPS:
+            return text_events(FINAL_ANSWER)
+        return function_call_events(
+            [{"name": "get_acct_details", "arguments": {"acct_ids": [f"acct_{i}"]}} for i in range(2)]
+        )
+
+    responses = StubResponses(script, first_event_delay=MODEL_LATENCY)
+    service = build_agent_service(
+        responses,
+        financial_connections_service=SlowFinancialConnections(),
+        chain_responses=True,
+        turn_limits=limits,
+    )
+    start = time.perf_counter()
+    response = await service.handle_message(message="Check everything", history=[], user_id="u", session_id="s")
+    frames = await consume(response.body_iterator)
+    assert frames[-1] == "data: [DONE]\n\n"
+    return time.perf_counter() - start, len(responses.calls), responses.calls[-1]["tool_choice"] == "none"
+
+
+class MidAnswerStall(StubStream):
+    """Streams the first few deltas of FINAL_ANSWER, then stalls for STALL seconds before the rest"""
+
+    def __init__(self):
+        super().__init__(text_events(FINAL_ANSWER), 0.0, 0.0)
+        self.__events = text_events(FINAL_ANSWER)
+
+    def __aiter__(self):
+        return self.__stall()
+
+    async def __stall(self):
+        for index, event in enumerate(self.__events):
+            if index == 6:
+                await asyncio.sleep(STALL)
+            yield event
+
+
+class StallingResponses(StubResponses):
+    """Stalls the first `stalled` streams for STALL seconds, before their first event or after their first delta"""
+
+    def __init__(self, stalled: int, mid_answer: bool):
+        super().__init__(lambda params: text_events(FINAL_ANSWER))
+        self.__stalled = stalled
+        self.__mid_answer = mid_answer
+
+    async def create(self, **params):
+        self.calls.append(params)
+        stalls = len(self.calls) <= self.__stalled
+        if stalls and self.__mid_answer:
+            stream = MidAnswerStall()
+        else:
+            stream = StubStream(text_events(FINAL_ANSWER), STALL if stalls else MODEL_LATENCY, 0.0)
+        self.streams.append(stream)
+        return stream
+
+
+async def run_stalled(limits: TurnLimits, stalled: int, mid_answer: bool):
+    """Runs one turn against a stalling model, returning (seconds, model calls, answer frames)"""
+    responses = StallingResponses(stalled, mid_answer)
+    service = build_agent_service(responses, turn_limits=limits)
+    start = time.perf_counter()
+    response = await service.handle_message(
+        message="Check everything", history=[], user_id="u", session_id="s", stream_format="events"
+    )
+    frames = await consume(response.body_iterator)
+    return time.perf_counter() - start, len(responses.calls), sum("message.delta" in frame for frame in frames)
+
+
+async def main():
+    print(f"{'limits':>28} {'seconds':>8} {'model calls':>12} {'forced answer':>14}")
+    for name, limits in (
+        ("none", TurnLimits(deadline=600, max_hops=100, max_tool_calls=1000, token_budget=10**9)),
+        ("max_hops=4", TurnLimits(max_hops=4)),
+        ("max_tool_calls=5", TurnLimits(max_tool_calls=5)),
+        ("deadline=0.5s", TurnLimits(deadline=0.5)),
+        ("token_budget=150", TurnLimits(token_budget=150)),
+    ):
+        seconds, calls, forced = await run(limits)
+        print(f"{name:>28} {seconds:>8.2f} {calls:>12} {str(forced):>14}")
+
+    print(f"\nstalled model ({STALL:.0f}s), deadline=0.5s, final_answer_timeout=0.5s")
+    print(f"{'stall':>30} {'seconds':>8} {'model calls':>12} {'text frames':>14}")
+    limits = TurnLimits(deadline=0.5, final_answer_timeout=0.5)
+    for name, stalled, mid_answer in (
+        ("first hop, before first event", 1, False),
+        ("every hop, before first event", 2, False),
+        ("mid-answer", 1, True),
+    ):
+        seconds, calls, text_frames = await run_stalled(limits, stalled, mid_answer)
+        print(f"{name:>30} {seconds:>8.2f} {calls:>12} {text_frames:>14}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())